@@ -3,53 +3,59 @@ import logging
 import math
 import struct
 from array import array
-from functools import wraps, lru_cache
+from functools import lru_cache
 from pathlib import Path
-from bitarray import bitarray
 
 import numpy as np
 
 from eft_cap import bprint, ParsingError
 
 
-
-def packed(fmt, single=True):
-    def _wrapped(func):
-        @wraps(func)
-        def _inner(*args, **kwargs):
-            bin_resp = func(*args, **kwargs)
-            unpacked = struct.unpack(fmt, bin_resp)
-            return unpacked[0] if single else unpacked
-        return _inner
-    return _wrapped
+U16 = struct.Struct('<H')
+U32 = struct.Struct('<I')
+U64 = struct.Struct('<Q')
+F32 = struct.Struct('<f')
+DOUBLE = struct.Struct('<d')
+VECTOR = struct.Struct('<fff')
 
 
 class ByteStream:
+    """
+    Reads LE primitives from `memoryview` over stream without slicing it.
+
+    Named positions are used only for debug dumps, so they're tracked only when DEBUG is set.
+    """
     log = logging.getLogger("ByteStream")
     DEBUG = False
 
     def __init__(self, stream):
         self.byte_offset = 0
         self.orig_stream = stream
+        self.view = memoryview(stream)
+        self.length = len(self.view)
         self.named_positions = {}
         self.named_set = set()
         self.positions = []
         self.next_bytes = []
         self.auto = 0
 
-    def read_bytes(self, num):
-        out = self.orig_stream[self.byte_offset : self.byte_offset + num]
-
-        if len(out) != num:
-            # self.log.error(
-            #     f"OS: {self.orig_stream[:10]} OFST: {self.byte_offset} NUM: {num} L: {len(self.orig_stream)}"
-            # )
-            raise ParsingError(f'OS: {out[:20]} OFST: {self.byte_offset} NUM: {num} L: {len(self.orig_stream)}')
-        self.byte_offset += num
+    def advance(self, num):
+        """move cursor by `num` bytes and return old position"""
+        offset = self.byte_offset
+        if offset + num > self.length:
+            out = self.orig_stream[offset:offset + 20]
+            raise ParsingError(f'OS: {out} OFST: {offset} NUM: {num} L: {self.length}')
+        self.byte_offset = offset + num
         if self.DEBUG:
             self.next_bytes = self.orig_stream[self.byte_offset:]
-        assert len(out) == num
-        return out
+        return offset
+
+    def unpack(self, fmt: struct.Struct):
+        return fmt.unpack_from(self.view, self.advance(fmt.size))[0]
+
+    def read_bytes(self, num):
+        offset = self.advance(num)
+        return bytes(self.view[offset : offset + num])
 
     def debug_rest(self, num, back=0):
         out = []
@@ -69,53 +75,42 @@ class ByteStream:
             write_func(self.orig_stream[self.byte_offset:])
         elif isinstance(position, int):
             if size is None:
-                write_func(self.orig_stream[self.bytes_offset:])
+                write_func(self.orig_stream[position:])
             else:
-                write_func(self.orig_stream[self.bytes_offset:self.byte_offset + size])
+                write_func(self.orig_stream[position:position + size])
         elif isinstance(position, str):
             write_func(self.orig_stream[self.named_positions[position]:])
         else:
             raise NotImplementedError
 
     def read_u8(self):
-        return self.read_bytes(1)[0]
+        return self.view[self.advance(1)]
 
-    @packed("<H")
     def read_u16(self):
-        return self.read_bytes(2)
+        return self.unpack(U16)
 
-    @packed("<I")
     def read_u32(self):
-        return self.read_bytes(4)
+        return self.unpack(U32)
 
-    @packed("<Q")
     def read_u64(self):
-        return self.read_bytes(8)
+        return self.unpack(U64)
 
-    @packed("<f")
     def read_f32(self):
-        return self.read_bytes(4)
+        return self.unpack(F32)
 
-    @packed('<d')
     def read_double(self):
-        return self.read_bytes(8)
+        return self.unpack(DOUBLE)
 
     def read_bool(self):
         return self.read_u8() > 0
 
     def read_vector(self):
-        return np.array([
-            self.read_f32(),
-            self.read_f32(),
-            self.read_f32(),
-        ], np.float)
+        return np.array(VECTOR.unpack_from(self.view, self.advance(VECTOR.size)), np.float)
 
     def read_string(self):
         size = self.read_7bit_int()
-        out = []
-        for i in range(size):
-            out.append(chr(self.read_u8()))
-        return ''.join(out)
+        offset = self.advance(size)
+        return str(self.view[offset : offset + size], 'latin-1')
 
     def read_7bit_int(self):
         num = 0
@@ -129,6 +124,8 @@ class ByteStream:
         return 0
 
     def store_pos(self, name=None, auto=False):
+        if not self.DEBUG:
+            return
         if auto:
             assert name is not None
             self.auto += 1
@@ -144,6 +141,8 @@ class ByteStream:
                 return name
 
     def store_name(self, name, back=-1):
+        if not self.DEBUG:
+            return
         pos = self.positions[back]
         assert pos not in self.named_set, f'POS is already saved as: {self.pos_to_name(pos)}'
         self.named_set.add(pos)
@@ -178,6 +177,7 @@ def bin_dump(b_str):
         f.write(bytes(bitstring))
 
 
+@lru_cache(maxsize=None)
 def bits_required(min_value, max_value):
     assert max_value > min_value
     return math.floor(math.log2(max_value - min_value)) + 1
@@ -203,7 +203,7 @@ def bits_to_bytes(bits):
 
 def stream_from_le(stream, step=4):
     l = len(stream)
-    loops = l // step + 0 if l % step == 0 else 1
+    loops = l // step + (0 if l % step == 0 else 1)
     for i in range(loops):
         part = stream[i * step : i * step + step]
         part_len = len(part)
@@ -214,30 +214,45 @@ def stream_from_le(stream, step=4):
         yield from [b for b in struct.pack(">I", struct.unpack("<I", part)[0])[:part_len]]
 
 
+def swap_words(stream):
+    """
+    same as `bytes(stream_from_le(stream))` but swaps whole 32bit words at once
+    """
+    tail_len = len(stream) % 4
+    full = len(stream) - tail_len
+    words = array('I', bytes(stream[:full]))
+    if words.itemsize != 4:
+        return bytes(stream_from_le(stream))
+    words.byteswap()
+    return words.tobytes() + bytes(stream[full:])[::-1]
+
+
 class BitStream:
+    """
+    Reads bits from unity's LE words stream.
+
+    Words are swapped once in constructor and all reads are served from
+    `self.stream` (big endian bytes) by integer `bit_offset`.
+    """
     log = logging.getLogger("BitStream")
     DEBUG = False
 
     def __init__(self, stream, reverse=True):
         self.bit_offset = 0
         self.orig_stream = stream
-        be_stream = stream_from_le(stream)
         if reverse:
-            self.stream_be = itertools.chain.from_iterable([to_bits(one_byte) for one_byte in be_stream])
+            self.stream = swap_words(stream)
         else:
-            self.stream_be = [to_bits(one_byte) for one_byte in stream]
-        # self.stream = array("B", bitstring)
+            self.stream = bytes(stream)
         self.length_limit = len(stream) * 8
-        self.stream = bitarray(self.stream_be, endian='big')
         self.next_bytes = None
-        # print(f'Stream: {stream}')
-        # b = bitarray(endian='little')
-        # self.stream = b.frombytes(bytes(stream))
+
+    def update_next_bytes(self):
+        self.next_bytes = self.stream[self.bit_offset // 8:]
 
     @property
     def rest(self):
-        # assert len(self.stream[self.bit_offset:]) % 8 == 0, f'Off: {self.bit_offset}'
-        while self.bit_offset <= len(self.stream) - 8:
+        while self.bit_offset <= self.length_limit - 8:
             yield self.read_bits(8)
 
     def print_rest(self):
@@ -245,7 +260,7 @@ class BitStream:
         bprint(self.rest)
         self.bit_offset = bit
         if self.DEBUG:
-            self.next_bytes = self.stream[self.bit_offset:]
+            self.update_next_bytes()
 
     def align(self):
         off = self.bit_offset % 8
@@ -254,65 +269,25 @@ class BitStream:
             self.read_bits(8 - off)
         assert self.bit_offset % 8 == 0
 
-    DECODE = {
-        1: '>B',
-        2: '>H',
-        4: '>I',
-        8: '>Q',
-    }
-
-    @lru_cache(maxsize=None)
-    def calc_shift(self, bits):
-        shift = 0
-        if bits % 8:
-            shift = 8 - bits % 8
-        return shift
-
     def read_bits(self, bits=1):
-        if self.bit_offset + bits > self.length_limit:
-
-            raise ParsingError(f'Overflow: need {bits} have: {self.length_limit - self.bit_offset} L: {self.length_limit}')
+        offset = self.bit_offset
+        end = offset + bits
+        if end > self.length_limit:
+            raise ParsingError(f'Overflow: need {bits} have: {self.length_limit - offset} L: {self.length_limit}')
         if bits == 1:
-            bit = self.stream[self.bit_offset]
-            self.bit_offset += bits
+            self.bit_offset = end
             if self.DEBUG:
-                self.next_bytes = self.stream[self.bit_offset:]
-            return bit
-        bs = self.stream[self.bit_offset : self.bit_offset + bits]
-        # bs = "".join([str(i) for i in bs])
-        if not bs:
+                self.update_next_bytes()
+            return (self.stream[offset >> 3] >> (7 - (offset & 7))) & 1
+        if bits <= 0:
             return 0
-        self.bit_offset += bits
+        self.bit_offset = end
         if self.DEBUG:
-            self.next_bytes = self.stream[self.bit_offset:]
-
-        out = 0
-        bs = bs.tobytes()
+            self.update_next_bytes()
 
-        while True:
-            len_bs = len(bs)
-            # print(f'OUT: {out} => {len_bs} / {bs}')
-            if len_bs == 0:
-                break
-            elif len_bs >= 8:
-                out += struct.unpack('>Q', bs[:8])[0] << (8 * (len_bs - 8))
-                bs = bs[8:]
-            elif len_bs >= 4:
-                out += struct.unpack('>I', bs[:4])[0] << (8 * (len_bs - 4))
-                bs = bs[4:]
-            elif len_bs >= 2:
-                out += struct.unpack('>H', bs[:2])[0] << (8 * (len_bs - 2))
-                bs = bs[2:]
-            elif len_bs == 1:
-                out += struct.unpack('>B', bs[:2])[0]
-                break
-            else:
-                raise NotImplementedError
-        shift = self.calc_shift(bits)
-        if bits % 8:
-            shift = 8 - bits % 8
-        # print(f'SHIFT: {shift}')
-        return out >> shift
+        stop = (end + 7) >> 3
+        chunk = int.from_bytes(self.stream[offset >> 3 : stop], 'big')
+        return (chunk >> ((stop << 3) - end)) & ((1 << bits) - 1)
 
     def read_limited_bits(self, min_value=0, max_value=1):
         required = bits_required(min_value, max_value)
@@ -323,8 +298,7 @@ class BitStream:
         return ret
 
     def read_limited_float(self, min_value=0.0, max_value=1.0, resolution=0.1):
-        q = FloatQuantizer(min_value, max_value, resolution)
-        return q.read(self)
+        return get_quantizer(min_value, max_value, resolution).read(self)
 
     def read_bytes_aligned(self, num_bytes):
         self.align()
@@ -344,13 +318,19 @@ class BitStream:
 
         self.bit_offset += num_bytes * 8
         if self.DEBUG:
-            self.next_bytes = self.stream[self.bit_offset:]
+            self.update_next_bytes()
 
         return bytes(out) + self.orig_stream[curr_byte:curr_byte + num_bytes]
 
     def read_bytes(self, num_bytes):
         self.align()
-        return bytes([self.read_bits(8) for i in range(num_bytes)])
+        start = self.bit_offset >> 3
+        if start + num_bytes > len(self.stream):
+            raise ParsingError(f'Overflow: need {num_bytes} bytes have: {len(self.stream) - start}')
+        self.bit_offset += num_bytes * 8
+        if self.DEBUG:
+            self.update_next_bytes()
+        return self.stream[start : start + num_bytes]
 
     def read_u8(self):
         return self.read_bits(8)
@@ -379,14 +359,9 @@ class BitStream:
         is_null = self.read_bits(1)
         if is_null:
             return None
-        out = []
         self.align()
         num = self.read_u32()
-        for i in range(num):
-            char = self.read_bytes(2)
-            # print(f'Append: {char} LEN: {num}')
-            out.extend(char)
-        return bytes(out).decode("utf-16-be")
+        return self.read_bytes(num * 2).decode("utf-16-be")
 
     def read_limited_string(self, char_min, char_max):
         if self.read_bits():
@@ -417,9 +392,18 @@ class FloatQuantizer:
         self.delta = self.max_value - self.min_value
         self.max_int = math.ceil((self.max_value - self.min_value) / self.resolution)
         self.bits_require = bits_required(0, self.max_int)
+        self.scale = self.delta / float(self.max_int)
 
     def dequantize_float(self, int_value):
-        return int_value / float(self.max_int) * self.delta + self.min_value
+        return int_value * self.scale + self.min_value
 
     def read(self, stream):
         return self.dequantize_float(stream.read_bits(self.bits_require))
+
+
+@lru_cache(maxsize=None)
+def get_quantizer(min_value, max_value, resolution):
+    """
+    shared quantizer for constant bounds, so we don't recalc bits on every read
+    """
+    return FloatQuantizer(min_value, max_value, resolution)
@@ -0,0 +1,114 @@
+"""
+Broadcast of websocket frames.
+
+Every frame is encoded once and put into bounded per-client queues, each client is
+drained by its own task, so slow client doesn't stall others or the update loop.
+Client which falls behind drops pending frames and gets the latest full frame instead.
+"""
+import asyncio
+import json
+import logging
+from collections import deque
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+MAX_PENDING = 8
+
+
+def dumps(msg):
+    if orjson is not None:
+        return orjson.dumps(msg, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY).decode()
+    return json.dumps(msg)
+
+
+class ClientQueue:
+    def __init__(self, ws, max_pending=MAX_PENDING):
+        self.ws = ws
+        self.max_pending = max_pending
+        self.pending = deque()
+        self.wakeup = asyncio.Event()
+        self.sent = 0
+        self.dropped = 0
+        self.task = None
+
+    def put(self, frame, latest=None):
+        """`latest()` returns frame which replaces all pending frames when client falls behind"""
+        if len(self.pending) >= self.max_pending:
+            self.dropped += len(self.pending)
+            self.pending.clear()
+            if latest is not None:
+                frame = latest()
+        self.pending.append(frame)
+        self.wakeup.set()
+
+    async def run(self):
+        while True:
+            await self.wakeup.wait()
+            self.wakeup.clear()
+            while self.pending:
+                await self.ws.send_text(self.pending.popleft())
+                self.sent += 1
+
+    def as_dict(self):
+        return {'pending': len(self.pending), 'sent': self.sent, 'dropped': self.dropped}
+
+
+class BroadcastHub:
+    log = logging.getLogger('BroadcastHub')
+
+    def __init__(self, max_pending=MAX_PENDING):
+        self.max_pending = max_pending
+        self.clients = {}
+
+    def __len__(self):
+        return len(self.clients)
+
+    def add(self, ws):
+        client = ClientQueue(ws, self.max_pending)
+        client.task = asyncio.get_event_loop().create_task(self.drain(client))
+        self.clients[ws] = client
+        return client
+
+    async def drain(self, client):
+        try:
+            await client.run()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self.log.warning(f'Client send failed, dropping: {client.ws.client}')
+            self.clients.pop(client.ws, None)
+
+    def remove(self, ws):
+        client = self.clients.pop(ws, None)
+        if client:
+            client.task.cancel()
+
+    def send(self, ws, msg):
+        """frame for one client, in order with broadcasted frames"""
+        client = self.clients.get(ws)
+        if client:
+            client.put(dumps(msg))
+
+    def publish(self, msg, latest=None):
+        """
+        encode `msg` once and queue it for every client,
+        `latest()` returns message for clients which fell behind
+        """
+        if not self.clients:
+            return
+        frame = dumps(msg)
+        cache = []
+
+        def latest_frame():
+            if not cache:
+                cache.append(dumps(latest()))
+            return cache[0]
+
+        for client in self.clients.values():
+            client.put(frame, latest_frame if latest else None)
+
+    def as_dict(self):
+        return [client.as_dict() for client in self.clients.values()]
@@ -0,0 +1,68 @@
+"""
+Change notifications from decoder to UIs.
+
+Decoder marks topics which have changed, every UI waits on its own subscription
+and gets set of dirty topics no more than `rate` times per second and only when
+something has changed (or once in `idle` seconds, to refresh time based fields).
+"""
+import asyncio
+import time
+
+ME = 'me'
+PLAYERS = 'players'
+LOOT = 'loot'
+EXITS = 'exits'
+ALL = frozenset((ME, PLAYERS, LOOT, EXITS))
+
+DEFAULT_RATE = 10  # pushes per second
+DEFAULT_IDLE = 1.0  # seconds
+
+
+class Subscription:
+    def __init__(self, rate=DEFAULT_RATE, idle=DEFAULT_IDLE):
+        self.interval = 1 / rate
+        self.idle = idle
+        self.dirty = set()
+        self.event = asyncio.Event()
+        self.last_push = 0.0
+
+    def mark(self, topic):
+        self.dirty.add(topic)
+        self.event.set()
+
+    async def wait(self):
+        """set of dirty topics, empty set when nothing has changed for `idle` seconds"""
+        delay = self.last_push + self.interval - time.monotonic()
+        if delay > 0:
+            # changes made meanwhile are pushed together
+            await asyncio.sleep(delay)
+        if not self.dirty:
+            try:
+                await asyncio.wait_for(self.event.wait(), self.idle)
+            except asyncio.TimeoutError:
+                pass
+        self.event.clear()
+        dirty, self.dirty = self.dirty, set()
+        self.last_push = time.monotonic()
+        return dirty
+
+
+class Changes:
+    def __init__(self):
+        self.subscriptions = []
+
+    def subscribe(self, rate=DEFAULT_RATE, idle=DEFAULT_IDLE):
+        sub = Subscription(rate, idle)
+        self.subscriptions.append(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        self.subscriptions.remove(sub)
+
+    def mark(self, topic):
+        for sub in self.subscriptions:
+            sub.mark(topic)
+
+    def mark_all(self):
+        for topic in ALL:
+            self.mark(topic)
@@ -0,0 +1,179 @@
+"""
+Ethernet / IPv4 / UDP header parsing straight from raw frames.
+
+Much cheaper than scapy dissection. Frames we cannot handle here (truncated headers,
+IP fragments without reassembler) raise `OddFrame`, so caller can fallback to scapy.
+"""
+import struct
+import time
+from collections import OrderedDict
+
+ETHER = struct.Struct('!6s6sH')  # dst, src, ethertype
+VLAN = struct.Struct('!HH')  # tci, ethertype
+IPV4 = struct.Struct('!BBHHHBBH4s4s')
+UDP = struct.Struct('!HHHH')  # sport, dport, len, checksum
+
+ETH_IPV4 = 0x0800
+ETH_VLAN = (0x8100, 0x88A8, 0x9100)
+PROTO_UDP = 17
+IP_MF = 0x2000
+IP_OFFSET_MASK = 0x1FFF
+LOCAL_NET = b'\xc0\xa8'  # 192.168.
+
+
+class OddFrame(Exception):
+    pass
+
+
+def ip_offset(data, offset=0):
+    """
+    offset of IP header after ethernet header and vlan tags,
+    None when frame doesn't carry IPv4
+    """
+    if len(data) < offset + ETHER.size:
+        raise OddFrame('Short ethernet header')
+    ethertype = ETHER.unpack_from(data, offset)[2]
+    offset += ETHER.size
+    while ethertype in ETH_VLAN:
+        if len(data) < offset + VLAN.size:
+            raise OddFrame('Short vlan tag')
+        ethertype = VLAN.unpack_from(data, offset)[1]
+        offset += VLAN.size
+    if ethertype != ETH_IPV4:
+        return None
+    return offset
+
+
+def parse_ipv4(data, offset):
+    """
+    returns dict with IPv4 header fields and `payload_offset`/`end` of IP payload
+    """
+    if len(data) < offset + IPV4.size:
+        raise OddFrame('Short IP header')
+    (ver_ihl, _tos, total_len, ident, flags_frag, _ttl, proto, _csum, src, dst) = IPV4.unpack_from(
+        data, offset
+    )
+    if ver_ihl >> 4 != 4:
+        return None
+    header_len = (ver_ihl & 0x0F) * 4
+    if header_len < IPV4.size or len(data) < offset + header_len:
+        raise OddFrame(f'Wrong IHL: {header_len}')
+    return {
+        'id': ident,
+        'proto': proto,
+        'src': src,
+        'dst': dst,
+        'more_fragments': bool(flags_frag & IP_MF),
+        'frag_offset': (flags_frag & IP_OFFSET_MASK) * 8,
+        'payload_offset': offset + header_len,
+        # ethernet may be padded, trust IP total length
+        'end': min(offset + total_len, len(data)),
+    }
+
+
+def is_fragment(ip):
+    return ip['more_fragments'] or ip['frag_offset'] > 0
+
+
+def parse_udp(data, offset, end):
+    """returns (sport, dport, payload) of UDP datagram in data[offset:end]"""
+    if end < offset + UDP.size:
+        raise OddFrame('Short UDP header')
+    sport, dport, length, _csum = UDP.unpack_from(data, offset)
+    if length < UDP.size:
+        raise OddFrame(f'Wrong UDP length: {length}')
+    return sport, dport, data[offset + UDP.size : min(offset + length, end)]
+
+
+def udp_packet(ip, sport, dport, payload):
+    return {
+        'incoming': ip['dst'][:2] == LOCAL_NET,
+        'data': payload,
+        'src_port': sport,
+        'dst_port': dport,
+    }
+
+
+class IpReassembler:
+    """
+    Collects IP fragments by (src, dst, id).
+    Incomplete datagrams are dropped after `timeout` seconds or when buffers are over limits.
+    """
+
+    def __init__(self, timeout=5.0, max_bytes=4 * 1024 * 1024, max_datagrams=256):
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.max_datagrams = max_datagrams
+        self.pending = OrderedDict()
+        self.buffered = 0
+        self.dropped = 0
+        self.assembled = 0
+
+    def drop(self, key):
+        entry = self.pending.pop(key)
+        self.buffered -= entry['size']
+        self.dropped += 1
+
+    def expire(self, now):
+        while self.pending:
+            key, entry = next(iter(self.pending.items()))
+            if now - entry['created'] < self.timeout:
+                break
+            self.drop(key)
+
+    def add(self, ip, payload, now=None):
+        """returns whole IP payload when all fragments are here"""
+        if now is None:
+            now = time.monotonic()
+        self.expire(now)
+
+        key = (ip['src'], ip['dst'], ip['id'])
+        entry = self.pending.get(key)
+        if entry is None:
+            entry = self.pending[key] = {'parts': {}, 'total': None, 'size': 0, 'created': now}
+        offset = ip['frag_offset']
+        if offset not in entry['parts']:
+            entry['parts'][offset] = payload
+            entry['size'] += len(payload)
+            self.buffered += len(payload)
+        if not ip['more_fragments']:
+            entry['total'] = offset + len(payload)
+
+        if entry['total'] is not None and entry['size'] >= entry['total']:
+            self.pending.pop(key)
+            self.buffered -= entry['size']
+            out = bytearray(entry['total'])
+            for part_offset, part in entry['parts'].items():
+                out[part_offset : part_offset + len(part)] = part
+            self.assembled += 1
+            return bytes(out[: entry['total']])
+
+        while self.pending and (
+            self.buffered > self.max_bytes or len(self.pending) > self.max_datagrams
+        ):
+            self.drop(next(iter(self.pending)))
+
+
+def frame_to_dict(data, reassembler=None):
+    """
+    `{'incoming', 'data', 'src_port', 'dst_port'}` for UDP over IPv4 frame,
+    None for frames we don't care about and fragments of incomplete datagrams
+    """
+    offset = ip_offset(data)
+    if offset is None:
+        return
+    ip = parse_ipv4(data, offset)
+    if ip is None or ip['proto'] != PROTO_UDP:
+        return
+    if is_fragment(ip):
+        if reassembler is None:
+            raise OddFrame('IP fragment')
+        ip_payload = reassembler.add(ip, data[ip['payload_offset'] : ip['end']])
+        if ip_payload is None:
+            return
+        sport, dport, payload = parse_udp(ip_payload, 0, len(ip_payload))
+    else:
+        sport, dport, payload = parse_udp(data, ip['payload_offset'], ip['end'])
+    if not payload:
+        return
+    return udp_packet(ip, sport, dport, payload)
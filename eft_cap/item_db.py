@@ -0,0 +1,154 @@
+"""
+Compiled item template database.
+
+Item DB of LeakedServer is a json file per template, compiled file keeps only what loot needs:
+DB_MAGIC, DB_HEADER with stamp of source dir, table of RECORD sorted by template id
+and utf-8 names referenced by records. It's memory-mapped and preloaded into dict at startup.
+"""
+import argparse
+import json
+import logging
+import mmap
+import os
+import pathlib
+import struct
+
+log = logging.getLogger('item_db')
+
+SRC_PATH = pathlib.Path('LeakedServer/db/items')
+DB_PATH = pathlib.Path('items.db')
+
+DB_MAGIC = b'EFTITM\x02\x00'
+# source files, max source mtime_ns, records
+DB_HEADER = struct.Struct('<QQQ')
+ID_LEN = 24
+# template id, price, name offset, name length
+RECORD = struct.Struct(f'<{ID_LEN}sqII')
+NO_PRICE = -1
+
+
+def source_stamp(src):
+    """(files, max mtime_ns) of json files in `src`, changes when DB was updated"""
+    files, mtime = 0, 0
+    with os.scandir(src) as it:
+        for entry in it:
+            if entry.name.endswith('.json'):
+                files += 1
+                mtime = max(mtime, entry.stat().st_mtime_ns)
+    return files, mtime
+
+
+def read_template(path):
+    """(name, price) of template json, price is None when it has no CreditsPrice"""
+    j_data = json.loads(path.read_text(encoding='utf8'))
+    template_id = path.stem
+    return (
+        j_data.get('_name', f'Unknown: {template_id}'),
+        j_data.get('_props', {}).get('CreditsPrice', None),
+    )
+
+
+def build(src=SRC_PATH, dst=DB_PATH):
+    stamp = source_stamp(src)
+    items = []
+    for path in sorted(pathlib.Path(src).glob('*.json')):
+        if len(path.stem) != ID_LEN:
+            continue
+        try:
+            items.append((path.stem, *read_template(path)))
+        except (ValueError, AttributeError):
+            log.warning(f'Skip broken template: {path}')
+
+    names = bytearray()
+    table = bytearray()
+    for template_id, name, price in items:
+        encoded = name.encode()
+        table += RECORD.pack(
+            template_id.encode(), NO_PRICE if price is None else round(price), len(names), len(encoded)
+        )
+        names += encoded
+
+    tmp = pathlib.Path(f'{dst}.tmp')
+    with open(tmp, 'wb') as f:
+        f.write(DB_MAGIC)
+        f.write(DB_HEADER.pack(*stamp, len(items)))
+        f.write(table)
+        f.write(names)
+    os.replace(tmp, dst)
+    log.warning(f'Item DB: {len(items)} templates from {src} => {dst}')
+    return len(items)
+
+
+def read_stamp(path):
+    """(files, mtime) source stamp of compiled DB, None when it's missing or broken"""
+    try:
+        with open(path, 'rb') as f:
+            if f.read(len(DB_MAGIC)) != DB_MAGIC:
+                return None
+            header = f.read(DB_HEADER.size)
+    except FileNotFoundError:
+        return None
+    if len(header) < DB_HEADER.size:
+        return None
+    return DB_HEADER.unpack(header)[:2]
+
+
+def refresh(src=SRC_PATH, dst=DB_PATH, force=False):
+    """rebuild compiled DB when source DB has changed, returns True when it was rebuilt"""
+    if not pathlib.Path(src).exists():
+        log.warning(f'No item DB: {src}')
+        return False
+    if not force and read_stamp(dst) == source_stamp(src):
+        return False
+    build(src, dst)
+    return True
+
+
+def load(path=DB_PATH):
+    """{template_id: {'name', 'price'}}, None when compiled DB is missing or broken"""
+    try:
+        f = open(path, 'rb')
+    except FileNotFoundError:
+        return None
+    with f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty file
+            return None
+    with mm:
+        if len(mm) < len(DB_MAGIC) + DB_HEADER.size or mm[: len(DB_MAGIC)] != DB_MAGIC:
+            return None
+        *_, num = DB_HEADER.unpack_from(mm, len(DB_MAGIC))
+        table = len(DB_MAGIC) + DB_HEADER.size
+        names = table + num * RECORD.size
+        items = {}
+        for template_id, price, offset, size in RECORD.iter_unpack(mm[table:names]):
+            info = {'name': mm[names + offset : names + offset + size].decode()}
+            if price != NO_PRICE:
+                info['price'] = price
+            items[template_id.decode()] = info
+        return items
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Compile item DB when it has changed')
+    parser.add_argument('--src', type=pathlib.Path, default=SRC_PATH)
+    parser.add_argument('--dst', type=pathlib.Path, default=DB_PATH)
+    parser.add_argument('--force', action='store_true')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if not args.src.exists():
+        print(f'No item DB: {args.src}')
+        return
+    if refresh(args.src, args.dst, force=args.force):
+        print(f'Rebuilt: {args.dst}')
+    else:
+        print(f'Up to date: {args.dst}')
+
+
+if __name__ == '__main__':
+    main()
@@ -4,7 +4,7 @@ import logging
 
 import numpy as np
 
-from eft_cap import ParsingError
+from eft_cap import ParsingError, item_db
 from eft_cap.bin_helpers import ByteStream
 from functools import lru_cache
 import json
@@ -12,6 +12,8 @@ import json
 log = logging.getLogger('loot')
 DB_ITEMS = pathlib.Path('LeakedServer/db/items')
 DB_EXISTS = DB_ITEMS.exists()
+# compiled DB, see `item_db`, templates are read from DB_ITEMS one by one without it
+DB_COMPILED = item_db.load()
 ID_LEN = len('5888988e24597752fe43a6fa')
 
 
@@ -24,6 +26,8 @@ def get_description(template_id):
     if len(template_id) != ID_LEN:
         raise LootParsingError(f'Wrong TemplateID: {template_id!r}')
 
+    if DB_COMPILED is not None:
+        return DB_COMPILED.get(template_id) or {'name': template_id}
     if not DB_EXISTS:
         return {'name': template_id}
     p_name = f'{template_id}.json'
@@ -4,15 +4,18 @@ import logging
 import asyncio
 import sys
 import json
-from multiprocessing import Process, Queue
-from queue import Empty
+from multiprocessing import Process
 import time
 
 sys.path.append('.')
 from eft_cap.tk_ui import App
 from eft_cap.network_base import NetworkTransport
-from eft_cap.msg_level import GLOBAL
-from eft_cap import webserver
+from eft_cap.msg_level import GLOBAL, decode_inventories
+from eft_cap.offload import Offload
+from eft_cap.packet_log import is_packet_log, read_packet_log
+from eft_cap.replay import Replay
+from eft_cap.shm_ring import PacketRing
+from eft_cap import changes, webserver
 
 
 logging.basicConfig(level=logging.WARNING, format='%(asctime)s [%(levelname)s] %(name)s: %(message)s')
@@ -28,6 +31,20 @@ def parse_args():
     parser.add_argument('--profile', action='store_true')
     parser.add_argument('--limit', type=int, default=None)
     parser.add_argument('--skip', type=int, default=None)
+    parser.add_argument('--from-session', action='store_true',
+                        help='with --skip start from beginning of game session (binary logs only)')
+    parser.add_argument('--log-compression', default='zlib', choices=['none', 'zlib', 'zstd'])
+    parser.add_argument('--batch-size', type=int, default=NetworkTransport.BATCH_MAX,
+                        help='max packets decoded before yielding to event loop')
+    parser.add_argument('--batch-budget', type=float, default=NetworkTransport.BATCH_BUDGET * 1000,
+                        help='max ms spent decoding before yielding to event loop')
+    inventories = parser.add_mutually_exclusive_group()
+    inventories.add_argument('--lazy-players', action='store_true',
+                             help='decode inventories of spawned players in background')
+    inventories.add_argument('--parse-workers', type=int, default=0,
+                             help='processes parsing map loot and inventories, 0 parses on event loop')
+    parser.add_argument('--ui-rate', type=float, default=changes.DEFAULT_RATE,
+                        help='max UI updates per second')
     # parser.add_argument('-m', '--mode', default='auto', choices=['auto', 'manual'])
     # parser.add_argument('-l', '--ll', dest='ll', action='store_true', help='help')
     return parser.parse_args()
@@ -45,12 +62,23 @@ d1 = '(udp.SrcPort >= 16900 and udp.SrcPort <= 17100)'
 async def capture_tzsp():
     from eft_cap.tzsp import run
     q = asyncio.Queue()
-    asyncio.create_task(run(q.put_nowait))
+    # queue holds batches, queue size is in packets
+    queued = 0
+
+    def put(batch):
+        nonlocal queued
+        queued += len(batch)
+        q.put_nowait(batch)
+
+    asyncio.create_task(run(put))
+    GLOBAL['get_qsize'] = lambda: queued
     while True:
-        yield await q.get()
+        for packet in await q.get():
+            queued -= 1
+            yield packet
 
 
-def capture_diver(q: Queue):
+def capture_diver(q: PacketRing):
     import pydivert  # linux support
     with pydivert.WinDivert(f'{s1} or {d1}', flags=pydivert.Flag.SNIFF) as w:
         for packet in w:
@@ -62,16 +90,19 @@ def capture_diver(q: Queue):
                 }
             )
 
-def capture_pcap(q: Queue):
+def capture_pcap(q: PacketRing):
     import pcap
-    import scapy
-    from scapy.layers.l2 import Ether
-    from scapy.all import load_layer
-    load_layer('inet')
+    from eft_cap.frames import IpReassembler, OddFrame, frame_to_dict
     s = pcap.pcap('eno1', promisc=True, immediate=True)
     s.setfilter('udp portrange 16900-17100')
+    scapy_to_dict = None
+    # fragmented datagrams, scapy cannot parse their parts either
+    reassembler = IpReassembler()
 
     def raw_to_dict(data):
+        import scapy
+        from scapy.layers.l2 import Ether
+
         ue = Ether(data)
         ip = ue.payload
 
@@ -92,9 +123,21 @@ def capture_pcap(q: Queue):
             'src_port': udp.sport,
             'dst_port': udp.dport,
         }
+
     for t, data in s:
-        dct = raw_to_dict(data)
-        if data:
+        try:
+            dct = frame_to_dict(data, reassembler)
+        except OddFrame:
+            if scapy_to_dict is None:
+                from scapy.all import load_layer
+                load_layer('inet')
+                scapy_to_dict = raw_to_dict
+            try:
+                dct = scapy_to_dict(data)
+            except Exception:
+                log.exception('Cannot parse frame with scapy')
+                continue
+        if dct:
             q.put_nowait(dct)
 
 
@@ -105,8 +148,11 @@ def gen_kill(p):
     return _inner
 
 
+CAPTURE_BATCH = 1024
+
+
 async def capture():
-    q = Queue()
+    q = PacketRing.create()
     target = capture_diver
     if sys.platform == 'linux':
         target = capture_pcap
@@ -114,26 +160,27 @@ async def capture():
     p.start()
     t = time.time()
     GLOBAL['on_exit'].append(gen_kill(p))
-    GLOBAL['get_qsize'] = lambda: q.qsize()
+    GLOBAL['get_qsize'] = q.qsize
+    GLOBAL['get_fill'] = q.fill
     try:
         while True:
-            try:
-                msg = q.get(block=False)
-                t1 = time.time()
-                if t1 - t > 15:
-                    t = t1
-                    log.warning(f'Queue size: {q.qsize()}')
-                yield msg
-            except Empty:
-                t1 = time.time()
+            batch = q.get_batch(CAPTURE_BATCH)
+            t1 = time.time()
+            if not batch:
                 if t1 - t > 60:
                     t = t1
                     log.warning('Empty queue')
-                pass
-            await asyncio.sleep(0)
+                await q.wait()
+                continue
+            if t1 - t > 15:
+                t = t1
+                log.warning(f'Queue size: {q.qsize()} Fill: {q.fill():.1%} Dropped: {q.dropped}')
+            for msg in batch:
+                yield msg
     finally:
         print(f'Call terminate: {p}')
         p.terminate()
+        q.close(unlink=True)
 
 
 def n_separated_file(name):
@@ -164,9 +211,13 @@ def from_log(packet):
     }
 
 
-async def from_file(args):
+def read_packets(name):
+    if is_packet_log(name):
+        yield from read_packet_log(name)
+        return
+
     decoder = None
-    for packet in n_separated_file(args.packets_file):
+    for packet in n_separated_file(name):
         if decoder is None:
             if 'incoming' in packet:
                 decoder = from_log
@@ -175,16 +226,51 @@ async def from_file(args):
         ret = decoder(packet)
         if ret:
             yield ret
-        await asyncio.sleep(args.packet_delay)
 
 
-def run(args, p_source):
+def seek_packets(args):
+    """
+    packets of binary log starting from --skip (or its session start) and first packet number,
+    None when log cannot be seeked
+    """
+    if not args.skip or not is_packet_log(args.packets_file):
+        if args.from_session:
+            log.warning('--from-session works only with --skip and binary packet logs')
+        return None
+    replay = Replay(args.packets_file)
+    start = replay.session_start(args.skip) if args.from_session else args.skip
+    log.warning(f'Start from packet: {start}')
+    # transport must not skip packets between session start and --skip
+    args.skip = start
+    return replay.iter_from(start, stop=args.limit), start
+
+
+async def from_file(args, packets=None):
+    if packets is None:
+        packets = read_packets(args.packets_file)
+    for packet in packets:
+        yield packet
+        if args.packet_delay:
+            await asyncio.sleep(args.packet_delay)
+
+
+def run(args, p_source, packet_offset=0):
     t = NetworkTransport(p_source, args)
+    t.packet_offset = packet_offset
+    t.batch_max = args.batch_size
+    t.batch_budget = args.batch_budget / 1000
     loop = asyncio.get_event_loop()
     if args.tk:
-        app = App(loop)
+        app = App(loop, rate=args.ui_rate)
     elif args.web:
-        app = webserver.App(loop)
+        app = webserver.App(loop, rate=args.ui_rate)
+    if args.parse_workers:
+        offload = GLOBAL['offload'] = Offload(args.parse_workers, loop)
+        GLOBAL['on_exit'].append(offload.shutdown)
+    elif args.lazy_players:
+        GLOBAL['lazy_players'] = True
+        inventories_task = loop.create_task(decode_inventories())
+        GLOBAL['on_exit'].append(lambda: inventories_task.cancel())
     transport_task = loop.create_task(t.run(limit=args.limit))
     GLOBAL['on_exit'].append(lambda: transport_task.cancel())
     loop.run_until_complete(transport_task)
@@ -192,8 +278,14 @@ def run(args, p_source):
 
 def main():
     args = parse_args()
+    packet_offset = 0
     if args.packets_file:
-        p_source = from_file(args)
+        seek = seek_packets(args)
+        if seek:
+            packets, packet_offset = seek
+            p_source = from_file(args, packets)
+        else:
+            p_source = from_file(args)
     else:
         p_source = capture()
 
@@ -201,11 +293,11 @@ def main():
         import yappi
         yappi.set_clock_type("WALL")
         with yappi.run():
-            run(args, p_source)
+            run(args, p_source, packet_offset)
         stats = yappi.get_func_stats()
         stats.save('profile.prof', type='pstat')
     else:
-        run(args, p_source)
+        run(args, p_source, packet_offset)
 
 
 
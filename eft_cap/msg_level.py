@@ -1,28 +1,40 @@
 from __future__ import annotations
 
-import copy
+import asyncio
+import functools
 import json
 import logging
 import math
+import struct
 import time
 import zlib
+from collections import Counter, deque
 from pprint import pprint
 import random
 from typing import TYPE_CHECKING
 
 import numpy as np
 
-from eft_cap import bprint, split, split_16le
-from eft_cap.bin_helpers import BitStream, ByteStream, FloatQuantizer, stream_from_le
+from eft_cap import bprint, changes
+from eft_cap.bin_helpers import BitStream, ByteStream, FloatQuantizer, get_quantizer, stream_from_le
 from eft_cap.loot import (
     get_total_price,
-    read_item,
-    read_many_polymorph,
     read_polymorph,
     recurse_delete,
     recurse_item,
 )
-from eft_cap.trig_helpers import angle, dist, fwd_vector, norm_angle, quaternion_to_euler
+from eft_cap.offload import parse_inventory, parse_loot
+from eft_cap.player_profile import read_fields
+from eft_cap.sorted_view import SortedView
+from eft_cap.spatial import SpatialIndex
+from eft_cap.trig_helpers import (
+    angle,
+    dist,
+    fwd_vector,
+    norm_angle,
+    quaternion_to_euler,
+    relative_geometry,
+)
 from eft_cap.wanted import WANTED
 
 if TYPE_CHECKING:
@@ -42,52 +54,88 @@ BATTLE_EYE = 168
 GAME_UPDATE = 170
 log = logging.getLogger('msg_level')
 
+MSG_HEADER = struct.Struct('<HH')  # len, op_type
+
+MAX_PLAYERS = 256  # cid is u8
+# positions and (yaw, pitch, roll) rotations of players of default world, rows by cid
+POSITIONS = np.zeros((MAX_PLAYERS, 3), np.float64)
+ROTATIONS = np.zeros((MAX_PLAYERS, 3), np.float64)
+
 Q_LOW = 0.001953125
 Q_HIGH = 0.0009765625
 
+Q_PARTIAL_POS = (get_quantizer(-1, 1, Q_LOW), get_quantizer(-1, 1, Q_HIGH), get_quantizer(-1, 1, Q_LOW))
+Q_ROT_X = get_quantizer(0.0, 360.0, 0.015625)
+Q_ROT_Y = get_quantizer(-90.0, 90.0, 0.015625)
+
 
 class Loot:
+    log = logging.getLogger('Loot')
     BY_DIST_NEARBY = 3
     BY_DIST_WANTED = 7
     BY_PRICE_EXPENSIVE = 10
 
     def __init__(self):
         self.by_id = {}
-        self.by_dist = []
-        self.by_dist_wanted = []
-        self.by_price = []
+        # views over by_id and wanted, kept sorted on every change
+        self.by_dist = SortedView(dist_key)
+        self.by_dist_wanted = SortedView(dist_key)
+        self.by_price = SortedView(price_key)
         self.wanted = {}
         self.last_pos = np.array([0, 0, 0], np.float)
         self.hidden = {}
         self.skipped_updates = 0
-        self.hard_skips = 0
-        self.last_update = time.time()
+        self.last_update = 0.0
+        self.last_full_pos = np.array([0, 0, 0], np.float)
+        # ids which dist was within NEARBY_RADIUS at last refresh, they are refreshed until it isn't
+        self.near = set()
         self.all_items = {}
+        # positions of items in by_id
+        self.index = SpatialIndex()
+        # ids of crates changed since UI has seen them
+        self.dirty = set()
+        # players spawned in lazy mode, their inventories aren't decoded yet
+        self.pending = deque()
+        # moves of items which parses are still in process pool, in order of arrival
+        self.deferred = deque()
+
+    def touch(self, id):
+        self.dirty.add(id)
+        GLOBAL['changes'].mark(changes.LOOT)
+
+    def show(self, id, item):
+        self.touch(id)
+        self.by_id[id] = item
+        self.index.add(id, item['position'])
+        self.by_price.update(id, item)
+        self.by_dist.update(id, item)
 
     def hide(self, id):
         if id in self.by_id:
+            self.touch(id)
             item = self.by_id.pop(id)
+            self.index.remove(id)
+            self.by_price.remove(id)
+            self.by_dist.remove(id)
 
         if id in self.wanted:
             self.wanted.pop(id)
+            self.by_dist_wanted.remove(id)
 
         if id in self.hidden:
             return
         self.hidden[id] = item
 
-        self.update_by_price()
-        self.update_by_dist()
-
     def unhide(self, id):
         if id in self.hidden:
             item = self.hidden.pop(id)
         if id in self.by_id:
+            # price may have changed
+            self.touch(id)
+            self.by_price.update(id, self.by_id[id])
             return
 
-        self.by_id[id] = item
-
-        self.update_by_price()
-        self.update_by_dist()
+        self.show(id, item)
 
     def recursive_add(self, item, nesting, ctx, **kwargs):
         _id = item['id']
@@ -115,6 +163,7 @@ class Loot:
                 crate = item['crate']
                 crate['wanted'] = True
                 self.wanted[crate['id']] = crate
+                self.by_dist_wanted.update(crate['id'], crate)
             elif 'player' in ctx:
                 ctx['player'].wanted = True
 
@@ -127,6 +176,14 @@ class Loot:
     def store_item(self, item, ctx={}):
         recurse_item(item, self.recursive_add, ctx=ctx)
 
+    def decode_pending(self, budget=None):
+        """decode inventories of pending players, no longer than `budget` seconds when given"""
+        t = time.perf_counter()
+        while self.pending:
+            self.pending.popleft().decode_inventory()
+            if budget is not None and time.perf_counter() - t >= budget:
+                break
+
     def add_loot(self, msg, loot):
         if not loot:
             return
@@ -143,14 +200,13 @@ class Loot:
             total_price = json_item.get('total_price', 0)
 
             if 'wanted' in json_item:
-                self.by_id[json_item['id']] = json_item
+                self.show(json_item['id'], json_item)
             elif self.is_ignored(json_item):
                 self.hidden[json_item['id']] = json_item
             elif total_price < self.PRICE_TRESHOLD:
                 self.hidden[json_item['id']] = json_item
             else:
-                self.by_id[json_item['id']] = json_item
-        self.update_by_price()
+                self.show(json_item['id'], json_item)
 
     def get_pid_in_grid(self, item, location):
         for grid in item['grid']:
@@ -190,11 +246,45 @@ class Loot:
             grid['items'].append({'item': item, 'location': location})
             return
 
+    def has_items(self, move_operation):
+        ids = [move_operation['id']]
+        for side in (move_operation['from'], move_operation['to']):
+            for key in ('container', 'owner_container'):
+                if key in side:
+                    ids.append(side[key]['parent_id'])
+        return all(_id in self.all_items for _id in ids)
+
+    def process_deferred(self):
+        """apply deferred moves which items are there, `done` callback of `Offload` jobs"""
+        offload = GLOBAL['offload']
+        while self.deferred:
+            move_operation = self.deferred[0]
+            if offload is not None and len(offload) and not self.has_items(move_operation):
+                return
+            self.deferred.popleft()
+            try:
+                self.move(move_operation)
+            except:
+                self.log.exception(f'Process operation: {move_operation}')
+
     def process_move(self, move_operation):
         _from = move_operation['from']
         _to = move_operation['to']
         if 'stub' in _from or 'stub' in _to:
             return
+        offload = GLOBAL['offload']
+        if self.deferred or (offload is not None and len(offload) and not self.has_items(move_operation)):
+            # moved items may be in loot or inventories which are still parsed, don't block the loop
+            self.deferred.append(move_operation)
+            self.process_deferred()
+            return
+        # moved items may belong to inventories which aren't decoded yet
+        self.decode_pending()
+        self.move(move_operation)
+
+    def move(self, move_operation):
+        _from = move_operation['from']
+        _to = move_operation['to']
         # print(f'Move {_from} => {_to}')
         _from_pid = self.get_source_id(_from)
         _to_pid = self.get_source_id(_to, container=True)
@@ -288,9 +378,6 @@ class Loot:
                 self.unhide(src['crate']['id'])
             # print(f'OLD: {old_price} => {new_price}')
 
-    def update_by_price(self):
-        self.by_price = sorted(self.by_id.values(), key=lambda x: -x.get('total_price', 0))
-
     def should_update_location(self):
         me = GLOBAL['me']
         if not me:
@@ -302,7 +389,34 @@ class Loot:
 
     @property
     def overloaded(self):
-        return GLOBAL['get_qsize']() > 2000
+        return GLOBAL['get_qsize']() > 2000 or GLOBAL['get_fill']() > 0.5
+
+    NEARBY_RADIUS = 50.0
+    FULL_REFRESH_INTERVAL = 5.0  # seconds
+    FULL_REFRESH_MOVE = 25.0
+
+    def rows_to_refresh(self, me):
+        """
+        (ids, positions) of all loot once in FULL_REFRESH_INTERVAL or after long move,
+        otherwise of loot around the player and loot which was around at last refresh,
+        so every dist within NEARBY_RADIUS is current
+        """
+        t = time.time()
+        interval = self.FULL_REFRESH_INTERVAL * (3 if self.overloaded else 1)
+        if t - self.last_update >= interval or dist(me.pos, self.last_full_pos) > self.FULL_REFRESH_MOVE:
+            self.last_update = t
+            self.last_full_pos = me.pos.copy()
+            ids, points = self.index.select()
+        else:
+            ids, points = self.index.select(
+                self.index.around(me.pos, self.NEARBY_RADIUS, self.BY_DIST_NEARBY)
+            )
+            selected = set(ids)
+            left = [_id for _id in self.near if _id not in selected and _id in self.index]
+            if left:
+                ids = ids + left
+                points = np.vstack([points, [self.index.positions[_id] for _id in left]])
+        return ids, points
 
     def update_location(self):
         me = self.should_update_location()
@@ -311,21 +425,18 @@ class Loot:
             return
         self.skipped_updates = 0
 
-        t = time.time()
-        if self.overloaded and self.hard_skips < 50 and t - self.last_update < 5:
-            rows = self.display_rows()
-            self.hard_skips += 1
-        else:
-            rows = self.by_id.values()
-            self.hard_skips = 0
-            self.last_update = t
-
-        for item in rows:
-            item_pos = item['position']
-            item['dist'] = round(dist(me.pos, item_pos), 1)
-            item['angle'] = angle_from_me(me, item_pos)
-            item['vdist'] = round(item_pos[1] - me.pos[1], 1)
-        self.update_by_dist()
+        ids, points = self.rows_to_refresh(me)
+        items = [self.by_id[_id] for _id in ids]
+        # wanted crates are always refreshed, hidden ones are not in index
+        selected = set(ids)
+        wanted = [item for _id, item in self.wanted.items() if _id not in selected]
+        if wanted:
+            items.extend(wanted)
+            points = np.vstack([points, [item['position'] for item in wanted]])
+        set_geometry(items, points, me)
+        self.near = {_id for _id, item in zip(ids, items) if item['dist'] < self.NEARBY_RADIUS}
+        self.dirty.update(ids)
+        self.update_by_dist(ids)
 
     PRICE_TRESHOLD = 18000
     IGNORE = ['quest_']
@@ -361,9 +472,14 @@ class Loot:
                 break
         return out
 
-    def update_by_dist(self):
-        self.by_dist = sorted(self.by_id.values(), key=lambda x: x.get('dist', 1000.0))
-        self.by_dist_wanted = sorted(self.wanted.values(), key=lambda x: x.get('dist', 1000.0))
+    def update_by_dist(self, ids):
+        """re-sort views after dist of `ids` and all wanted crates has changed"""
+        if len(ids) > len(self.by_dist) // 8:
+            self.by_dist.rebuild(self.by_id)
+        else:
+            self.by_dist.refresh(ids)
+            self.by_dist.refresh(self.wanted)
+        self.by_dist_wanted.refresh(self.wanted)
 
     def item_to_row(self, item):
         classes = ['loot']
@@ -457,44 +573,285 @@ class Loot:
         return [self.item_to_row(item) for item in rows]
 
 
+def dist_key(item):
+    return item.get('dist', 1000.0)
+
+
+def price_key(item):
+    return -item.get('total_price', 0)
+
+
 def angle_from_me(player, dst):
     return angle(player.pos, dst, player.rot)
 
 
+def set_geometry(items, points, me):
+    """set `dist`, `angle` and `vdist` of item dicts with (N, 3) `points` relative to `me`"""
+    if not items:
+        return
+    dists, angles, vdists = relative_geometry(points, me.pos, me.rot[0])
+    for item, d, a, v in zip(items, np.round(dists, 1).tolist(), angles.tolist(), np.round(vdists, 1).tolist()):
+        item['dist'] = d
+        item['angle'] = a
+        item['vdist'] = v
+
+
+class World:
+    """
+    Decoded state of one game session.
+    State of active world is in GLOBAL and PLAYERS, where decoder and UIs work with it.
+    """
+    KEYS = ('map', 'me', 'loot', 'positions', 'rotations')
+
+    def __init__(self, positions=None, rotations=None):
+        self.map = None
+        self.me = None
+        self.loot = Loot()
+        # rows by cid, see Player.bind
+        self.positions = np.zeros((MAX_PLAYERS, 3), np.float64) if positions is None else positions
+        self.rotations = np.zeros((MAX_PLAYERS, 3), np.float64) if rotations is None else rotations
+        self.players = {}
+
+
+class DecodeStats:
+    """
+    Results of MsgDecoder.try_decode: decoded messages, errors by op_type and heavy messages
+    """
+    HEAVY = 1.0  # seconds
+
+    def __init__(self):
+        self.messages = 0
+        self.errors = Counter()
+        self.heavy = 0
+
+    def add(self, op_type, duration, failed):
+        self.messages += 1
+        if failed:
+            self.errors[op_type] += 1
+        if duration > self.HEAVY:
+            self.heavy += 1
+
+    def as_dict(self):
+        return {
+            'messages': self.messages,
+            'errors': dict(self.errors),
+            'heavy': self.heavy,
+        }
+
+
+class OpHandler:
+    """
+    Decoder of one op_type: `handle(msg)` reads `msg.data`, None for ops which are always skipped
+    """
+    __slots__ = ('op_type', 'name', 'handle', 'default', 'count', 'bytes', 'time', 'skipped')
+
+    def __init__(self, op_type, name, handle, default=True):
+        self.op_type = op_type
+        self.name = name
+        self.handle = handle
+        # subscribed after OpRegistry.reset
+        self.default = default and handle is not None
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.bytes = 0
+        self.time = 0.0
+        self.skipped = 0
+
+    def add(self, size, duration):
+        self.count += 1
+        self.bytes += size
+        self.time += duration
+
+    def as_dict(self):
+        return {
+            'name': self.name,
+            'count': self.count,
+            'bytes': self.bytes,
+            'time_ms': round(self.time * 1000, 3),
+            'skipped': self.skipped,
+        }
+
+
+class OpRegistry:
+    """
+    op_type -> OpHandler, MsgDecoder.decode dispatches only ops which are subscribed.
+    Ops nobody is subscribed to are counted and skipped before ByteStream is made.
+    """
+    log = logging.getLogger('OpRegistry')
+
+    def __init__(self):
+        self.handlers = {}
+        # subscribed handlers, the only dict looked up per message
+        self.active = {}
+        # op_type -> count of ops without handler
+        self.unknown = Counter()
+
+    def register(self, op_type, name, handle=None, default=True):
+        handler = OpHandler(op_type, name, handle, default)
+        self.handlers[op_type] = handler
+        if handler.default:
+            self.active[op_type] = handler
+        return handler
+
+    def find(self, op):
+        """handler by op_type or name"""
+        if isinstance(op, str):
+            for handler in self.handlers.values():
+                if handler.name == op:
+                    return handler
+            raise KeyError(op)
+        return self.handlers[op]
+
+    def subscribe(self, *ops):
+        for op in ops:
+            handler = self.find(op)
+            if handler.handle is None:
+                raise ValueError(f'No decoder for {handler.name}')
+            self.active[handler.op_type] = handler
+
+    def unsubscribe(self, *ops):
+        for op in ops:
+            self.active.pop(self.find(op).op_type, None)
+
+    def skip(self, op_type):
+        handler = self.handlers.get(op_type)
+        if handler is None:
+            self.unknown[op_type] += 1
+            return False
+        handler.skipped += 1
+        return True
+
+    def reset(self):
+        """default subscriptions and zero counters"""
+        self.active = {op_type: h for op_type, h in self.handlers.items() if h.default}
+        self.unknown.clear()
+        for handler in self.handlers.values():
+            handler.reset()
+
+    def as_dict(self):
+        return {
+            'active': sorted(h.name for h in self.active.values()),
+            'ops': {op_type: h.as_dict() for op_type, h in sorted(self.handlers.items())},
+            'unknown': dict(self.unknown),
+        }
+
+
+OPS = OpRegistry()
+
+
+DEFAULT_WORLD = World(POSITIONS, ROTATIONS)
 GLOBAL = {
+    'world': DEFAULT_WORLD,
     'map': None,
     'me': None,
-    'loot': Loot(),
+    'loot': DEFAULT_WORLD.loot,
+    'positions': POSITIONS,
+    'rotations': ROTATIONS,
     'get_qsize': lambda: random.randint(1, 100),
+    'get_fill': lambda: 0.0,
     'on_exit': [],
+    'changes': changes.Changes(),
+    # defer decoding of inventories of spawned players to `decode_inventories`
+    'lazy_players': False,
+    # process pool for loot and inventories, `offload.Offload`
+    'offload': None,
+    'decode_stats': DecodeStats(),
 }
 PLAYERS = {}
 
 
+MAP_QUANTIZERS = {'map': None, 'pos': None}
+
+
+def map_quantizers(curr_map):
+    """position quantizers for map bounds, rebuilt only when map is changed"""
+    if MAP_QUANTIZERS['map'] is not curr_map:
+        _min = curr_map.bound_min
+        _max = curr_map.bound_max
+        MAP_QUANTIZERS['pos'] = (
+            FloatQuantizer(_min[0], _max[0], Q_LOW),
+            FloatQuantizer(_min[1], _max[1], Q_HIGH),
+            FloatQuantizer(_min[2], _max[2], Q_LOW),
+        )
+        MAP_QUANTIZERS['map'] = curr_map
+    return MAP_QUANTIZERS['pos']
+
+
+async def decode_inventories(budget=0.002, interval=0.05):
+    """background decoding of pending inventories, no longer than `budget` seconds per `interval`"""
+    while True:
+        try:
+            GLOBAL['loot'].decode_pending(budget)
+        except:
+            log.exception('While decode inventories')
+        await asyncio.sleep(interval)
+
+
+def activate_world(world):
+    """save state of active world and make `world` active"""
+    current = GLOBAL['world']
+    if world is current:
+        return
+    for key in World.KEYS:
+        setattr(current, key, GLOBAL[key])
+    current.players = dict(PLAYERS)
+    for key in World.KEYS:
+        GLOBAL[key] = getattr(world, key)
+    PLAYERS.clear()
+    PLAYERS.update(world.players)
+    GLOBAL['world'] = world
+
+
+def players_geometry():
+    """{cid: (dist, angle, vdist)} of all players except me, computed in one pass"""
+    me = GLOBAL['me']
+    players = [player for player in PLAYERS.values() if not player.me]
+    if not me or not players:
+        return {}
+    dists, angles, vdists = relative_geometry(
+        GLOBAL['positions'][[player.cid for player in players]], me.pos, me.rot[0]
+    )
+    return {
+        player.cid: tuple(geometry)
+        for player, *geometry in zip(
+            players, np.round(dists, 1).tolist(), angles.tolist(), np.round(vdists, 1).tolist()
+        )
+    }
+
+
 def clear_global():
     GLOBAL['map'] = None
     GLOBAL['me'] = None
     GLOBAL['loot'] = Loot()
     PLAYERS.clear()
+    GLOBAL['changes'].mark_all()
 
 
 class ParsingMethods:
+    __slots__ = ()
+
     def read_size_and_bytes(self, data=None):
         if data is None:
             data = self.data
         size = data.read_u16()
         return data.read_bytes(size)
 
-    def read_rot(self):
+    def read_rot(self, data=None):
+        if data is None:
+            data = self.data
         return {
-            "x": self.data.read_f32(),
-            "y": self.data.read_f32(),
-            "z": self.data.read_f32(),
-            "w": self.data.read_f32(),
+            "x": data.read_f32(),
+            "y": data.read_f32(),
+            "z": data.read_f32(),
+            "w": data.read_f32(),
         }
 
-    def read_pos(self):
-        return np.array([self.data.read_f32(), self.data.read_f32(), self.data.read_f32()])
+    def read_pos(self, data=None):
+        if data is None:
+            data = self.data
+        return np.array([data.read_f32(), data.read_f32(), data.read_f32()])
 
 
 class Map(ParsingMethods):
@@ -535,39 +892,86 @@ class Map(ParsingMethods):
 
     def set_exits(self, exits: dict):
         self.exits = exits
+        GLOBAL['changes'].mark(changes.EXITS)
+
+
+class PlayerDetails:
+    """heavy data of player which UI doesn't need on every update"""
+    __slots__ = ('prof_zip', 'inv_bin', 'inventory')
+
+    def __init__(self, prof_zip=None, inventory=None):
+        self.prof_zip = prof_zip
+        # serialized inventory until it's decoded
+        self.inv_bin = None
+        self.inventory = inventory
+
+    @property
+    def prof(self):
+        """full profile, decoded on every access to not keep it in memory"""
+        if self.prof_zip is None:
+            return {}
+        return json.loads(zlib.decompress(self.prof_zip))
 
 
 class Player(ParsingMethods):
-    log = logging.getLogger('Player')
+    __slots__ = (
+        'me', 'cid', 'pid', 'pos', 'rot', 'pose', 'tilt', 'is_alive', 'updated_at', 'spawn_time',
+        'price', 'loot_price', 'price_class', 'is_scav', 'is_npc', 'group_id', 'nickname', 'lvl',
+        'side', 'surv_class', 'wanted', 'encrypt', 'replay', 'dirty', 'details', 'log',
+        '__cached_name',
+    )
 
     def __init__(self, msg: MsgDecoder, me=False):
+        self.log = logging.getLogger('Player')
         self.me = me
         self.price = 0
         self.loot_price = 0
         self.price_class = '-1'
         self.is_scav = False
         self.group_id = -1
+        self.wanted = False
         self.updated_at = time.time()
+        # fields changed since UI has seen them
+        self.dirty = set()
+        self.details = PlayerDetails()
 
         if not msg:
             return
         self.encrypt = msg.transport.encrypt
+        self.replay = msg.transport.replay
         if me:
             GLOBAL['me'] = self
 
-        self.msg = msg
-        self.data = msg.data
-
+        data = msg.data
         self.spawn_time = time.time()
 
-        self.pid = self.data.read_u32()
-        self.cid = self.data.read_u8()
-        self.pos = self.read_pos()
-        self.deserialize_initial_state()
+        self.pid = data.read_u32()
+        self.bind(data.read_u8())
+        self.pos[:] = self.read_pos(data)
+        self.deserialize_initial_state(data)
         PLAYERS[self.cid] = self
+        self.touch('spawn')
         self.__cached_name = self.get_name()
         self.log = logging.getLogger(f'{self}')
 
+    def bind(self, cid):
+        """position and rotation are views of `cid` rows of shared arrays, updated in place"""
+        self.cid = cid
+        self.pos = GLOBAL['positions'][cid]
+        self.rot = GLOBAL['rotations'][cid]
+        self.pos[:] = 0
+        self.rot[:] = 0
+
+    @property
+    def inventory(self):
+        if self.details.inv_bin is not None:
+            self.decode_inventory()
+        return self.details.inventory
+
+    def touch(self, *fields):
+        self.dirty.update(fields)
+        GLOBAL['changes'].mark(changes.ME if self.me else changes.PLAYERS)
+
     def update_loot_price(self):
         _my_total_price = 0
         SKIP = ['SecuredContainer', 'Scabbard']
@@ -584,52 +988,37 @@ class Player(ParsingMethods):
         recurse_item(self.inventory, tot)
         self.loot_price = _my_total_price
         self.update_price_class()
+        self.touch('loot_price')
+
+    def deserialize_initial_state(self, data):
+        unk2 = data.read_u8()
+        self.is_alive = data.read_u8() == 1
+        self.pos[:] = self.read_pos(data)
+        self.rot[:] = quaternion_to_euler(**self.read_rot(data))
+        in_prone = data.read_u8() == 1
+        self.pose = data.read_f32()
+
+        self.details.inv_bin = self.read_size_and_bytes(data)
+        offload = GLOBAL['offload']
+        if offload is not None:
+            loot = GLOBAL['loot']
+            merge = functools.partial(self.merge_inventory, loot=loot)
+            offload.submit(merge, parse_inventory, self.details.inv_bin, done=loot.process_deferred)
+        elif GLOBAL['lazy_players']:
+            GLOBAL['loot'].pending.append(self)
+        else:
+            self.decode_inventory()
 
-    def deserialize_initial_state(self):
-        unk2 = self.data.read_u8()
-        self.is_alive = self.data.read_u8() == 1
-        self.pos = self.read_pos()
-        self.rot = quaternion_to_euler(**self.read_rot())
-        in_prone = self.data.read_u8() == 1
-        self.pose = self.data.read_f32()
-
-        inv_bin = self.read_size_and_bytes()
-        try:
-            top_ctx = {'total_price': 0}
-            ctx = {'top': top_ctx}
-            self.inventory = read_item(ByteStream(inv_bin), ctx=ctx)
-            self.inventory['player'] = self
-            GLOBAL['loot'].store_item(self.inventory, {'player': self})
-        except:
-            self.log.exception('During decode')
-            if self.msg.transport.replay:
-                print('exit 112')
-                exit(112)
-
-        # print(f'TP: {ctx}')
-        self.price = top_ctx['total_price']
-        self.update_loot_price()
+        prof_zip = self.read_size_and_bytes(data)
+        self.details.prof_zip = prof_zip
+        prof = read_fields(prof_zip)
 
-        prof_zip = self.read_size_and_bytes()
-        self.prof = json.loads(zlib.decompress(prof_zip))
-        self.full_prof = copy.copy(self.prof)
-
-        self.prof.pop("Encyclopedia")
-        self.prof.pop("BackendCounters")
-        self.prof.pop("Bonuses")
-        self.prof.pop("Skills")
-        self.prof.pop("Quests")
-        self.prof.pop("InsuredItems")
-        self.prof.pop("ConditionCounters")
-        self.prof.pop("Stats")
-
-        self.log.debug(self.prof)
-        info = self.prof.get("Info")
+        info = prof.get("Info")
         self.nickname = info.get("Nickname")
         self.lvl = info.get("Level")
-        self.surv_class = self.prof.get("SurvivorClass")
+        self.surv_class = prof.get("SurvivorClass")
         self.is_scav = info.get("Side") == "Savage"
-        self.is_npc = self.is_scav and self.prof.get('aid') == '0'
+        self.is_npc = self.is_scav and prof.get('aid') == '0'
         side = info.get("Side")
         self.side = "SCAV" if side == "Savage" else side
         self.group_id = info.get('GroupId', None)
@@ -639,6 +1028,35 @@ class Player(ParsingMethods):
             f"OBS POS:{self.nickname} => {self.pos} ROT: {self.rot} Prone: {in_prone} POSE: {self.pose}"
         )
 
+    def decode_inventory(self):
+        if self.details.inv_bin is None:
+            return
+        try:
+            result = parse_inventory(self.details.inv_bin)
+        except:
+            self.details.inv_bin = None
+            self.log.exception('During decode')
+            if self.replay:
+                print('exit 112')
+                exit(112)
+            return
+        self.merge_inventory(result)
+
+    def merge_inventory(self, result, loot=None):
+        """store `parse_inventory` result into `loot` of player's session, active one by default"""
+        if self.details.inv_bin is None:
+            # decoded already
+            return
+        self.details.inv_bin = None
+        inventory, self.price = result
+        inventory['player'] = self
+        self.details.inventory = inventory
+        (loot or GLOBAL['loot']).store_item(inventory, {'player': self})
+        self.update_loot_price()
+        if hasattr(self, '_Player__cached_name'):
+            # decoded after spawn, name shows price class
+            self.__cached_name = self.get_name()
+
     def update_price_class(self):
         if self.loot_price < 10000:
             self.price_class = '<10k'
@@ -663,7 +1081,8 @@ class Player(ParsingMethods):
         log.debug(f'Create dummy player: {me} / {cid}')
         player = Player(msg=None, me=me)
         player.encrypt = transport.encrypt
-        player.cid = cid
+        player.replay = transport.replay
+        player.bind(cid)
         player.lvl = -1
         player.side = f'UNK'
         player.nickname = f'Unk:me={me}'
@@ -672,9 +1091,8 @@ class Player(ParsingMethods):
         player.is_npc = False
         player.surv_class = 'UNK'
         player.is_alive = True
-        player.pos = np.array([0, 0, 0], np.float)
-        player.rot = np.array([0, 0, 0], np.float)
         PLAYERS[cid] = player
+        player.touch('spawn')
         player.__cached_name = player.get_name()
         return player
 
@@ -727,101 +1145,99 @@ class Player(ParsingMethods):
         if True or self.nickname.startswith("Гога"):
             self.log.info(msg, *args, **kwargs)
 
-    def update(self, msg, data):
-        self.msg = msg  # type: MsgDecoder
-        self.data = data  # type: BitStream
+    def update(self, msg: MsgDecoder, data: BitStream):
         if self.me:
             self.log.debug(f"Skip myself {self}")
             return
         args = {"min_value": 1, "max_value": 5}
-        if self.data.read_bits(1) == 0:
+        if data.read_bits(1) == 0:
             args = {"min_value": 0, "max_value": 2097151}
             # args = {'max_value': 1037149}  # < 20 bit
-        num = self.data.read_limited_bits(**args)
+        num = data.read_limited_bits(**args)
 
-        game_time = self.data.read_f32()
+        game_time = data.read_f32()
         # print(f'Time: {game_time}')
-        is_disconnected = self.data.read_bits(1)
-        # self.data.read_check(299)
-        self.log.debug(f"OFFST: {self.data.bit_offset}")
-        is_alive = self.data.read_bits(1)
+        is_disconnected = data.read_bits(1)
+        # data.read_check(299)
+        self.log.debug(f"OFFST: {data.bit_offset}")
+        is_alive = data.read_bits(1)
 
-        ctx = self.msg.ctx
-        curr_packet = self.msg.transport.curr_packet
+        ctx = msg.ctx
+        curr_packet = msg.transport.curr_packet
         msg_det = f'PCKT: {curr_packet["num"]}/{curr_packet["len"]} CID: {ctx["channel_id"]}'
         self.log.debug(
             f'Num is {num} GT: {game_time} Disc: {is_disconnected} IsALIVE: {is_alive}'
-            f' {self} {msg_det} Len: {len(self.data.orig_stream)}'
+            f' {self} {msg_det} Len: {len(data.orig_stream)}'
         )
-        # self.log.debug(self.data.orig_stream)
+        # self.log.debug(data.orig_stream)
         # self.log.warning(f'IS ALIVE: {is_alive}')
         if not is_alive:
             # probably not died but not alive yet
+            if self.is_alive:
+                self.touch('is_alive')
             self.is_alive = False
-            inv_hash = self.data.read_u32()
-            time = self.data.read_u64()
-            # self.data.align()
-            # print(f'{hex(self.data.read_bits(16))}:')
-            nickname = self.data.read_string(1350)
-            side = self.data.read_u32()
-            status = self.data.read_string(1350)
-            killer = self.data.read_string(1350)
-            lvl = self.data.read_u32()
-            weapon = self.data.read_string()
+            inv_hash = data.read_u32()
+            time = data.read_u64()
+            # data.align()
+            # print(f'{hex(data.read_bits(16))}:')
+            nickname = data.read_string(1350)
+            side = data.read_u32()
+            status = data.read_string(1350)
+            killer = data.read_string(1350)
+            lvl = data.read_u32()
+            weapon = data.read_string()
             self.log.debug(f'{nickname} {status} {killer} with {weapon}. Msg in: {self}')
         else:
-            # self.data.read_check(304)
-            self.update_position()
-            self.update_rotation()
-            self.skip_misc()
+            # data.read_check(304)
+            self.update_position(data)
+            self.update_rotation(data)
+            self.skip_misc(data)
             try:
-                self.update_loot()
+                self.update_loot(data, msg.incoming)
             except:
-                self.log.exception(f'When update loot: incoming={self.msg.incoming}')
-                # old = self.data.bit_offset
-                # self.data.bit_offset = 0
-                # size = len(self.data.orig_stream)
-                # print(self.data.orig_stream)
+                self.log.exception(f'When update loot: incoming={msg.incoming}')
+                # old = data.bit_offset
+                # data.bit_offset = 0
+                # size = len(data.orig_stream)
+                # print(data.orig_stream)
                 # print(f'Size: {size} HX: {hex(size)}')
-                # ByteStream(self.data.orig_stream).dump_to('error.bin')
-                # ByteStream(self.msg.curr_packet['data']).dump_to('to_test.bin')
+                # ByteStream(data.orig_stream).dump_to('error.bin')
+                # ByteStream(msg.curr_packet['data']).dump_to('to_test.bin')
                 # exit(134)  # TODO: delme
                 pass
 
     def update_encrypted(self):
         self.updated_at = time.time()
+        self.touch('updated_at')
 
     def update_me(self, msg: MsgDecoder, data: BitStream):
         if self.encrypt:
             self.update_encrypted()
             return
 
-        self.msg = msg
-        self.data = data
-        num = self.data.read_limited_bits(0, 127)
+        num = data.read_limited_bits(0, 127)
         self.log.debug(f'NUM: {num}')
         for i in range(num):
-            if self.data.read_bits(1):
-                rtt = self.data.read_u16()
+            if data.read_bits(1):
+                rtt = data.read_u16()
             else:
                 rtt = 0
-            dt = self.data.read_limited_float(0.0, 1.0, 0.0009765625)
-            frame = self.data.read_limited_bits(0, 2097151)
-            if self.data.read_bits(1):
-                frame2 = self.data.read_limited_bits(0, 2097151)
+            dt = data.read_limited_float(0.0, 1.0, 0.0009765625)
+            frame = data.read_limited_bits(0, 2097151)
+            if data.read_bits(1):
+                frame2 = data.read_limited_bits(0, 2097151)
             else:
-                frame2 = self.data.read_limited_bits(0, 15)
-            # self.data.read_bits(20)
-            self.log.debug(f'DT: {dt}/ {rtt} /F1: {frame} {frame2}.  {self.msg}')
-            # self.data.bit_offset -= 3
-            if self.update_position():
-                self.update_rotation()
-                self.skip_misc()
-                self.update_loot()
+                frame2 = data.read_limited_bits(0, 15)
+            # data.read_bits(20)
+            self.log.debug(f'DT: {dt}/ {rtt} /F1: {frame} {frame2}.  {msg}')
+            # data.bit_offset -= 3
+            if self.update_position(data):
+                self.update_rotation(data)
+                self.skip_misc(data)
+                self.update_loot(data, msg.incoming)
                 # GLOBAL['loot'].update_location()   # TODO: delme
 
-    def skip_misc(self):
-        d: BitStream = self.data
+    def skip_misc(self, d: BitStream):
         start_bit = d.bit_offset  # TODO: delme
         # print(f'IS ALIGNED: {d.aligned}')
         d.read_bits()  # sync pos applied
@@ -902,8 +1318,7 @@ class Player(ParsingMethods):
             d.read_limited_bits(-1, 3)
         self.log.info(f'SKIP BITS FROM {start_bit} to {d.bit_offset}')  # TODO: delme
 
-    def read_one_loot(self):
-        d: BitStream = self.data
+    def read_one_loot(self, d: BitStream):
         # d.bit_offset -= 3
         if d.read_bits():
             size = d.read_bits(16)
@@ -923,21 +1338,20 @@ class Player(ParsingMethods):
                     self.log.exception(f'Process operation: {poly}')
                     # exit(133)  # TODO: delme
 
-    def update_loot(self):
+    def update_loot(self, d: BitStream, incoming=True):
         self.log.info(
-            f'Loot position: {self.data.bit_offset} / {self.data.bit_offset / 8}'
+            f'Loot position: {d.bit_offset} / {d.bit_offset / 8}'
         )  # TODO: delme
-        # self.data.align()
-        # self.data.print_rest()
-        d: BitStream = self.data
+        # d.align()
+        # d.print_rest()
         num = d.read_u8()
         for i in range(num):
-            if not self.msg.incoming:
-                self.read_one_loot()
+            if not incoming:
+                self.read_one_loot(d)
                 continue
             tag = d.read_u8()
             if tag == 1:  # command
-                self.read_one_loot()
+                self.read_one_loot(d)
                 continue
             # deserialize status
             _id = d.read_bits(16)
@@ -950,37 +1364,36 @@ class Player(ParsingMethods):
 
     exit = math.inf
 
-    def update_position(self, check=True):
+    def update_position(self, data: BitStream, check=True):
         self.updated_at = time.time()
         # assert self.is_alive
-        last_pos = copy.copy(self.pos)
-        # self.data.read_check()
-        read = self.data.read_bits(1) == 1
+        # data.read_check()
+        read = data.read_bits(1) == 1
         if read:
             # self.log.debug(f"Update position {self} Read: {read} ME: {self.me}")
-            partial = self.data.read_bits(1) == 1
+            partial = data.read_bits(1) == 1
             if partial:
-                q_x = FloatQuantizer(-1, 1, Q_LOW)
-                q_y = FloatQuantizer(-1, 1, Q_HIGH)
-                q_z = FloatQuantizer(-1, 1, Q_LOW)
+                q_x, q_y, q_z = Q_PARTIAL_POS
             else:
                 curr_map = GLOBAL["map"]  # type: Map
                 if not curr_map:
                     return
-                _min = curr_map.bound_min
-                _max = curr_map.bound_max
-                q_x = FloatQuantizer(_min[0], _max[0], Q_LOW)
-                q_y = FloatQuantizer(_min[1], _max[1], Q_HIGH)
-                q_z = FloatQuantizer(_min[2], _max[2], Q_LOW)
-            dx = q_x.read(self.data)
-            dy = q_y.read(self.data)
-            dz = q_z.read(self.data)
+                q_x, q_y, q_z = map_quantizers(curr_map)
+            dx = q_x.read(data)
+            dy = q_y.read(data)
+            dz = q_z.read(data)
             self.log.debug(f'DX: {dx} DY: {dy} DZ: {dz}')
 
+            pos = self.pos
             if partial:
-                self.pos += np.array([dx, dy, dz])
+                pos[0] += dx
+                pos[1] += dy
+                pos[2] += dz
             else:
-                self.pos = np.array([dx, dy, dz])
+                pos[0] = dx
+                pos[1] = dy
+                pos[2] = dz
+            self.touch('pos')
 
             # self.log.debug(
             #     f"Moved: {last_pos} => {self.pos} PARTIAL: {partial}"
@@ -989,26 +1402,25 @@ class Player(ParsingMethods):
                 bb_min, bb_max = GLOBAL["map"].bb
                 if not (bb_min["y"] <= self.pos["y"] <= bb_max["y"]):
                     self.log.debug(f'BB IS: {GLOBAL["map"].bb}')
-                    self.data.reset()
-                    self.log.debug(f'{bytes(self.data.rest)}')
+                    data.reset()
+                    self.log.debug(f'{bytes(data.rest)}')
                     print('Exit 111')
                     exit(111)
                 assert bb_min["x"] <= self.pos["x"] <= bb_max["x"]
                 assert bb_min["y"] <= self.pos["y"] <= bb_max["y"]
                 assert bb_min["z"] <= self.pos["z"] <= bb_max["z"]
         else:
-            self.log.debug(f"Rest is: {self.data.bit_offset} Size: {len(self.data.stream)}")
+            self.log.debug(f"Rest is: {data.bit_offset} Size: {data.length_limit}")
         return True
 
-    def update_rotation(self):
-        if self.data.read_bits():
-            qx = FloatQuantizer(0.0, 360.0, 0.015625)
-            qy = FloatQuantizer(-90.0, 90.0, 0.015625)
+    def update_rotation(self, data: BitStream):
+        if data.read_bits():
             #        before = copy.copy(self.rot)
-            x = qx.read(self.data)
-            y = qy.read(self.data)
+            x = Q_ROT_X.read(data)
+            y = Q_ROT_Y.read(data)
             self.rot[0] = min(360.0, x)
             self.rot[1] = y
+            self.touch('rot')
             # if self.me:
             #     print(f'Rotated: {self.fwd_vector}')
 
@@ -1031,31 +1443,20 @@ class MsgDecoder(ParsingMethods):
     def __str__(self):
         return f'<MSG:{self.op_type} MLEN: {self.len} PKT:{self.curr_packet["num"]}/{self.curr_packet["len"]}>'
 
-    def parse(self, stream):
-        # print('parse in MsgDecoder')
-        # bprint(stream)
-        msg = {}
-        self.len, stream = split_16le(stream)
-        self.op_type, stream = split_16le(stream)
-        # _, stream = split_8(stream)
-        self.content, stream = split(stream, self.len)
-
-        # n = self.curr_packet['num']
-        # from_ = 200
-        # to_ = from_ + 200
-        # if from_ < n < to_:
-        #     print(f'Num: {n} OP: {self.op_type}')
-        #     pprint(self.content)
-        # elif n > to_:
-        #     import sys
-        #     sys.exit(1)
+    def parse(self, buf, offset=0, end=None):
+        """
+        decode message at `offset` of `buf` and return offset right after it
+        """
+        if end is None:
+            end = len(buf)
+        self.len, self.op_type = MSG_HEADER.unpack_from(buf, offset)
+        start = offset + MSG_HEADER.size
+        stop = min(start + self.len, end)
+        self.content = buf[start:stop]
 
         self.log.debug(f'M: {self}')
-        # stream.print_rest()
         self.try_decode()
-        # print(msg)
-        # print(f'return offset: {stream.bit_offset} / {len(stream.stream)}')
-        return stream
+        return stop
 
     exit = 1
 
@@ -1068,50 +1469,56 @@ class MsgDecoder(ParsingMethods):
         GLOBAL["map"] = curr_map
 
     def decode(self):
-        self.data = ByteStream(self.content)
-
-        if self.op_type == SERVER_INIT:
-            self.init_server()
-        elif self.op_type == BATTLE_EYE:
+        handler = OPS.active.get(self.op_type)
+        if handler is None:
+            if not OPS.skip(self.op_type):
+                self.log.warning(f'Cannot process: {self}')
             return
-        elif self.op_type == SUBWORLD_SPAWN:
-            self.process_subworld_spawn(self.data)
-        elif self.op_type == PLAYER_SPAWN:
-            self.player = Player(self, me=True)
-        elif self.op_type == OBSERVER_SPAWN:
-            self.player = Player(self)
-        elif self.op_type == OBSERVER_UNSPAWN:
-            self.pid = self.data.read_u32()
-            self.cid = self.data.read_u8()
-            print(f"Exit: {PLAYERS[self.cid]}")
-            del PLAYERS[self.cid]
-        elif self.op_type == GAME_UPDATE:
-            # print(f'READSIZE: {len(self.content)} / {self.content} / {self}')
-            # bprint(self.content)
-            up_bin = self.read_size_and_bytes()
-            up_data = BitStream(up_bin)
-            # print(f'UP_DATA: {str(up_data.stream)} / {up_data.orig_stream}')
-            if not self.ctx["incoming"]:
-                self.update_outbound(up_data)
-
-            elif up_data.read_bits(1) == 1:
-                self.update_player(up_data)
-            else:
-                if not self.ctx["incoming"]:
-                    print(self.transport.curr_packet)
-                    print("Exit 22")
-                    exit(22)
-                self.update_world(up_data)
-        elif self.op_type == WORLD_SPAWN:
-            self.process_world_spawn(self.data)
-        else:
-            self.log.warning(f'Cannot process: {self}')
+        t = time.perf_counter()
+        try:
+            self.data = ByteStream(self.content)
+            handler.handle(self)
+        finally:
+            handler.add(len(self.content), time.perf_counter() - t)
 
         if MsgDecoder.exit <= 0:
             print("Exit 20")
             exit(20)
 
-    def process_world_spawn(self, data: ByteStream):
+    def process_player_spawn(self):
+        self.player = Player(self, me=True)
+
+    def process_observer_spawn(self):
+        self.player = Player(self)
+
+    def process_observer_unspawn(self):
+        self.pid = self.data.read_u32()
+        self.cid = self.data.read_u8()
+        print(f"Exit: {PLAYERS[self.cid]}")
+        del PLAYERS[self.cid]
+        GLOBAL['changes'].mark(changes.PLAYERS)
+
+    def process_game_update(self):
+        # print(f'READSIZE: {len(self.content)} / {self.content} / {self}')
+        # bprint(self.content)
+        up_bin = self.read_size_and_bytes()
+        up_data = BitStream(up_bin)
+        # print(f'UP_DATA: {str(up_data.stream)} / {up_data.orig_stream}')
+        if not self.ctx["incoming"]:
+            self.update_outbound(up_data)
+
+        elif up_data.read_bits(1) == 1:
+            self.update_player(up_data)
+        else:
+            if not self.ctx["incoming"]:
+                print(self.transport.curr_packet)
+                print("Exit 22")
+                exit(22)
+            self.update_world(up_data)
+
+    def process_world_spawn(self, data: ByteStream = None):
+        if data is None:
+            data = self.data
         exits = {}
         try:
             num = data.read_u16()
@@ -1126,14 +1533,22 @@ class MsgDecoder(ParsingMethods):
             self.log.exception('AAA')
         GLOBAL['map'].set_exits(exits)
 
-    def process_subworld_spawn(self, data: ByteStream):
+    def process_subworld_spawn(self, data: ByteStream = None):
+        if data is None:
+            data = self.data
         if not data.read_bytes(1):
             return
         loot_json = self.read_size_and_bytes(data)
         loot_info = self.read_size_and_bytes(data)
-        d = ByteStream(zlib.decompress(loot_json))
-        out = read_many_polymorph(d)
-        GLOBAL['loot'].add_loot(self, out)
+        offload = GLOBAL['offload']
+        if offload is not None:
+            # merged into loot of this session even when other session is active by then
+            loot = GLOBAL['loot']
+            offload.submit(
+                functools.partial(loot.add_loot, self), parse_loot, loot_json, done=loot.process_deferred
+            )
+            return
+        GLOBAL['loot'].add_loot(self, parse_loot(loot_json))
 
     def update_player(self, up_data: BitStream):
         # get by `channel_id` or `channel_id - 1`
@@ -1171,10 +1586,12 @@ class MsgDecoder(ParsingMethods):
 
     def try_decode(self):
         t = time.time()
+        failed = False
         try:
             self.decode()
             self.decoded = True
         except Exception as e:
+            failed = True
             self.log.exception(f"While decode packet. Incoming={self.ctx['incoming']}")
             # ByteStream(self.curr_packet['data']).dump_to('error.bin')
             # BitStream.DEBUG = True
@@ -1186,5 +1603,16 @@ class MsgDecoder(ParsingMethods):
             # exit(0)
         finally:
             d = time.time() - t
-            if d > 1:
+            GLOBAL['decode_stats'].add(self.op_type, d, failed)
+            if d > DecodeStats.HEAVY:
                 self.log.warning(f'Heavy msg: {d:.3} {self}')
+
+
+OPS.register(SERVER_INIT, 'SERVER_INIT', MsgDecoder.init_server)
+OPS.register(BATTLE_EYE, 'BATTLE_EYE')
+OPS.register(WORLD_SPAWN, 'WORLD_SPAWN', MsgDecoder.process_world_spawn)
+OPS.register(SUBWORLD_SPAWN, 'SUBWORLD_SPAWN', MsgDecoder.process_subworld_spawn)
+OPS.register(PLAYER_SPAWN, 'PLAYER_SPAWN', MsgDecoder.process_player_spawn)
+OPS.register(OBSERVER_SPAWN, 'OBSERVER_SPAWN', MsgDecoder.process_observer_spawn)
+OPS.register(OBSERVER_UNSPAWN, 'OBSERVER_UNSPAWN', MsgDecoder.process_observer_unspawn)
+OPS.register(GAME_UPDATE, 'GAME_UPDATE', MsgDecoder.process_game_update)
@@ -5,14 +5,18 @@ import asyncio
 import json
 import logging
 import struct
-from collections import defaultdict
+import time
+import zlib
+from array import array
+from collections import OrderedDict, defaultdict
 import pathlib
 import datetime
 from pprint import pprint
 
 from eft_cap.bin_helpers import ByteStream
-from eft_cap.msg_level import MsgDecoder, clear_global
-from eft_cap import bprint, split, split_8, split_16, split_16le
+from eft_cap.msg_level import GLOBAL, MSG_HEADER, OPS, MsgDecoder, World, activate_world
+from eft_cap.packet_log import PacketLogWriter
+from eft_cap import bprint
 import pickle
 
 
@@ -26,81 +30,333 @@ M_MSG_COMBINED = 254
 CHAN_MAX = 207
 FRAGMENTED = [0, 1, 2]
 
+U16BE = struct.Struct('>H')
+U16LE = struct.Struct('<H')
+PACKET_HEADER = struct.Struct('>HHH')  # connection_id, packet_id, session_id
+ACKS_SIZE = 2 + 4 * 4
+
 
 class Acks:
-    def __init__(self, name):
+    """
+    Seen message ids of one channel, ring of 2**16 slots over u16 ids.
+    Ids are compared modulo 2**16, slots are cleared with slice assignment when window advances.
+    Message is a duplicate when its id is in window, was seen and has the same digest,
+    so id which was reused for other message isn't dropped.
+    """
+    SIZE = 0x10000
+    WINDOW = 0x7fff
+
+    def __init__(self, name, window=WINDOW):
         self.name = name
-        self.window_size = 0xffff / 2 - 1
-        self.head = self.window_size - 1
-        self.tail = 1
-        self.acks = [False for x in range(0xffff)]
-
-    def read_message(self, msg_id):
-        max_d = 0xffff
-        raw_d = abs(msg_id - self.head)
-        dist = raw_d if raw_d < (max_d / 2) else max_d - raw_d
-        if (dist > self.window_size):
+        self.window = window
+        self.head = None
+        self.seen = bytearray(self.SIZE)
+        self.digests = array('I', bytes(4 * self.SIZE))
+        self.duplicates = 0
+        self.stale = 0
+
+    def clear(self, start, stop):
+        """clear slots of ids in [start, stop) modulo SIZE"""
+        start %= self.SIZE
+        stop %= self.SIZE
+        if start <= stop:
+            self.seen[start:stop] = bytes(stop - start)
+        else:
+            self.seen[start:] = bytes(self.SIZE - start)
+            self.seen[:stop] = bytes(stop)
+
+    def read_message(self, msg_id, digest=0):
+        """returns True when message should be processed, False for duplicate or stale one"""
+        if self.head is None:
+            self.head = msg_id
+        else:
+            ahead = (msg_id - self.head) & 0xffff
+            if 0 < ahead <= 0x7fff:
+                self.clear(self.head + 1, msg_id + 1)
+                self.head = msg_id
+            elif ahead and self.SIZE - ahead > self.window:
+                self.stale += 1
+                return False
+
+        if self.seen[msg_id] and self.digests[msg_id] == digest:
+            self.duplicates += 1
             return False
-        if msg_id < self.tail or msg_id > self.head:
-            for i in range(dist):
-                self.acks[i] = False
-                self.tail = (self.tail + 1) % len(self.acks)
-                self.head = (self.head + 1) % len(self.acks)
+        self.seen[msg_id] = 1
+        self.digests[msg_id] = digest
+        return True
+
+
+class Fragment:
+    __slots__ = ('chunks', 'received', 'size', 'created')
+
+    def __init__(self, amount, now):
+        self.chunks = [None] * amount
+        self.received = 0
+        self.size = 0
+        self.created = now
+
+
+class FragmentReassembler:
+    """
+    Collects fragmented messages by (incoming, channel_id, frag_id) into chunk slots sized by amount.
+    Incomplete messages are dropped after `timeout` seconds, when fragment of the same channel
+    is `max_lag` ids ahead, or when buffers are over limits.
+    """
+
+    def __init__(self, timeout=5.0, max_lag=16, max_bytes=4 * 1024 * 1024, max_fragments=64):
+        self.timeout = timeout
+        self.max_lag = max_lag
+        self.max_bytes = max_bytes
+        self.max_fragments = max_fragments
+        self.pending = OrderedDict()
+        self.buffered = 0
+        self.peak_buffered = 0
+        self.dropped = 0
+        self.assembled = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def __len__(self):
+        return len(self.pending)
+
+    def drop(self, key):
+        fragment = self.pending.pop(key)
+        self.buffered -= fragment.size
+        self.dropped += 1
+
+    def expire(self, now):
+        while self.pending:
+            key, fragment = next(iter(self.pending.items()))
+            if now - fragment.created < self.timeout:
+                break
+            self.drop(key)
+
+    def clear(self):
+        """drop all unfinished messages"""
+        self.dropped += len(self.pending)
+        self.pending.clear()
+        self.buffered = 0
+
+    def drop_lagging(self, key):
+        """drop unfinished fragments of channel which are far behind new fragment `key`"""
+        incoming, channel_id, frag_id = key
+        for other in [k for k in self.pending if k[:2] == (incoming, channel_id)]:
+            # ids are u8, `other` is behind when distance is less than half of range
+            if self.max_lag < (frag_id - other[2]) & 0xff < 0x80:
+                self.drop(other)
+
+    def add(self, key, frag_idx, frag_amnt, chunk, now=None):
+        """returns whole message when all chunks of `key` are here"""
+        if now is None:
+            now = time.monotonic()
+        self.expire(now)
+        if frag_idx >= frag_amnt:
+            return None
+
+        fragment = self.pending.get(key)
+        if fragment is not None and len(fragment.chunks) != frag_amnt:
+            # frag_id was reused by other message
+            self.drop(key)
+            fragment = None
+        if fragment is None:
+            self.drop_lagging(key)
+            fragment = self.pending[key] = Fragment(frag_amnt, now)
 
-        acked = self.acks[msg_id]
-        if not acked:
-            self.acks[msg_id] = True
-        print(f'Ret acked: {not acked}')
-        return not acked
+        old = fragment.chunks[frag_idx]
+        if old is None:
+            fragment.received += 1
+        else:
+            fragment.size -= len(old)
+            self.buffered -= len(old)
+        fragment.chunks[frag_idx] = chunk
+        fragment.size += len(chunk)
+        self.buffered += len(chunk)
+        self.peak_buffered = max(self.peak_buffered, self.buffered)
+
+        if fragment.received == frag_amnt:
+            del self.pending[key]
+            self.buffered -= fragment.size
+            self.assembled += 1
+            latency = now - fragment.created
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+            return b''.join(fragment.chunks)
+
+        while self.pending and (
+            self.buffered > self.max_bytes or len(self.pending) > self.max_fragments
+        ):
+            self.drop(next(iter(self.pending)))
+        return None
+
+    def as_dict(self):
+        assembled = self.assembled or 1
+        return {
+            'pending': len(self.pending),
+            'assembled': self.assembled,
+            'dropped': self.dropped,
+            'buffered': self.buffered,
+            'peak_buffered': self.peak_buffered,
+            'avg_latency_ms': round(self.total_latency * 1000 / assembled, 3),
+            'max_latency_ms': round(self.max_latency * 1000, 3),
+        }
+
+
+class Session:
+    """transport state and decoded world of one game session, keyed by (server port, session_id)"""
+
+    def __init__(self, key, world=None):
+        self.key = key
+        self.trusted = False
+        self.encrypt = False
+        self.decrypt = False
+        # incoming -> {channel_id: Acks}
+        self.acks = {True: {}, False: {}}
+        self.fragments = FragmentReassembler()
+        self.world = World() if world is None else world
+
+
+def server_port(packet):
+    return packet.get('src_port' if packet['incoming'] else 'dst_port', 0)
+
+
+class BatchStats:
+    """
+    Packets decoded between two yields to event loop
+    """
+
+    def __init__(self):
+        self.batches = 0
+        self.packets = 0
+        self.total_time = 0.0
+        self.last_size = 0
+        self.last_time = 0.0
+        self.max_time = 0.0
+        self.queue_depth = 0
+        # dropped duplicated and retransmitted messages
+        self.duplicates = 0
+
+    def add(self, size, duration):
+        self.batches += 1
+        self.packets += size
+        self.total_time += duration
+        self.last_size = size
+        self.last_time = duration
+        self.max_time = max(self.max_time, duration)
+        self.queue_depth = GLOBAL['get_qsize']()
+
+    def as_dict(self):
+        batches = self.batches or 1
+        return {
+            'queue_depth': self.queue_depth,
+            'batch_size': self.last_size,
+            'avg_batch_size': round(self.packets / batches, 1),
+            'batch_ms': round(self.last_time * 1000, 3),
+            'avg_batch_ms': round(self.total_time * 1000 / batches, 3),
+            'max_batch_ms': round(self.max_time * 1000, 3),
+            'duplicates': self.duplicates,
+        }
+
+    def __str__(self):
+        return ' '.join(f'{k}={v}' for k, v in self.as_dict().items())
 
 
 class NetworkTransport:
     packet_num: int
     log = logging.getLogger('NetworkTransport')
+    BATCH_MAX = 256
+    BATCH_BUDGET = 0.002  # seconds
+    MAX_SESSIONS = 8
 
     def __init__(self, src, args):
-        self.encrypt = False
-        self.decrypt = False
-
         self.args = args
         self.replay = args.packets_file
 
-        self.session_ok = []
+        # state from before any session is known, first trusted session takes over its world
+        self.session = Session(None, GLOBAL['world'])
+        # session which world is active while UIs work
+        self.focus = self.session
+        # (server port, session_id) -> Session, least recently used first
+        self.sessions = OrderedDict()
+        self.max_sessions = self.MAX_SESSIONS
         self.src = src
-        self.acks_in = Acks('inbound')
-        self.acks_out = Acks('outbound')
-        self.fragmented = {True: {0: [], 1: [], 2: []}, False: {0: [], 1: [], 2: []}}
         self.log_path = None
         self.packet_log = None
+        # number of first packet from `src`, when replay was started in the middle of log
+        self.packet_offset = 0
         self.init_packet_log()
+        self.batch_max = self.BATCH_MAX
+        self.batch_budget = self.BATCH_BUDGET
+        self.stats = BatchStats()
+        GLOBAL['batch_stats'] = self.stats
+        GLOBAL['fragment_stats'] = self.fragments
+
+    @property
+    def encrypt(self):
+        return self.session.encrypt
+
+    @encrypt.setter
+    def encrypt(self, value):
+        self.session.encrypt = value
+
+    @property
+    def decrypt(self):
+        return self.session.decrypt
+
+    @decrypt.setter
+    def decrypt(self, value):
+        self.session.decrypt = value
+
+    @property
+    def acks(self):
+        return self.session.acks
+
+    @property
+    def fragments(self):
+        return self.session.fragments
 
     def init_packet_log(self):
-        if self.log_path and self.log_path.stat().st_size == 0:
-            if self.packet_log:
-                self.packet_log.close()
-            self.log_path.unlink()
-        self.log_path = pathlib.Path(datetime.datetime.now().strftime('packet_logs/%Y%m%d_%H%M.packet.log'))
+        if self.replay:
+            return
+        self.close_packet_log()
+        if self.close_packet_log not in GLOBAL['on_exit']:
+            GLOBAL['on_exit'].append(self.close_packet_log)
+        self.log_path = pathlib.Path(datetime.datetime.now().strftime('packet_logs/%Y%m%d_%H%M%S.packets'))
         if not self.log_path.parent.exists():
             self.log_path.parent.mkdir(exist_ok=True)
-        self.packet_log = self.log_path.open('w')
+        # sessions started within the same second
+        stem, num = self.log_path.stem, 0
+        while self.log_path.exists():
+            num += 1
+            self.log_path = self.log_path.with_name(f'{stem}_{num}.packets')
+        self.packet_log = PacketLogWriter(self.log_path, compression=self.args.log_compression)
+
+    def close_packet_log(self):
+        if not self.packet_log:
+            return
+        self.packet_log.close()
+        if self.packet_log.records == 0:
+            self.log_path.unlink()
+        self.packet_log = None
 
     async def run(self, limit=None):
         # packet -> {'data', 'incoming'}
-        self.packet_num = -1
+        self.packet_num = self.packet_offset - 1
         skip_num = self.args.skip
+        batch = 0
+        busy = 0.0
         async for packet in self.src:
             self.packet_num += 1
             if skip_num and skip_num > self.packet_num:
                 continue
 
             if self.packet_num % 500 == 0:
-                self.log.info(f'Packet: {self.packet_num}')
+                self.log.info(f'Packet: {self.packet_num} {self.stats}')
             if limit and self.packet_num >= limit:
                 break
+            t = time.perf_counter()
             # noinspection PyBroadException
             try:
                 self.process_packet(packet)
-                await asyncio.sleep(0)
             except Exception as e:
                 self.log.exception(f'When process_packet: Len: {packet["len"]} Num: {packet["num"]}')
                 with open('error.packet', 'wb') as f:
@@ -109,26 +365,24 @@ class NetworkTransport:
                 print('Exit 19')
                 if self.replay:
                     exit(19)
+            # source may wait for next packet, UIs and background tasks work with focused session then
+            self.activate(self.focus)
+            busy += time.perf_counter() - t
+            batch += 1
+            if batch >= self.batch_max or busy >= self.batch_budget:
+                # let UI and websockets work
+                self.stats.add(batch, busy)
+                batch = 0
+                busy = 0.0
+                await asyncio.sleep(0)
         print(f'All packets were read')
+        self.activate(self.focus)
+        self.close_packet_log()
         # await asyncio.sleep(300)
 
-    def bin_to_str(self, bytestring):
-        out = []
-        for b in bytestring:
-            s = hex(b)[2:]
-            if len(s) == 1:
-                s = '0' + s
-            out.append(s)
-        return ':'.join(out)
-
     def save_packet(self, packet):
-        if self.args.packets_file:
-            return
-        self.packet_log.write(
-            json.dumps({'incoming': packet['incoming'],
-            'data': self.bin_to_str( packet['data'])})
-        )
-        self.packet_log.write('\n')
+        if self.packet_log:
+            self.packet_log.write(packet)
 
     def process_packet(self, packet):
         self.save_packet(packet)
@@ -143,7 +397,8 @@ class NetworkTransport:
         if len(stream) < 3:
             self.log.warning(f'Skip packet. Length < 3')
             return
-        (conn, ) = struct.unpack('>H', stream[:2])
+        (conn, ) = U16BE.unpack_from(stream, 0)
+        rest = len(stream)
         if conn == 0:
             op = stream[2]
             if op in Z_SKIP:
@@ -152,268 +407,195 @@ class NetworkTransport:
             elif op == Z_HEARTBEAT:
                 assert len(stream) == 27
                 if len(stream) == 27:
-                    sess_id, = struct.unpack('<H', stream[25:])
-                    self.trust_session(sess_id)
+                    sess_id, = U16LE.unpack_from(stream, 25)
+                    self.trust_session(sess_id, server_port(packet))
                 return
             elif op == Z_INIT:
                 if len(stream) >= 7:
-                    sess_id, = struct.unpack('<H', stream[5:7])
-                    self.trust_session(sess_id)
-                    self.new_session()
+                    sess_id, = U16LE.unpack_from(stream, 5)
+                    self.new_session((server_port(packet), sess_id))
+                    # first reliable messages of raid may come before next heartbeat
+                    self.session.trusted = True
                 return
         else:
             ctx = {'pck_len': len(packet['data']), 'incoming': packet['incoming']}
 
-            b_cps, stream = split(stream, 6)
-            # print(f'Parse: {b_cps}')
-            (connection_id, packet_id, session_id) = struct.unpack('>HHH', b_cps)
-            if session_id not in self.session_ok:
-                self.log.info(f'Skip packet, no session: {session_id} vs {self.session_ok}')
+            view = memoryview(stream)
+            (connection_id, packet_id, session_id) = PACKET_HEADER.unpack_from(view, 0)
+            key = (server_port(packet), session_id)
+            session = self.sessions.get(key)
+            if session is None or not session.trusted:
+                self.log.info(f'Skip packet, no session: {key} vs {list(self.sessions)}')
                 self.log.info(self.curr_packet)
                 return
+            self.sessions.move_to_end(key)
+            self.activate(session)
             ctx.update({
                 'connection_id': connection_id,
                 'packet_id': packet_id,
                 'session_id': session_id,
             })
-            b_acks, stream = split(stream, 2 + 4 * 4)
-            if len(stream) == 0:
+            offset = PACKET_HEADER.size + ACKS_SIZE
+            if offset >= len(view):
                 return True
-            elif len(stream) < 2:
-                self.log.warning(f'Error message: {stream}')
+            elif len(view) - offset < 2:
+                self.log.warning(f'Error message: {bytes(view[offset:])}')
                 return True
 
-            for (msg_ok, msg) in self.get_next_message(stream, ctx):
-                if not msg_ok:
-                    stream = msg
-                elif msg.op_type == 147:  # ServerInit
-                    # self.new_session()
-                    pass
-        if len(stream) > 0:
+            messages = self.get_next_message(view, offset, ctx)
+            for (channel_id, buf, msg_offset, msg_len) in messages:
+                ctx['channel_id'] = channel_id
+                self.decode_messages(buf, msg_offset, msg_offset + msg_len, ctx)
+            rest = ctx['rest']
+        if rest > 0:
             # bprint(stream)
             self.log.warning(f'Cannot process packet: {self.packet_num} => {packet}')
             # exit(16)
 
-    def trust_session(self, sess_id):
-        if sess_id not in self.session_ok:
-            self.session_ok.append(sess_id)
-
-    def without_fragment(self, _id, fragments):
-        for fragment in fragments:
-            if fragment['frag_id'] == _id:
+    def decode_messages(self, buf, offset, end, ctx):
+        while end - offset > 3:
+            size, op_type = MSG_HEADER.unpack_from(buf, offset)
+            if op_type not in OPS.active:
+                # no decoder and no copy of content for ops nobody is subscribed to
+                if not OPS.skip(op_type):
+                    self.log.warning(f'Cannot process: <MSG:{op_type} MLEN: {size} PKT:{self.packet_num}>')
+                offset = min(offset + MSG_HEADER.size + size, end)
                 continue
-            yield fragment
-
-    def get_next_message(self, stream, ctx):
+            msg = MsgDecoder(self, ctx)
+            offset = msg.parse(buf, offset, end)
+
+    def trust_session(self, sess_id, server=0):
+        key = (server, sess_id)
+        session = self.sessions.get(key)
+        if session is None:
+            first = self.session.key is None
+            session = self.open_session(key, self.session.world if first else None)
+            if self.focus.key is None:
+                self.set_focus(session)
+        session.trusted = True
+
+    def open_session(self, key, world=None):
+        session = Session(key, world)
+        self.sessions.pop(key, None)
+        self.sessions[key] = session
+        while len(self.sessions) > self.max_sessions:
+            _, evicted = self.sessions.popitem(last=False)
+            self.log.warning(f'Drop session: {evicted.key}')
+            if evicted is self.focus:
+                self.set_focus(session)
+        return session
+
+    def activate(self, session):
+        """make world of `session` the one messages are decoded into"""
+        if session is not self.session:
+            self.session = session
+            activate_world(session.world)
+
+    def set_focus(self, session):
+        """session shown by UIs"""
+        self.focus = session
+        GLOBAL['fragment_stats'] = session.fragments
+        GLOBAL['changes'].mark_all()
+
+    def is_new_message(self, ctx, channel_id, msg_id, body):
+        """False for duplicated or retransmitted message, which was decoded already"""
+        channels = self.acks[ctx['incoming']]
+        acks = channels.get(channel_id)
+        if acks is None:
+            direction = 'inbound' if ctx['incoming'] else 'outbound'
+            acks = channels[channel_id] = Acks(f'{direction}_{channel_id}')
+        if acks.read_message(msg_id, zlib.crc32(body)):
+            return True
+        self.stats.duplicates += 1
+        return False
+
+    def get_next_message(self, view, offset, ctx):
+        """
+        Walks over all messages in datagram `view` starting at `offset`.
+
+        yields (channel_id, buffer, offset, length) for every block of messages ready to decode,
+        buffer is either datagram itself or assembled fragmented message.
+        Number of trailing bytes that weren't processed is saved into ctx['rest']
+        """
         # https://forum.unity.com/threads/binary-protocol-specification.417831/#post-3495130
-        if len(stream) == 0:
-            yield False, stream
-        channel_id = stream[0]
-        assert channel_id not in FRAGMENTED
-        # print(f'CHID: {channel_id}')
-        if channel_id == M_MSG_DELIMITER:
-            stream = self.extractMessageHeader(stream, ctx)
-            # channel_id + msg_len
-            channel_id = ctx['channel_id']
-            msg_len = ctx['msg_len']
-            self.log.debug(f'CTX: {ctx}')
-            assert msg_len <= len(stream), f'{msg_len} vs {len(stream)}'
-            # print(f'FF message: len={msg_len} stream len={len(stream)}')
-            stream, after = split(stream, msg_len)
-            order_id, stream = split_16(stream)
-            # 78084
-            # oid, stream = split_8(stream)
-
-            while True:
-                if len(stream) == 0:
-                    if after:
-                        yield from self.get_next_message(after, ctx)
-                        return
-                    else:
-                        yield False, stream
-                        return
-                inner_channel_id = stream[0]
-                if inner_channel_id in FRAGMENTED:
-                    # bprint(stream)
-                    stream = self.extractMessageHeader(stream, ctx)
-                    inner_msg_len = ctx['msg_len']
-                    fragm_stream, stream = split(stream, inner_msg_len)
-                    # print(f'IMSGLEN: {inner_msg_len} vs {len(stream)}')
-                    assert inner_msg_len <= len(fragm_stream)
-                    bfrag, fragm_stream = split(fragm_stream, 3)
-                    frag_id, frag_idx, frag_amnt = struct.unpack('>BBB', bfrag)
-
-                    fragment = self.get_fragment(ctx, frag_id, inner_channel_id)
-                    chunks = fragment['chunks']
-
-                    self.log.debug(f'FID: {frag_id} FIDX: {frag_idx} TOTAL: {frag_amnt} IN: {self.curr_packet["incoming"]} CHAN: {inner_channel_id}')
-                    # _, stream = split(stream, 4)
-
-                    if frag_idx in chunks:
-                        if False and chunks[frag_idx] != fragm_stream:
-                            self.log.warning(f'I: {chunks.keys()}')
-                            self.log.warning(f'FID: {frag_id} FIDX: {frag_idx} TOTAL: {frag_amnt}')
-                            self.log.warning(chunks[frag_idx])
-                            self.log.warning(fragm_stream)
-                            if self.replay and False:
-                                print('Exit 199')
-                                exit(199)
-
-                    chunks[frag_idx] = fragm_stream
-
-                    self.log.debug(f'{frag_idx}: ID: {frag_id} LEN: {len(fragment["chunks"])} VS {frag_amnt}/')
-                    if len(self.fragmented[ctx['incoming']]) > 0:
-                        self.log.debug(f'FRAGMENTED: {list(self.fragmented[ctx["incoming"]])}')
-
-                    if len(chunks) == frag_amnt: # or frag_idx == frag_amnt - 1:
-                        fragments = []
-                        for i in range(frag_amnt):
-                            fragments.append(chunks[i])
-
-                        bin_msg = b''.join(fragments)
-                        self.log.debug(f'Assemble {frag_id} Inner: {inner_channel_id} LEN: {len(bin_msg)}')
-                        # print(bin_msg)
-                        # bprint(bin_msg)
-                        while len(bin_msg) > 2:
-                            msg = MsgDecoder(self, ctx)
-                            bin_msg = msg.parse(bin_msg)
-                            self.log.debug(f'Processed message in fragmented. Remains: {len(bin_msg)}')
-                            yield True, msg
-                        # print(f'After parse: {bin_msg}')
-                        if bin_msg != b'' and len(bin_msg) > 3:
-                            print(f'BinRest: {bin_msg}')
-                            # print(self.curr_packet)
-                            print('Exit 15')
-                            if self.replay:
-                                exit(15)
-                        # assert bin_msg == b''
-                        # print(f'Msg: {msg.op_type}')
-                        yield True, msg
-                        chan_fragments = self.fragmented[ctx['incoming']][inner_channel_id]
-                        without = list(self.without_fragment(frag_id, chan_fragments))
-                        chan_fragments[:] = without
-                    else:
-                        yield False, stream
-                elif inner_channel_id == M_MSG_COMBINED:
-                    return
-                    _, stream = split_8(stream)
-                else:
-                    print(self.curr_packet)
-                    print(f'Inner channel id: {inner_channel_id}')
-                    msg = MsgDecoder(self, ctx)
-                    stream = msg.parse(stream)
-                    yield True, msg
-                    # print('Rest is: ')
-                    # bprint(stream)
-                    print('Exit 18')
-                    if self.replay:
-                        exit(18)
-
-                    inner_msg_len = ctx['msg_len']
-                    # print(f'Inner channel id: {inner_channel_id} / Rest len: {len(stream)}')
-                    if len(stream) == 0:
-                        yield False, stream
-                        return
-                    (msg_stream, stream) = split(stream, inner_msg_len)
-                    try:
-                        msg = MsgDecoder(self, ctx).parse(stream)
-                    except Exception as e:
-                        self.log.exception('MSG DECODER')
-                        print('Exit 13')
-                        exit(13)
-                    yield True, msg
-            print('Exit 14')
-            if self.replay:
-                exit(14)
-
-        elif channel_id == M_MSG_COMBINED:
-            print(self.curr_packet)
-            print('Exit 4')
-            if self.replay:
-                exit(4)
-            return False, stream
-
-        # 487 -> 256 : 231
-        if len(stream) > 2:
-            stream = self.extractMessageHeader(stream, ctx)
-            msg_len = ctx['msg_len']
-            if ctx['channel_id'] in FRAGMENTED:
+        end = len(view)
+        ctx['rest'] = end - offset
+        while end - offset > 2:
+            channel_id = view[offset]
+            assert channel_id not in FRAGMENTED
+            if channel_id == M_MSG_COMBINED:
+                print(self.curr_packet)
+                print('Exit 4')
                 if self.replay:
-                    print('FRAGMENTED')
-                    exit(111)
-            msg_stream, stream = split(stream, msg_len)
-            # print(f'Split msg stream: {len(msg_stream)} Rest: {len(stream)}')
-            if len(msg_stream) >= msg_len:
-                msg_id, msg_stream = split_16(msg_stream)
-                ordered_id, msg_stream = split_8(msg_stream)
-                ctx['msg_id'] = msg_id
-            while len(msg_stream) > 3:
-                msg = MsgDecoder(self, ctx)
-                # bprint(stream)
-                msg_stream = msg.parse(msg_stream)
-                # print(f'Decoded simple message [{self.packet_num}]: {msg.content}')
-                yield True, msg
-            # print('After all')
-            # bprint(msg_stream)
-            if len(stream) > 2:
-                # print(f'Recur into {stream}')
-                # bprint(stream)
-                yield from self.get_next_message(stream, ctx)
+                    exit(4)
+                return
+
+            channel_id, msg_len, offset = self.extractMessageHeader(view, offset, ctx)
+            self.log.debug(f'CTX: {ctx}')
+            if channel_id == M_MSG_DELIMITER:
+                block_end = offset + msg_len
+                assert block_end <= end, f'{msg_len} vs {end - offset}'
+                (order_id,) = U16BE.unpack_from(view, offset)
+                if self.is_new_message(ctx, channel_id, order_id, view[offset + 2 : block_end]):
+                    yield from self.get_delimited(view, offset + 2, block_end, ctx)
             else:
-                yield False, stream
-
-    def get_fragment(self, ctx, frag_id, inner_channel_id):
-        key = f'{ctx["incoming"]}_{inner_channel_id}_{frag_id}'
-        fragmented = self.fragmented[ctx['incoming']][inner_channel_id]
-        if len(fragmented) == 0:
-            fragment = {'frag_id': frag_id, 'chunks': {}}
-            fragmented.append(fragment)
-
-        elif len(fragmented) == 1:
-            fragment = fragmented[0]
-            if fragment['frag_id'] != frag_id:
-                self.log.debug(f'Got new fragment while previous is not finished: {frag_id} vs {fragment["frag_id"]}')
-                fragment = {'frag_id': frag_id, 'chunks': {}}
-                fragmented.append(fragment)
-        else:
-            fragment = None
-            for candidate in fragmented:
-                if candidate['frag_id'] == frag_id:
-                    fragment = candidate
-                    break
-            if not fragment:
-                fragment = {'frag_id': frag_id, 'chunks': {}}
-                fragmented.append(fragment)
-
-            for maybe_stale in list(fragmented):
-                stale_id = fragment['frag_id']
-                if abs(stale_id - frag_id) > 4:
-                    self.log.debug(f'Drop stale fragment: {key}')
-                    fragmented[:] = self.without_fragment(stale_id, fragmented)
-        return fragment
-
-    def extractMessageHeader(self, stream, ctx):
-        channel_id, stream = split_8(stream)
+                block_end = min(offset + msg_len, end)
+                is_new = True
+                if block_end - offset >= msg_len:
+                    (ctx['msg_id'],) = U16BE.unpack_from(view, offset)
+                    offset += 3  # msg_id + ordered_id
+                    is_new = self.is_new_message(ctx, channel_id, ctx['msg_id'], view[offset:block_end])
+                if is_new:
+                    yield channel_id, view, offset, block_end - offset
+            offset = block_end
+            ctx['rest'] = end - offset
+
+    def get_delimited(self, view, offset, end, ctx):
+        while offset < end:
+            inner_channel_id = view[offset]
+            if inner_channel_id in FRAGMENTED:
+                _, inner_msg_len, offset = self.extractMessageHeader(view, offset, ctx)
+                frag_end = offset + inner_msg_len
+                assert frag_end <= end
+                frag_id, frag_idx, frag_amnt = view[offset], view[offset + 1], view[offset + 2]
+
+                self.log.debug(f'FID: {frag_id} FIDX: {frag_idx} TOTAL: {frag_amnt} IN: {self.curr_packet["incoming"]} CHAN: {inner_channel_id}')
+                bin_msg = self.fragments.add(
+                    (ctx['incoming'], inner_channel_id, frag_id), frag_idx, frag_amnt, view[offset + 3 : frag_end]
+                )
+                offset = frag_end
+
+                if bin_msg is not None:
+                    self.log.debug(f'Assemble {frag_id} Inner: {inner_channel_id} LEN: {len(bin_msg)}')
+                    yield inner_channel_id, memoryview(bin_msg), 0, len(bin_msg)
+            elif inner_channel_id == M_MSG_COMBINED:
+                return
+            else:
+                print(self.curr_packet)
+                print(f'Inner channel id: {inner_channel_id}')
+                print('Exit 18')
+                if self.replay:
+                    exit(18)
+                return
+
+    def extractMessageHeader(self, view, offset, ctx):
+        """returns channel_id, msg_len and offset of message body"""
+        channel_id = view[offset]
         ctx['channel_id'] = channel_id
-        # if channel_id in FRAGMENTED:
-        #     print(f'Channel id: {channel_id}')
-        b_len = stream[0]
-        if b_len & 0x80:
-            b_len, stream = split(stream, 2)
-            (msg_len,) = struct.unpack('>H', b_len)
+        if view[offset + 1] & 0x80:
+            (msg_len,) = U16BE.unpack_from(view, offset + 1)
             msg_len &= 0x7fff  # reset high bit
-            # print(f'Good msg len: {msg_len}')
+            offset += 3
         else:
-            msg_len, stream = split_8(stream)
-            # print(f'One bit msg len: {msg_len}')
+            msg_len = view[offset + 1]
+            offset += 2
         ctx['msg_len'] = msg_len
-        return stream
+        return channel_id, msg_len, offset
 
-    def new_session(self):
+    def new_session(self, key=None):
         """Called when new game has started"""
-        self.log.warning('New session')
-        self.fragmented = {True: {0: [], 1: [], 2: []}, False: {0: [], 1: [], 2: []}}
-        clear_global()
-        self.session_ok = []
+        self.log.warning(f'New session: {key}')
+        self.activate(self.open_session(key))
+        self.set_focus(self.session)
         self.init_packet_log()
 
@@ -0,0 +1,89 @@
+"""
+Process pool for heavy blobs of spawn messages.
+
+Map loot and player inventories are parsed by pure functions in worker processes:
+raw bytes in, plain dicts out. Results are merged into decoder state on the event loop
+thread when they are ready, so position updates keep flowing during the initial burst.
+"""
+import asyncio
+import logging
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+from eft_cap.bin_helpers import ByteStream
+from eft_cap.loot import read_item, read_many_polymorph
+
+
+def parse_loot(loot_json):
+    """crates of map from compressed SUBWORLD_SPAWN blob"""
+    return read_many_polymorph(ByteStream(zlib.decompress(loot_json)), {})
+
+
+def parse_inventory(inv_bin):
+    """(inventory, total price) from serialized inventory of player"""
+    top_ctx = {'total_price': 0}
+    inventory = read_item(ByteStream(inv_bin), ctx={'top': top_ctx})
+    return inventory, top_ctx['total_price']
+
+
+class Offload:
+    """
+    Runs parsers in process pool, `merge(result)` callbacks are called on the loop thread.
+    `wait` blocks until all jobs are merged, decoder defers work which needs results instead.
+    """
+    log = logging.getLogger('Offload')
+
+    def __init__(self, workers=None, loop=None):
+        self.executor = ProcessPoolExecutor(workers)
+        self.loop = loop or asyncio.get_event_loop()
+        # future -> merge callback, until result is merged
+        self.jobs = {}
+        self.submitted = 0
+        self.waited = 0
+        self.failed = 0
+
+    def __len__(self):
+        return len(self.jobs)
+
+    def submit(self, merge, fn, *args, done=None):
+        """`done()` is called after `merge(result)` and when job has failed"""
+        future = self.executor.submit(fn, *args)
+        self.jobs[future] = (merge, done)
+        self.submitted += 1
+        future.add_done_callback(lambda f: self.loop.call_soon_threadsafe(self.merge, f))
+        return future
+
+    def merge(self, future):
+        callbacks = self.jobs.pop(future, None)
+        if callbacks is None:
+            # merged by `wait` already
+            return
+        merge, done = callbacks
+        try:
+            try:
+                result = future.result()
+            except Exception:
+                self.failed += 1
+                self.log.exception('Offloaded parse failed')
+                return
+            merge(result)
+        finally:
+            if done is not None:
+                done()
+
+    def wait(self):
+        """block until all submitted jobs are done and merge them in order of submit"""
+        for future in list(self.jobs):
+            if not future.done():
+                self.waited += 1
+            self.merge(future)
+
+    def shutdown(self):
+        # cancel_futures of shutdown needs python 3.9
+        for future in list(self.jobs):
+            future.cancel()
+        self.jobs.clear()
+        self.executor.shutdown(wait=False)
+
+    def as_dict(self):
+        return {'pending': len(self.jobs), 'submitted': self.submitted, 'waited': self.waited, 'failed': self.failed}
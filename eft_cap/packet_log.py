@@ -0,0 +1,185 @@
+"""
+Binary packet log.
+
+File is MAGIC followed by blocks, every block is BLOCK header and (maybe compressed) records.
+Record is RECORD header and raw payload.
+Records are packed on decoder thread, compression and writes are done by background thread.
+"""
+import logging
+import mmap
+import pathlib
+import queue
+import struct
+import threading
+import time
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+log = logging.getLogger('packet_log')
+
+MAGIC = b'EFTCAP\x01\x00'
+BLOCK = struct.Struct('<BII')  # codec, raw length, stored length
+RECORD = struct.Struct('<dBHHHI')  # timestamp, incoming, src_port, dst_port, session, payload length
+SESSION = struct.Struct('>H')
+
+CODEC_NONE = 0
+CODEC_ZLIB = 1
+CODEC_ZSTD = 2
+CODECS = {'none': CODEC_NONE, 'zlib': CODEC_ZLIB, 'zstd': CODEC_ZSTD}
+
+BLOCK_SIZE = 256 * 1024
+
+
+def packet_session(data):
+    """session_id of unity transport packet, 0 for system packets"""
+    if len(data) < 6 or data[0] == data[1] == 0:
+        return 0
+    return SESSION.unpack_from(data, 4)[0]
+
+
+def compress(codec, raw):
+    if codec == CODEC_ZLIB:
+        return zlib.compress(raw, 1)
+    elif codec == CODEC_ZSTD:
+        return zstandard.ZstdCompressor(level=1).compress(raw)
+    return raw
+
+
+def decompress(codec, stored):
+    if codec == CODEC_ZLIB:
+        return zlib.decompress(stored)
+    elif codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise RuntimeError('zstandard is required to read this packet log')
+        return zstandard.ZstdDecompressor().decompress(stored)
+    return stored
+
+
+class PacketLogWriter:
+    log = logging.getLogger('PacketLogWriter')
+
+    def __init__(self, path, compression='zlib', block_size=BLOCK_SIZE):
+        if compression == 'zstd' and zstandard is None:
+            self.log.warning('zstandard is not installed, fallback to zlib')
+            compression = 'zlib'
+        self.path = pathlib.Path(path)
+        self.codec = CODECS[compression]
+        self.block_size = block_size
+        self.block = bytearray()
+        self.records = 0
+        self.queue = queue.Queue(maxsize=64)
+        self.f = self.path.open('wb', buffering=1024 * 1024)
+        self.f.write(MAGIC)
+        self.thread = threading.Thread(target=self.writer, name=f'writer:{self.path.name}', daemon=True)
+        self.thread.start()
+
+    def write(self, packet, ts=None):
+        data = packet['data']
+        self.block += RECORD.pack(
+            time.time() if ts is None else ts,
+            1 if packet['incoming'] else 0,
+            packet.get('src_port', 0),
+            packet.get('dst_port', 0),
+            packet_session(data),
+            len(data),
+        )
+        self.block += data
+        self.records += 1
+        if len(self.block) >= self.block_size:
+            self.flush()
+
+    def flush(self):
+        if self.block:
+            self.queue.put(bytes(self.block))
+            self.block = bytearray()
+
+    def writer(self):
+        while True:
+            raw = self.queue.get()
+            if raw is None:
+                break
+            stored = compress(self.codec, raw)
+            self.f.write(BLOCK.pack(self.codec, len(raw), len(stored)))
+            self.f.write(stored)
+        self.f.close()
+
+    def close(self):
+        if not self.thread.is_alive():
+            return
+        self.flush()
+        self.queue.put(None)
+        self.thread.join()
+
+
+def is_packet_log(path):
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def open_mmap(path):
+    """read-only mmap of packet log"""
+    with open(path, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if mm[: len(MAGIC)] != MAGIC:
+        mm.close()
+        raise ValueError(f'Not a packet log: {path}')
+    return mm
+
+
+def read_block(buf, offset):
+    """returns (records bytes, offset of next block) or (None, offset) at the end of log"""
+    if offset + BLOCK.size > len(buf):
+        return None, offset
+    codec, raw_len, stored_len = BLOCK.unpack_from(buf, offset)
+    start = offset + BLOCK.size
+    if start + stored_len > len(buf):
+        log.warning(f'Truncated block at {offset}')
+        return None, offset
+    return decompress(codec, buf[start : start + stored_len]), start + stored_len
+
+
+def iter_blocks(buf):
+    """yields (offset of block, records bytes)"""
+    offset = len(MAGIC)
+    while True:
+        raw, next_offset = read_block(buf, offset)
+        if raw is None:
+            return
+        yield offset, raw
+        offset = next_offset
+
+
+def read_record(raw, offset):
+    """returns (packet dict, offset of next record)"""
+    ts, incoming, src_port, dst_port, session, size = RECORD.unpack_from(raw, offset)
+    start = offset + RECORD.size
+    return {
+        'incoming': incoming == 1,
+        'data': bytes(raw[start : start + size]),
+        'src_port': src_port,
+        'dst_port': dst_port,
+        'session': session,
+        'ts': ts,
+    }, start + size
+
+
+def iter_records(raw, offset=0):
+    """yields (offset in block, packet dict)"""
+    while offset < len(raw):
+        packet, next_offset = read_record(raw, offset)
+        yield offset, packet
+        offset = next_offset
+
+
+def read_packet_log(path):
+    mm = open_mmap(path)
+    try:
+        for _, raw in iter_blocks(mm):
+            for _, packet in iter_records(raw):
+                yield packet
+    finally:
+        mm.close()
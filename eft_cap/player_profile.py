@@ -0,0 +1,110 @@
+"""
+Targeted reading of player profiles.
+
+Profile is zlib compressed JSON of hundreds of KB (Encyclopedia, Skills, Quests, Stats...),
+UI needs only few fields, so profile is decompressed in chunks only until they were found
+and only their values are parsed.
+"""
+import json
+import re
+import zlib
+
+# top level fields UI needs, `Info` is an object with Nickname, Level, Side, GroupId
+FIELDS = ('aid', 'Info', 'SurvivorClass')
+CHUNK = 1024  # compressed bytes per step
+# longest key with quotes and spaces around colon, key split between chunks is searched again
+MAX_KEY = 64
+
+_decoder = json.JSONDecoder()
+_patterns = {}
+_ws = re.compile(r'[ \t\n\r]*')
+
+
+def key_pattern(key):
+    if key not in _patterns:
+        _patterns[key] = re.compile(rb'"%s"\s*:\s*' % re.escape(key.encode()))
+    return _patterns[key]
+
+
+class TopLevel:
+    """
+    Walks members of top level object, only as far as candidate keys, to tell them from nested ones.
+    Walked part is decoded as latin-1, so offsets are the same as in bytes.
+    """
+
+    def __init__(self):
+        # offset of next member, None until opening brace is seen
+        self.pos = None
+
+    def is_member(self, buf, offset):
+        """True when `offset` is start of top level key, whole buffer before it is decompressed"""
+        if self.pos is None:
+            start = _ws.match(buf[:offset].decode('latin-1')).end()
+            if buf[start:start + 1] != b'{':
+                return False
+            self.pos = start + 1
+        base = self.pos
+        text = buf[base:offset].decode('latin-1')
+        pos = 0
+        while True:
+            pos = _ws.match(text, pos).end()
+            if pos >= len(text):
+                return base + pos == offset
+            try:
+                _, pos = _decoder.raw_decode(text, pos)  # key
+                pos = _ws.match(text, pos).end()
+                if text[pos:pos + 1] != ':':
+                    return False
+                # member which doesn't end before `offset` has the candidate inside
+                _, pos = _decoder.raw_decode(text, _ws.match(text, pos + 1).end())
+            except json.JSONDecodeError:
+                return False
+            pos = _ws.match(text, pos).end()
+            if text[pos:pos + 1] == ',':
+                pos += 1
+            self.pos = base + pos
+
+
+def read_fields(prof_zip, fields=FIELDS, chunk=CHUNK):
+    """
+    {key: value} of top level keys in `fields`, keys which weren't found are absent.
+    Nested keys with the same name are skipped.
+    """
+    z = zlib.decompressobj()
+    buf = b''
+    found = {}
+    starts = dict.fromkeys(fields, 0)
+    top = TopLevel()
+    offset = 0
+    while len(found) < len(fields):
+        end = offset >= len(prof_zip)
+        if end:
+            buf += z.flush()
+        else:
+            buf += z.decompress(prof_zip[offset:offset + chunk])
+            offset += chunk
+        for key in fields:
+            if key in found:
+                continue
+            while True:
+                match = key_pattern(key).search(buf, starts[key])
+                if match is None:
+                    starts[key] = max(starts[key], len(buf) - MAX_KEY)
+                    break
+                if not top.is_member(buf, match.start()):
+                    starts[key] = match.end()
+                    continue
+                starts[key] = match.start()
+                text = buf[match.end():].decode('utf-8', 'replace')
+                try:
+                    value, size = _decoder.raw_decode(text)
+                except json.JSONDecodeError:
+                    # value isn't decompressed completely yet
+                    break
+                # number at the end of buffer may continue in next chunk
+                if size < len(text) or end:
+                    found[key] = value
+                break
+        if end:
+            break
+    return found
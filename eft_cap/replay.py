@@ -0,0 +1,214 @@
+"""
+Random access replay of binary packet logs.
+
+Log is memory-mapped, sidecar index `<log>.idx` maps packet number to (block offset, record offset)
+and keeps packet numbers of session starts (Z_INIT) and SERVER_INIT messages.
+Index is rebuilt when log size or mtime doesn't match.
+"""
+import argparse
+import bisect
+import logging
+import os
+import pathlib
+import struct
+from array import array
+
+from eft_cap.packet_log import iter_blocks, iter_records, open_mmap, read_block, read_record
+
+log = logging.getLogger('replay')
+
+INDEX_MAGIC = b'EFTIDX\x01\x00'
+# log size, log mtime_ns, packets, sessions, server inits
+INDEX_HEADER = struct.Struct('<QQQQQ')
+
+
+def index_path(path):
+    return pathlib.Path(f'{path}.idx')
+
+
+class MarkerTransport:
+    """
+    Runs transport framing over packets without decoding messages
+    to find session starts and SERVER_INIT messages
+    """
+
+    def __init__(self):
+        from eft_cap.msg_level import GLOBAL, MSG_HEADER, SERVER_INIT
+        from eft_cap.network_base import NetworkTransport
+
+        header, server_init = MSG_HEADER, SERVER_INIT
+        markers = self
+
+        class _Transport(NetworkTransport):
+            def init_packet_log(self):
+                pass
+
+            def new_session(self, key=None):
+                self.session = self.open_session(key)
+                markers.sessions.append(self.packet_num)
+
+            def activate(self, session):
+                # decoder state in GLOBAL is not touched
+                self.session = session
+
+            def set_focus(self, session):
+                self.focus = session
+
+            def decode_messages(self, buf, offset, end, ctx):
+                while end - offset > 3:
+                    length, op_type = header.unpack_from(buf, offset)
+                    if op_type == server_init:
+                        markers.server_inits.append(self.packet_num)
+                    offset = min(offset + header.size + length, end)
+
+        self.sessions = array('Q')
+        self.server_inits = array('Q')
+        # don't replace stats of real transport
+        batch_stats, fragment_stats = GLOBAL.get('batch_stats'), GLOBAL.get('fragment_stats')
+        self.transport = _Transport(None, argparse.Namespace(packets_file=None, skip=None))
+        GLOBAL['batch_stats'], GLOBAL['fragment_stats'] = batch_stats, fragment_stats
+        self.transport.log = logging.getLogger('MarkerTransport')
+        self.transport.log.setLevel(logging.ERROR)
+
+    def feed(self, num, packet):
+        self.transport.packet_num = num
+        # noinspection PyBroadException
+        try:
+            self.transport.process_packet(packet)
+        except Exception:
+            pass
+
+
+class ReplayIndex:
+    def __init__(self, blocks, records, sessions, server_inits):
+        self.blocks = blocks
+        self.records = records
+        self.sessions = sessions
+        self.server_inits = server_inits
+
+    def __len__(self):
+        return len(self.blocks)
+
+    @classmethod
+    def build(cls, buf):
+        blocks, records = array('Q'), array('I')
+        markers = MarkerTransport()
+        for block_offset, raw in iter_blocks(buf):
+            for record_offset, packet in iter_records(raw):
+                markers.feed(len(blocks), packet)
+                blocks.append(block_offset)
+                records.append(record_offset)
+        return cls(blocks, records, markers.sessions, markers.server_inits)
+
+    @staticmethod
+    def stamp(path):
+        st = os.stat(path)
+        return st.st_size, st.st_mtime_ns
+
+    def save(self, path, stamp):
+        with open(path, 'wb') as f:
+            f.write(INDEX_MAGIC)
+            f.write(
+                INDEX_HEADER.pack(
+                    *stamp, len(self.blocks), len(self.sessions), len(self.server_inits)
+                )
+            )
+            for arr in (self.blocks, self.records, self.sessions, self.server_inits):
+                arr.tofile(f)
+
+    @classmethod
+    def load(cls, path, stamp):
+        """returns None when index is missing or stale"""
+        try:
+            f = open(path, 'rb')
+        except FileNotFoundError:
+            return None
+        with f:
+            if f.read(len(INDEX_MAGIC)) != INDEX_MAGIC:
+                return None
+            header = f.read(INDEX_HEADER.size)
+            if len(header) < INDEX_HEADER.size:
+                return None
+            size, mtime, packets, sessions, server_inits = INDEX_HEADER.unpack(header)
+            if (size, mtime) != stamp:
+                return None
+            out = []
+            for code, num in (('Q', packets), ('I', packets), ('Q', sessions), ('Q', server_inits)):
+                arr = array(code)
+                arr.fromfile(f, num)
+                out.append(arr)
+            return cls(*out)
+
+    @classmethod
+    def for_log(cls, path, buf):
+        stamp = cls.stamp(path)
+        idx_path = index_path(path)
+        index = cls.load(idx_path, stamp)
+        if index is None:
+            log.warning(f'Build index for {path}')
+            index = cls.build(buf)
+            try:
+                index.save(idx_path, stamp)
+            except OSError:
+                log.exception(f'Cannot save index: {idx_path}')
+        return index
+
+
+class Replay:
+    def __init__(self, path):
+        self.path = path
+        self.mm = open_mmap(path)
+        self.index = ReplayIndex.for_log(path, self.mm)
+        self.block_offset = None
+        self.block = None
+
+    def __len__(self):
+        return len(self.index)
+
+    def read_block(self, offset):
+        if offset != self.block_offset:
+            self.block, _ = read_block(self.mm, offset)
+            self.block_offset = offset
+        return self.block
+
+    def packet(self, num):
+        raw = self.read_block(self.index.blocks[num])
+        return read_record(raw, self.index.records[num])[0]
+
+    def iter_from(self, start=0, stop=None):
+        if stop is None or stop > len(self):
+            stop = len(self)
+        blocks, records = self.index.blocks, self.index.records
+        for num in range(start, stop):
+            yield read_record(self.read_block(blocks[num]), records[num])[0]
+
+    def session_start(self, num):
+        """packet number of last session start at or before `num`"""
+        idx = bisect.bisect_right(self.index.sessions, num)
+        return self.index.sessions[idx - 1] if idx else 0
+
+    def close(self):
+        self.block = None
+        self.mm.close()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Build index and show markers of packet log')
+    parser.add_argument('packets_file')
+    parser.add_argument('--rebuild', action='store_true')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.rebuild:
+        index_path(args.packets_file).unlink(missing_ok=True)
+    replay = Replay(args.packets_file)
+    print(f'Packets: {len(replay)}')
+    print(f'Sessions: {list(replay.index.sessions)}')
+    print(f'SERVER_INIT: {list(replay.index.server_inits)}')
+    replay.close()
+
+
+if __name__ == '__main__':
+    main()
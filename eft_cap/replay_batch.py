@@ -0,0 +1,188 @@
+"""
+Batch replay of packet log corpora.
+
+Every log is replayed in a worker process by headless transport: no UI, no packet log,
+no pacing. Workers report per-file results which are aggregated into one table:
+packets, decoded messages, decode errors by op_type, heavy messages and wall time.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import pathlib
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from eft_cap.msg_level import GLOBAL, OPS, DecodeStats, World, activate_world, clear_global
+from eft_cap.network_base import NetworkTransport
+from eft_cap.packet_log import is_packet_log, read_packet_log
+
+log = logging.getLogger('replay_batch')
+
+PATTERN = '*.packets'
+
+
+class HeadlessTransport(NetworkTransport):
+    """replays without UI and never writes packet log"""
+
+    def __init__(self, src, args):
+        super().__init__(src, args)
+        self.processed = 0
+
+    def init_packet_log(self):
+        pass
+
+    def save_packet(self, packet):
+        pass
+
+    def process_packet(self, packet):
+        self.processed += 1
+        super().process_packet(packet)
+
+
+def iter_packets(path):
+    if is_packet_log(path):
+        return read_packet_log(path)
+    # json lines logs, main pulls UI modules in so it's imported only for them
+    from eft_cap.main import read_packets
+    return read_packets(str(path))
+
+
+async def from_path(path):
+    for packet in iter_packets(path):
+        yield packet
+
+
+def reset_state():
+    """fresh decoder state, worker replays many logs one by one"""
+    activate_world(World())
+    clear_global()
+    GLOBAL['offload'] = None
+    GLOBAL['lazy_players'] = False
+    GLOBAL['decode_stats'] = DecodeStats()
+    OPS.reset()
+
+
+def replay_file(path, limit=None, skip_ops=()):
+    """replay one log in this process, `skip_ops` aren't decoded, returns dict of results"""
+    reset_state()
+    OPS.unsubscribe(*skip_ops)
+    args = argparse.Namespace(packets_file=str(path), skip=None)
+    t = time.perf_counter()
+    transport = HeadlessTransport(from_path(path), args)
+    failed = None
+    try:
+        asyncio.run(transport.run(limit))
+    except SystemExit as e:
+        # replay mode exits on broken packets
+        failed = f'exit {e.code}'
+    except Exception as e:
+        log.exception(f'While replay: {path}')
+        failed = repr(e)
+    return {
+        'file': str(path),
+        'packets': transport.processed,
+        **GLOBAL['decode_stats'].as_dict(),
+        'duplicates': transport.stats.duplicates,
+        'ops': OPS.as_dict()['ops'],
+        'wall_s': round(time.perf_counter() - t, 3),
+        'failed': failed,
+    }
+
+
+def init_worker(level):
+    logging.basicConfig(level=level, format='%(asctime)s [%(levelname)s] %(name)s: %(message)s')
+
+
+def collect(paths, pattern=PATTERN):
+    """log files of `paths`, directories are searched recursively with `pattern`"""
+    files = []
+    for path in map(pathlib.Path, paths):
+        if path.is_dir():
+            files.extend(sorted(path.rglob(pattern)))
+        else:
+            files.append(path)
+    return files
+
+
+def run_batch(files, workers=None, limit=None, skip_ops=(), level=logging.ERROR, on_result=None):
+    """replay `files` in process pool, results are in order of `files`"""
+    results = {}
+    with ProcessPoolExecutor(workers, initializer=init_worker, initargs=(level,)) as pool:
+        jobs = {pool.submit(replay_file, path, limit, skip_ops): path for path in files}
+        for job in as_completed(jobs):
+            path = jobs[job]
+            try:
+                result = job.result()
+            except Exception as e:
+                # worker died
+                result = {'file': str(path), 'failed': repr(e)}
+            results[path] = result
+            if on_result:
+                on_result(result)
+    return [results[path] for path in files]
+
+
+def summarize(results):
+    errors = Counter()
+    for r in results:
+        errors.update({int(k): v for k, v in r.get('errors', {}).items()})
+    return {
+        'files': len(results),
+        'failed': sum(1 for r in results if r.get('failed')),
+        'packets': sum(r.get('packets', 0) for r in results),
+        'messages': sum(r.get('messages', 0) for r in results),
+        'errors': dict(sorted(errors.items())),
+        'heavy': sum(r.get('heavy', 0) for r in results),
+        'wall_s': round(sum(r.get('wall_s', 0) for r in results), 3),
+    }
+
+
+def format_result(r):
+    if 'packets' not in r:
+        return f'{r["file"]}: FAILED {r["failed"]}'
+    errors = ' '.join(f'{op}:{n}' for op, n in sorted(r['errors'].items())) or '-'
+    line = (
+        f'{r["file"]}: packets={r["packets"]} messages={r["messages"]} '
+        f'errors={errors} heavy={r["heavy"]} wall={r["wall_s"]}s'
+    )
+    if r['failed']:
+        line += f' FAILED {r["failed"]}'
+    return line
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Replay packet logs in process pool and report decode errors')
+    parser.add_argument('paths', nargs='+', help='packet logs or directories with them')
+    parser.add_argument('--pattern', default=PATTERN, help='glob of logs in directories')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--limit', type=int, default=None, help='max packets of every log')
+    parser.add_argument('--skip-ops', default='', help='comma separated ops which are not decoded, e.g. SUBWORLD_SPAWN')
+    parser.add_argument('--json', type=pathlib.Path, default=None, help='write results to json file')
+    parser.add_argument('--log-level', default='ERROR')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    files = collect(args.paths, args.pattern)
+    if not files:
+        print('No packet logs')
+        return 1
+    t = time.perf_counter()
+    results = run_batch(
+        files, args.workers, args.limit, skip_ops=[op for op in args.skip_ops.split(',') if op],
+        level=args.log_level.upper(),
+        on_result=lambda r: print(format_result(r), flush=True),
+    )
+    total = summarize(results)
+    total['elapsed_s'] = round(time.perf_counter() - t, 3)
+    print(f'Total: {" ".join(f"{k}={v}" for k, v in total.items())}')
+    if args.json:
+        args.json.write_text(json.dumps({'total': total, 'files': results}, indent=2), encoding='utf8')
+    return 1 if total['failed'] or total['errors'] else 0
+
+
+if __name__ == '__main__':
+    exit(main())
@@ -0,0 +1,173 @@
+"""
+Single producer / single consumer ring buffer in shared memory.
+
+Capture process writes length-prefixed packet records, decoder reads them without pickling.
+Positions are monotonic byte counters, so `write_pos - read_pos` is always the fill level.
+Consumer sets sleeping flag before it waits, producer wakes it up through a pipe only when the flag is set.
+"""
+import asyncio
+import logging
+import struct
+from multiprocessing import Pipe
+from multiprocessing.shared_memory import SharedMemory
+
+# write_pos, read_pos, written records, read records, dropped records, consumer is sleeping
+HEADER = struct.Struct('<QQQQQQ')
+W_POS, R_POS, WRITTEN, READ, DROPPED, SLEEPING = range(0, HEADER.size, 8)
+U64 = struct.Struct('<Q')
+# payload length, incoming, src_port, dst_port
+RECORD = struct.Struct('<IBHH')
+
+DEFAULT_CAPACITY = 16 * 1024 * 1024
+
+
+class PacketRing:
+    log = logging.getLogger('PacketRing')
+
+    def __init__(self, shm: SharedMemory, capacity, reader, writer):
+        self.shm = shm
+        self.buf = shm.buf
+        self.capacity = capacity
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    def create(cls, capacity=DEFAULT_CAPACITY):
+        shm = SharedMemory(create=True, size=HEADER.size + capacity)
+        shm.buf[: HEADER.size] = bytes(HEADER.size)
+        reader, writer = Pipe(duplex=False)
+        return cls(shm, capacity, reader, writer)
+
+    def __getstate__(self):
+        return {
+            'name': self.shm.name,
+            'capacity': self.capacity,
+            'reader': self.reader,
+            'writer': self.writer,
+        }
+
+    def __setstate__(self, state):
+        shm = SharedMemory(name=state['name'])
+        self.__init__(shm, state['capacity'], state['reader'], state['writer'])
+
+    def get_field(self, offset):
+        return U64.unpack_from(self.buf, offset)[0]
+
+    def set_field(self, offset, value):
+        U64.pack_into(self.buf, offset, value)
+
+    def copy_in(self, pos, data):
+        start = pos % self.capacity
+        first = min(len(data), self.capacity - start)
+        self.buf[HEADER.size + start : HEADER.size + start + first] = data[:first]
+        if first < len(data):
+            rest = len(data) - first
+            self.buf[HEADER.size : HEADER.size + rest] = data[first:]
+
+    def copy_out(self, pos, size):
+        start = pos % self.capacity
+        first = min(size, self.capacity - start)
+        out = bytes(self.buf[HEADER.size + start : HEADER.size + start + first])
+        if first < size:
+            out += bytes(self.buf[HEADER.size : HEADER.size + size - first])
+        return out
+
+    def put_nowait(self, packet):
+        """
+        producer side, same contract as `Queue.put_nowait` with packet dict.
+        Packet is dropped (and counted) when ring is full
+        """
+        data = packet['data']
+        need = RECORD.size + len(data)
+        write_pos = self.get_field(W_POS)
+        read_pos = self.get_field(R_POS)
+        if need > self.capacity - (write_pos - read_pos):
+            self.set_field(DROPPED, self.get_field(DROPPED) + 1)
+            return False
+
+        record = RECORD.pack(
+            len(data),
+            1 if packet['incoming'] else 0,
+            packet.get('src_port', 0),
+            packet.get('dst_port', 0),
+        )
+        self.copy_in(write_pos, record)
+        self.copy_in(write_pos + RECORD.size, data)
+        self.set_field(WRITTEN, self.get_field(WRITTEN) + 1)
+        self.set_field(W_POS, write_pos + need)
+        # flag is read after write_pos is published, consumer re-checks write_pos after it sets flag
+        if self.get_field(SLEEPING):
+            self.set_field(SLEEPING, 0)
+            self.writer.send_bytes(b'\x01')
+        return True
+
+    def get(self):
+        """consumer side, returns packet dict or None when ring is empty"""
+        read_pos = self.get_field(R_POS)
+        if read_pos == self.get_field(W_POS):
+            return None
+        size, incoming, src_port, dst_port = RECORD.unpack(self.copy_out(read_pos, RECORD.size))
+        data = self.copy_out(read_pos + RECORD.size, size)
+        self.set_field(READ, self.get_field(READ) + 1)
+        self.set_field(R_POS, read_pos + RECORD.size + size)
+        return {
+            'incoming': incoming == 1,
+            'data': data,
+            'src_port': src_port,
+            'dst_port': dst_port,
+        }
+
+    def get_batch(self, max_size):
+        """consumer side, drain up to `max_size` packets"""
+        out = []
+        while len(out) < max_size:
+            packet = self.get()
+            if packet is None:
+                break
+            out.append(packet)
+        return out
+
+    def qsize(self):
+        return self.get_field(WRITTEN) - self.get_field(READ)
+
+    def fill(self):
+        return (self.get_field(W_POS) - self.get_field(R_POS)) / self.capacity
+
+    @property
+    def dropped(self):
+        return self.get_field(DROPPED)
+
+    def drain_wakeups(self):
+        while self.reader.poll():
+            self.reader.recv_bytes()
+
+    async def wait(self, timeout=1.0):
+        """wait until producer writes into ring or timeout"""
+        self.set_field(SLEEPING, 1)
+        if self.get_field(R_POS) != self.get_field(W_POS):
+            # written after consumer has seen empty ring, before flag was set
+            self.set_field(SLEEPING, 0)
+            return
+        loop = asyncio.get_event_loop()
+        try:
+            fd = self.reader.fileno()
+            fut = loop.create_future()
+            loop.add_reader(fd, lambda: fut.done() or fut.set_result(None))
+        except NotImplementedError:
+            # proactor loop on windows cannot watch pipes
+            await loop.run_in_executor(None, self.reader.poll, timeout)
+        else:
+            try:
+                await asyncio.wait_for(fut, timeout)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                loop.remove_reader(fd)
+        self.set_field(SLEEPING, 0)
+        self.drain_wakeups()
+
+    def close(self, unlink=False):
+        self.buf = None
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
@@ -0,0 +1,61 @@
+"""
+Sorted views over item dicts, maintained incrementally.
+"""
+import bisect
+
+
+class SortedView:
+    """
+    Items by id ordered by `key(item)`, ties are ordered by id.
+    Single item changes are bisect searches, iteration yields items in order,
+    so reading top-k doesn't need a sort.
+    """
+
+    def __init__(self, key):
+        self.key = key
+        self.items = {}
+        # id -> (key, id) entry of `order`
+        self.entries = {}
+        self.order = []
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, _id):
+        return _id in self.items
+
+    def __iter__(self):
+        items = self.items
+        for _, _id in self.order:
+            yield items[_id]
+
+    def update(self, _id, item):
+        """insert item or move it after its key has changed"""
+        entry = (self.key(item), _id)
+        self.items[_id] = item
+        old = self.entries.get(_id)
+        if old == entry:
+            return
+        if old is not None:
+            del self.order[bisect.bisect_left(self.order, old)]
+        bisect.insort(self.order, entry)
+        self.entries[_id] = entry
+
+    def remove(self, _id):
+        old = self.entries.pop(_id, None)
+        if old is None:
+            return
+        del self.items[_id]
+        del self.order[bisect.bisect_left(self.order, old)]
+
+    def refresh(self, ids):
+        """re-sort items with `ids` after their keys have changed"""
+        for _id in ids:
+            if _id in self.items:
+                self.update(_id, self.items[_id])
+
+    def rebuild(self, items):
+        """replace content with `items` dict, cheaper than `update` for many items"""
+        self.items = dict(items)
+        self.order = sorted((self.key(item), _id) for _id, item in self.items.items())
+        self.entries = {entry[1]: entry for entry in self.order}
@@ -0,0 +1,78 @@
+"""
+Spatial index over loot positions.
+"""
+import numpy as np
+from scipy.spatial import cKDTree
+
+
+class SpatialIndex:
+    """
+    KD-tree over item positions by id.
+    Tree is rebuilt lazily on first query after items were added or removed.
+    """
+
+    def __init__(self):
+        self.positions = {}
+        self.ids = []
+        # (N, 3) positions in order of `ids`
+        self.points = np.empty((0, 3), np.float64)
+        self.tree = None
+        self.dirty = False
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __contains__(self, _id):
+        return _id in self.positions
+
+    def add(self, _id, pos):
+        self.positions[_id] = pos
+        self.dirty = True
+
+    def remove(self, _id):
+        if self.positions.pop(_id, None) is not None:
+            self.dirty = True
+
+    def rebuild(self):
+        self.ids = list(self.positions)
+        self.points = np.array([self.positions[_id] for _id in self.ids], np.float64).reshape(-1, 3)
+        self.tree = cKDTree(self.points) if self.ids else None
+        self.dirty = False
+
+    def get_tree(self):
+        if self.dirty:
+            self.rebuild()
+        return self.tree
+
+    def around(self, pos, radius, k):
+        """sorted positions in `ids`/`points` of items within `radius` and `k` nearest"""
+        tree = self.get_tree()
+        if tree is None:
+            return np.empty(0, np.intp)
+        idx = tree.query_ball_point(pos, radius)
+        if k > 0:
+            _, nearest = tree.query(pos, k=min(k, len(self.ids)))
+            idx.extend(np.atleast_1d(nearest).tolist())
+        return np.unique(np.array(idx, np.intp))
+
+    def select(self, idx=None):
+        """(ids, points) of items at `idx`, all items when `idx` is None"""
+        self.get_tree()
+        if idx is None:
+            return self.ids, self.points
+        return [self.ids[i] for i in idx], self.points[idx]
+
+    def nearest(self, pos, k):
+        """ids of `k` items nearest to `pos`, nearest first"""
+        tree = self.get_tree()
+        if tree is None or k <= 0:
+            return []
+        _, idx = tree.query(pos, k=min(k, len(self.ids)))
+        return [self.ids[i] for i in np.atleast_1d(idx)]
+
+    def within(self, pos, radius):
+        """ids of items not further than `radius` from `pos`"""
+        tree = self.get_tree()
+        if tree is None:
+            return []
+        return [self.ids[i] for i in tree.query_ball_point(pos, radius)]
@@ -0,0 +1,56 @@
+import struct
+
+from eft_cap.network_base import ACKS_SIZE, PACKET_HEADER, Acks, NetworkTransport
+
+
+class FakeArgs:
+    packets_file = True
+    skip = None
+
+
+def test_01_window():
+    acks = Acks('test', window=100)
+    assert acks.read_message(10)
+    assert not acks.read_message(10)
+    assert acks.read_message(12)
+    # late but not seen yet
+    assert acks.read_message(11)
+    assert not acks.read_message(11)
+    # id reused for other message
+    assert acks.read_message(11, digest=1)
+
+    # wraparound
+    assert acks.read_message(0xfff0)
+    assert acks.read_message(5)
+    assert not acks.read_message(0xfff0)
+    assert not acks.read_message(5)
+    # behind window
+    assert not acks.read_message(0xff00)
+    assert acks.duplicates == 4
+    assert acks.stale == 1
+
+    # slots were cleared when window has passed them
+    for msg_id in range(6, 0x10000 + 12, 1000):
+        acks.read_message(msg_id & 0xffff)
+    assert acks.read_message(12)
+
+
+def test_02_drop_duplicates():
+    decoded = []
+
+    class Transport(NetworkTransport):
+        def decode_messages(self, buf, offset, end, ctx):
+            decoded.append(bytes(buf[offset:end]))
+
+    def packet(packet_id, msg_id, body):
+        msg = struct.pack('>BBHB', 5, len(body) + 3, msg_id, 0) + body
+        data = PACKET_HEADER.pack(1, packet_id, 7) + bytes(ACKS_SIZE) + msg
+        return {'incoming': True, 'data': data}
+
+    t = Transport(None, FakeArgs())
+    t.trust_session(7)
+    t.packet_num = 0
+    for p in (packet(1, 1, b'move'), packet(2, 1, b'move'), packet(3, 2, b'next'), packet(4, 1, b'move')):
+        t.process_packet(p)
+    assert decoded == [b'move', b'next']
+    assert t.stats.duplicates == 2
@@ -1,6 +1,6 @@
 import numpy as np
 
-from eft_cap.trig_helpers import norm_angle, angle
+from eft_cap.trig_helpers import norm_angle, angle, dist, relative_geometry
 from pytest import approx
 
 
@@ -11,3 +11,16 @@ def test_01():
     assert norm_angle(a) == approx(45.0)
     a = angle(np.array([90, 0, 0]), np.array([45, 0, -45]), [0, 0, 0])
     assert norm_angle(a) == approx(-135.0)
+
+
+def test_02_relative_geometry():
+    rng = np.random.default_rng(0)
+    me = np.array([10.0, 2.0, -30.0])
+    positions = rng.uniform(-500, 500, (500, 3))
+    positions[0] = me
+    positions[1] = [10.0, 50.0, 0.0]
+    dists, angles, vdists = relative_geometry(positions, me, 33.0)
+    for pos, d, a, v in zip(positions, dists, angles, vdists):
+        assert d == approx(dist(me, pos))
+        assert a == angle(me, pos, [33.0])
+        assert v == approx(pos[1] - me[1])
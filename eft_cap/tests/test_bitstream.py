@@ -1,4 +1,4 @@
-from eft_cap.bin_helpers import stream_from_le, BitStream, FloatQuantizer
+from eft_cap.bin_helpers import stream_from_le, BitStream, FloatQuantizer, get_quantizer
 
 
 def test_01():
@@ -91,3 +91,11 @@ def test_09_required():
     assert q.bits_require == 11
     q = FloatQuantizer(-50.0, 50.0, resolution=0.0625)
     assert q.bits_require == 11
+
+
+def test_10_quantizer_cache():
+    q = get_quantizer(-50.0, 50.0, 0.0625)
+    assert q is get_quantizer(-50.0, 50.0, 0.0625)
+    assert q.bits_require == 11
+    assert q.dequantize_float(q.max_int) == 50.0
+    assert q.dequantize_float(0) == -50.0
@@ -0,0 +1,42 @@
+import asyncio
+import json
+
+from eft_cap.broadcast import BroadcastHub
+
+
+class FakeWs:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.frames = []
+        self.client = 'fake'
+
+    async def send_text(self, text):
+        await asyncio.sleep(self.delay)
+        self.frames.append(json.loads(text))
+
+
+def test_01_slow_client():
+    async def _inner():
+        hub = BroadcastHub(max_pending=4)
+        fast, slow = FakeWs(), FakeWs(delay=0.05)
+        hub.add(fast)
+        hub.add(slow)
+        hub.send(slow, {'seq': 0, 'snapshot': True})
+        for seq in range(1, 21):
+            hub.publish({'seq': seq, 1: 'player'}, latest=lambda: {'seq': seq, 'snapshot': True})
+            await asyncio.sleep(0.001)
+        await asyncio.sleep(0.3)
+        assert hub.clients[slow].dropped > 0
+        hub.remove(fast)
+        hub.remove(slow)
+        return fast.frames, slow.frames
+
+    fast, slow = asyncio.run(_inner())
+    assert [f['seq'] for f in fast] == list(range(1, 21))
+    assert fast[0]['1'] == 'player'
+    assert slow[0] == {'seq': 0, 'snapshot': True}
+    assert slow[-1]['seq'] == 20
+    assert len(slow) < 21
+    # frames after a drop continue from the snapshot
+    for prev, frame in zip(slow, slow[1:]):
+        assert frame['seq'] == prev['seq'] + 1 or frame.get('snapshot')
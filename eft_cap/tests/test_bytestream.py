@@ -0,0 +1,26 @@
+import struct
+
+import pytest
+
+from eft_cap import ParsingError
+from eft_cap.bin_helpers import ByteStream
+
+
+def test_01_primitives():
+    data = struct.pack('<BHIQfd', 7, 513, 70000, 1 << 40, 1.5, -2.25)
+    s = ByteStream(data)
+    assert s.read_u8() == 7
+    assert s.read_u16() == 513
+    assert s.read_u32() == 70000
+    assert s.read_u64() == 1 << 40
+    assert s.read_f32() == 1.5
+    assert s.read_double() == -2.25
+    with pytest.raises(ParsingError):
+        s.read_u8()
+
+
+def test_02_string():
+    s = ByteStream(b'\x05hello\x03\xe9\xe8z')
+    assert s.read_string() == 'hello'
+    assert s.read_string() == 'éèz'
+    assert s.byte_offset == 10
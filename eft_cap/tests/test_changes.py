@@ -0,0 +1,28 @@
+import asyncio
+import time
+
+from eft_cap.changes import LOOT, ME, Changes
+
+
+def test_01_coalesce():
+    async def _inner():
+        changes = Changes()
+        sub = changes.subscribe(rate=20, idle=0.2)
+        changes.mark(ME)
+        assert await sub.wait() == {ME}
+
+        t = time.monotonic()
+        for _ in range(100):
+            changes.mark(ME)
+        changes.mark(LOOT)
+        assert await sub.wait() == {ME, LOOT}
+        # no more than `rate` pushes per second
+        assert time.monotonic() - t >= 0.04
+
+        t = time.monotonic()
+        assert await sub.wait() == set()
+        assert time.monotonic() - t >= 0.2
+        changes.unsubscribe(sub)
+        assert not changes.subscriptions
+
+    asyncio.run(_inner())
@@ -0,0 +1,52 @@
+from eft_cap.network_base import FragmentReassembler
+
+
+def test_01_assemble():
+    r = FragmentReassembler()
+    assert r.add((True, 0, 5), 2, 3, b'cc', now=0.0) is None
+    assert r.add((True, 0, 5), 0, 3, b'aa', now=0.1) is None
+    # retransmitted chunk isn't counted twice
+    assert r.add((True, 0, 5), 0, 3, b'aa', now=0.2) is None
+    # other direction and channel don't mix
+    assert r.add((False, 0, 5), 1, 3, b'xx', now=0.2) is None
+    assert r.add((True, 1, 5), 1, 3, b'yy', now=0.2) is None
+    assert r.buffered == 8
+    assert r.add((True, 0, 5), 1, 3, b'bb', now=0.3) == b'aabbcc'
+    assert r.buffered == 4
+    assert r.peak_buffered == 10
+    assert r.as_dict()['max_latency_ms'] == 300
+
+
+def test_02_evict():
+    r = FragmentReassembler(timeout=1.0, max_lag=4, max_fragments=3)
+    r.add((True, 0, 1), 0, 2, b'a', now=0.0)
+    r.add((True, 0, 2), 0, 2, b'a', now=0.5)
+    # ids far ahead make old ones stale
+    r.add((True, 0, 10), 0, 2, b'a', now=0.6)
+    assert list(r.pending) == [(True, 0, 10)]
+    # late fragment doesn't drop newer ones
+    r.add((True, 0, 8), 0, 2, b'a', now=0.7)
+    assert list(r.pending) == [(True, 0, 10), (True, 0, 8)]
+    r.add((True, 0, 130), 0, 2, b'a', now=0.7)
+    r.add((True, 0, 250), 0, 2, b'a', now=0.7)
+    # wraparound
+    r.add((True, 0, 3), 0, 2, b'a', now=0.7)
+    assert list(r.pending) == [(True, 0, 3)]
+    assert r.dropped == 6
+
+    # age
+    r.add((True, 1, 1), 0, 2, b'a', now=1.65)
+    r.add((True, 1, 2), 0, 2, b'a', now=1.75)
+    assert list(r.pending) == [(True, 1, 1), (True, 1, 2)]
+
+    # count
+    r.add((True, 2, 1), 0, 2, b'a', now=1.8)
+    r.add((True, 3, 1), 0, 2, b'a', now=1.8)
+    assert len(r) == 3
+    assert (True, 1, 1) not in r.pending
+
+    # reused id with other amount of chunks
+    r.add((True, 3, 1), 0, 3, b'bb', now=1.8)
+    assert r.add((True, 3, 1), 1, 3, b'bb', now=1.8) is None
+    assert r.dropped == 9
+    assert r.buffered == 6
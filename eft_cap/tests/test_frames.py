@@ -0,0 +1,68 @@
+import struct
+
+import pytest
+
+from eft_cap.frames import OddFrame, frame_to_dict
+
+
+def udp_frame(payload, vlan=0, options=b'', src=b'\x0a\x00\x00\x01', dst=b'\xc0\xa8\x01\x02',
+              flags_frag=0, proto=17, pad=0):
+    udp = struct.pack('!HHHH', 17005, 56001, 8 + len(payload), 0) + payload
+    ihl = (20 + len(options)) // 4
+    ip = struct.pack('!BBHHHBBH4s4s', 0x40 | ihl, 0, 20 + len(options) + len(udp), 1,
+                     flags_frag, 64, proto, 0, src, dst) + options
+    eth = b'\xff' * 12
+    for i in range(vlan):
+        eth += struct.pack('!HH', 0x8100, 10)
+    return eth + b'\x08\x00' + ip + udp + bytes(pad)
+
+
+def test_01_plain():
+    assert frame_to_dict(udp_frame(b'payload', pad=10)) == {
+        'incoming': True,
+        'data': b'payload',
+        'src_port': 17005,
+        'dst_port': 56001,
+    }
+
+
+def test_02_vlan_and_options():
+    frame = udp_frame(b'abc', vlan=2, options=b'\x01' * 8, dst=b'\x0a\x00\x00\x02')
+    dct = frame_to_dict(frame)
+    assert dct['data'] == b'abc'
+    assert dct['incoming'] is False
+
+
+def test_03_skip():
+    assert frame_to_dict(udp_frame(b'')) is None
+    assert frame_to_dict(udp_frame(b'abc', proto=6)) is None
+    assert frame_to_dict(b'\xff' * 12 + b'\x86\xdd' + bytes(40)) is None
+
+
+def test_04_odd():
+    with pytest.raises(OddFrame):
+        frame_to_dict(udp_frame(b'abc', flags_frag=0x2000))
+    with pytest.raises(OddFrame):
+        frame_to_dict(udp_frame(b'abc')[:30])
+
+
+def test_05_fragments():
+    from eft_cap.frames import IpReassembler
+
+    payload = bytes(range(40))
+    whole = udp_frame(payload)
+    ip_start = 14 + 20
+    udp = whole[ip_start:]
+
+    def fragment(part, offset, more):
+        frame = udp_frame(b'', flags_frag=(0x2000 if more else 0) | offset // 8)
+        # replace UDP datagram of template with raw part and fix IP total length
+        frame = bytearray(frame[:ip_start]) + part
+        struct.pack_into('!H', frame, 14 + 2, 20 + len(part))
+        return bytes(frame)
+
+    r = IpReassembler()
+    assert frame_to_dict(fragment(udp[:24], 0, True), r) is None
+    assert frame_to_dict(fragment(udp[24:], 24, False), r)['data'] == payload
+    # last part alone waits for the first one, no error
+    assert frame_to_dict(fragment(udp[24:], 24, False), r) is None
@@ -0,0 +1,38 @@
+import json
+import os
+
+from eft_cap import item_db
+
+
+def write_template(src, template_id, name, price=None):
+    props = {} if price is None else {'CreditsPrice': price}
+    src.joinpath(f'{template_id}.json').write_text(
+        json.dumps({'_name': name, '_props': props}), encoding='utf8'
+    )
+
+
+def test_01_build_and_refresh(tmp_path):
+    src = tmp_path / 'items'
+    src.mkdir()
+    dst = tmp_path / 'items.db'
+    write_template(src, '5888988e24597752fe43a6fa', 'Золото', 1000)
+    write_template(src, '5448bc234bdc2d3c308b4569', 'mag')
+    write_template(src, 'short', 'skipped', 1)
+    write_template(src, '5449016a4bdc2d6f028b456f', 'rub', 0.6)
+
+    assert item_db.load(dst) is None
+    assert item_db.refresh(src, dst)
+    assert item_db.load(dst) == {
+        '5888988e24597752fe43a6fa': {'name': 'Золото', 'price': 1000},
+        '5448bc234bdc2d3c308b4569': {'name': 'mag'},
+        # fractional prices are rounded, not truncated
+        '5449016a4bdc2d6f028b456f': {'name': 'rub', 'price': 1},
+    }
+    assert not item_db.refresh(src, dst)
+
+    write_template(src, '5888988e24597752fe43a6fa', 'Золото', 2000)
+    path = src / '5888988e24597752fe43a6fa.json'
+    st = path.stat()
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    assert item_db.refresh(src, dst)
+    assert item_db.load(dst)['5888988e24597752fe43a6fa']['price'] == 2000
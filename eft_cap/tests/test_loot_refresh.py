@@ -0,0 +1,29 @@
+import numpy as np
+
+from eft_cap.msg_level import GLOBAL, Loot
+
+
+class Me:
+    def __init__(self, x):
+        self.pos = np.array([x, 0.0, 0.0])
+        self.rot = np.zeros(3)
+
+
+def test_01_left_radius_is_refreshed():
+    loot = Loot()
+    loot.FULL_REFRESH_INTERVAL = 1000
+    loot.FULL_REFRESH_MOVE = 1000
+    for x in (0.0, 40.0, 200.0):
+        loot.show(f'crate_{x:.0f}', {'id': f'crate_{x:.0f}', 'position': [x, 0.0, 0.0], 'total_price': 1})
+    me = GLOBAL['me']
+    try:
+        GLOBAL['me'] = Me(1.0)
+        loot.update_location()
+        assert loot.by_id['crate_40']['dist'] == 39
+        # far from full refresh position, crate_40 isn't around anymore
+        GLOBAL['me'] = Me(-30.0)
+        loot.update_location()
+        assert loot.by_id['crate_40']['dist'] == 70
+        assert 'crate_40' not in loot.near
+    finally:
+        GLOBAL['me'] = me
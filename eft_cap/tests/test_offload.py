@@ -0,0 +1,95 @@
+import asyncio
+import zlib
+
+from eft_cap.msg_level import GLOBAL, Loot
+from eft_cap.offload import Offload
+
+
+def test_01_merge_on_loop():
+    async def _inner():
+        offload = Offload(1, asyncio.get_event_loop())
+        merged = []
+        offload.submit(merged.append, zlib.decompress, zlib.compress(b'first'))
+        offload.submit(merged.append, zlib.decompress, zlib.compress(b'second'))
+        for _ in range(500):
+            if not offload.jobs:
+                break
+            await asyncio.sleep(0.01)
+        assert merged == [b'first', b'second']
+
+        # waited for synchronously, late callback doesn't merge twice
+        offload.submit(merged.append, zlib.decompress, zlib.compress(b'third'))
+        offload.submit(merged.append, zlib.decompress, b'broken')
+        offload.wait()
+        await asyncio.sleep(0.05)
+        assert merged == [b'first', b'second', b'third']
+        assert offload.as_dict()['failed'] == 1
+        offload.shutdown()
+
+    asyncio.run(_inner())
+
+
+class MoveLoot(Loot):
+    def __init__(self):
+        super().__init__()
+        self.moved = []
+
+    def move(self, move_operation):
+        self.moved.append(move_operation['id'])
+
+
+def move(_id, parent):
+    return {'id': _id, 'from': {'owner_container': {'parent_id': 'me'}}, 'to': {'container': {'parent_id': parent}}}
+
+
+def test_02_defer_moves():
+    class FakeOffload:
+        jobs = 1
+
+        def __len__(self):
+            return self.jobs
+
+    offload = FakeOffload()
+    GLOBAL['offload'] = offload
+    try:
+        loot = MoveLoot()
+        moved = loot.moved
+        loot.all_items.update({'me': {}, 'a': {}, 'box': {}})
+        loot.process_move(move('a', 'box'))
+        assert moved == ['a']
+        # target crate is still parsed
+        loot.process_move(move('a', 'crate'))
+        # keeps order after deferred one
+        loot.process_move(move('a', 'box'))
+        assert moved == ['a'] and len(loot.deferred) == 2
+
+        loot.all_items['crate'] = {}
+        offload.jobs = 0
+        loot.process_deferred()
+        assert moved == ['a', 'a', 'a'] and not loot.deferred
+    finally:
+        GLOBAL['offload'] = None
+
+
+def test_03_failed_job_drains_deferred():
+    async def _inner():
+        offload = GLOBAL['offload'] = Offload(1, asyncio.get_event_loop())
+        loot = MoveLoot()
+        loot.all_items.update({'me': {}, 'a': {}})
+        merged = []
+        offload.submit(merged.append, zlib.decompress, b'broken', done=loot.process_deferred)
+        loot.process_move(move('a', 'crate'))
+        assert loot.deferred
+        for _ in range(500):
+            if not offload.jobs:
+                break
+            await asyncio.sleep(0.01)
+        assert not merged and offload.failed == 1
+        # crate never comes, move is applied (and fails there) instead of staying queued
+        assert loot.moved == ['a'] and not loot.deferred
+        offload.shutdown()
+
+    try:
+        asyncio.run(_inner())
+    finally:
+        GLOBAL['offload'] = None
@@ -0,0 +1,78 @@
+import pytest
+
+from eft_cap.msg_level import BATTLE_EYE, OPS, SUBWORLD_SPAWN, MsgDecoder
+
+TEST_OP = 900
+
+
+class FakeTransport:
+    curr_packet = {'num': 0, 'len': 0}
+
+
+def decode(op_type, content):
+    m = MsgDecoder(FakeTransport(), {'incoming': True, 'channel_id': 0})
+    m.op_type = op_type
+    m.len = len(content)
+    m.content = content
+    m.decode()
+    return m
+
+
+def test_01_dispatch():
+    read = []
+    OPS.register(TEST_OP, 'TEST', lambda msg: read.append(msg.data.read_u16()))
+    try:
+        # nothing is read from skipped ops
+        assert not hasattr(decode(BATTLE_EYE, b'\x01\x02'), 'data')
+        assert OPS.handlers[BATTLE_EYE].skipped == 1
+        decode(999, b'')
+        assert OPS.unknown == {999: 1}
+
+        decode(TEST_OP, b'\x01\x00\x00')
+        assert read == [1]
+        stats = OPS.handlers[TEST_OP].as_dict()
+        assert (stats['count'], stats['bytes'], stats['skipped']) == (1, 3, 0)
+
+        OPS.unsubscribe('TEST')
+        assert not hasattr(decode(TEST_OP, b'\x02\x00'), 'data')
+        assert OPS.handlers[TEST_OP].skipped == 1
+        OPS.subscribe(TEST_OP)
+        decode(TEST_OP, b'\x02\x00')
+        assert read == [1, 2]
+
+        with pytest.raises(ValueError):
+            OPS.subscribe('BATTLE_EYE')
+        with pytest.raises(KeyError):
+            OPS.unsubscribe('NO_SUCH_OP')
+
+        OPS.unsubscribe(SUBWORLD_SPAWN)
+        OPS.reset()
+        assert OPS.handlers[TEST_OP].count == 0
+        assert SUBWORLD_SPAWN in OPS.active
+    finally:
+        del OPS.handlers[TEST_OP]
+        OPS.reset()
+
+
+def test_02_skip_in_transport(monkeypatch):
+    import struct
+
+    from eft_cap import network_base
+
+    class FakeArgs:
+        packets_file = True
+        skip = None
+
+    built = []
+    monkeypatch.setattr(network_base, 'MsgDecoder', lambda *args: built.append(args))
+    t = network_base.NetworkTransport(None, FakeArgs())
+    t.packet_num = 0
+    OPS.reset()
+    try:
+        buf = struct.pack('<HH', 2, BATTLE_EYE) + b'\x01\x02' + struct.pack('<HH', 0, 999)
+        t.decode_messages(buf, 0, len(buf), {'incoming': True, 'channel_id': 0})
+        assert not built
+        assert OPS.handlers[BATTLE_EYE].skipped == 1
+        assert OPS.unknown == {999: 1}
+    finally:
+        OPS.reset()
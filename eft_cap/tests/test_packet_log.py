@@ -0,0 +1,51 @@
+import pytest
+
+from eft_cap.packet_log import PacketLogWriter, is_packet_log, packet_session, read_packet_log
+
+
+@pytest.mark.parametrize('compression', ['none', 'zlib'])
+def test_01_roundtrip(tmp_path, compression):
+    path = tmp_path / 'test.packets'
+    packets = [
+        {'incoming': i % 2 == 0, 'data': b'\x00\x01\x00\x02\x78\x81' + bytes([i % 256]) * (i % 50),
+         'src_port': 17000 + i, 'dst_port': 56000}
+        for i in range(300)
+    ]
+    w = PacketLogWriter(path, compression=compression, block_size=1024)
+    for p in packets:
+        w.write(p, ts=1.5)
+    w.close()
+
+    assert is_packet_log(path)
+    out = list(read_packet_log(path))
+    assert len(out) == len(packets)
+    for p, o in zip(packets, out):
+        assert o == {**p, 'session': 0x7881, 'ts': 1.5}
+
+
+def test_02_session():
+    assert packet_session(b'\x00\x00\x01\x00\x00\x00\x00') == 0
+    assert packet_session(b'\x00\x01\xc9\xbd\xc7g\x00') == 0xc767
+
+
+def test_03_rotate_on_new_session(tmp_path, monkeypatch):
+    from types import SimpleNamespace
+
+    from eft_cap.msg_level import GLOBAL, activate_world
+    from eft_cap.network_base import NetworkTransport
+
+    monkeypatch.chdir(tmp_path)
+    default = GLOBAL['world']
+    hooks = len(GLOBAL['on_exit'])
+    t = NetworkTransport(None, SimpleNamespace(packets_file=None, skip=None, log_compression='none'))
+    first = t.packet_log
+    t.save_packet({'incoming': True, 'data': b'\x00\x00\x01\x00\x00\x01\x00'})
+    t.new_session((17000, 1))
+    t.new_session((17000, 2))
+    # previous writers are closed, one exit hook for all of them
+    assert not first.thread.is_alive()
+    assert len(GLOBAL['on_exit']) == hooks + 1
+    GLOBAL['on_exit'].pop()()
+    assert t.packet_log is None
+    assert len(list(tmp_path.joinpath('packet_logs').iterdir())) == 1
+    activate_world(default)
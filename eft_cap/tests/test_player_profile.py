@@ -0,0 +1,60 @@
+import json
+import zlib
+
+from eft_cap.msg_level import Loot
+from eft_cap.player_profile import read_fields
+
+
+def make_profile():
+    return {
+        'aid': '0',
+        'Info': {'Nickname': 'Гога', 'Level': 42, 'Side': 'Savage', 'GroupId': 'abc123'},
+        'Encyclopedia': {f'{i:024x}': True for i in range(5000)},
+        'Skills': [{'Id': f'skill{i}', 'Progress': i * 1.5} for i in range(2000)],
+        'SurvivorClass': 'Survivor',
+        'Stats': {'aid': '1', 'Level': 1234567},
+    }
+
+
+def test_01_read_fields():
+    prof = make_profile()
+    prof_zip = zlib.compress(json.dumps(prof, ensure_ascii=False).encode())
+    for chunk in (7, 64, 1024, len(prof_zip)):
+        fields = read_fields(prof_zip, chunk=chunk)
+        assert fields == {key: prof[key] for key in ('aid', 'Info', 'SurvivorClass')}
+
+    # numbers split between chunks and missing keys
+    prof_zip = zlib.compress(json.dumps({'Level': 1234567}).encode())
+    assert read_fields(prof_zip, fields=('Level', 'Info'), chunk=1) == {'Level': 1234567}
+
+
+def test_02_decode_pending():
+    class Pending:
+        decoded = 0
+
+        def decode_inventory(self):
+            Pending.decoded += 1
+
+    loot = Loot()
+    loot.pending.extend(Pending() for _ in range(3))
+    loot.decode_pending(budget=0)
+    assert Pending.decoded == 1
+    loot.decode_pending()
+    assert Pending.decoded == 3
+    assert not loot.pending
+
+
+def test_03_nested_keys_first():
+    prof = {
+        'Stats': {'aid': '1', 'Info': {'Nickname': 'nested'}, 'Notes': '"SurvivorClass": "quoted"'},
+        'aid': '0',
+        'Info': {'Nickname': 'top'},
+        'Skills': [{'SurvivorClass': 'nested'}],
+        'SurvivorClass': 'Survivor',
+    }
+    prof_zip = zlib.compress(json.dumps(prof).encode())
+    for chunk in (5, 64, len(prof_zip)):
+        assert read_fields(prof_zip, chunk=chunk) == {'aid': '0', 'Info': {'Nickname': 'top'}, 'SurvivorClass': 'Survivor'}
+    # only nested
+    prof_zip = zlib.compress(json.dumps({'Stats': {'aid': '1'}}).encode())
+    assert read_fields(prof_zip, fields=('aid',)) == {}
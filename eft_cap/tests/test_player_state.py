@@ -0,0 +1,40 @@
+import json
+import zlib
+from types import SimpleNamespace
+
+import numpy as np
+
+from eft_cap.msg_level import GLOBAL, PLAYERS, POSITIONS, ROTATIONS, Player, PlayerDetails, clear_global, players_geometry
+
+
+def test_01_shared_rows():
+    clear_global()
+    transport = SimpleNamespace(encrypt=False, replay=False)
+    player = Player.dummy(7, transport)
+    assert not hasattr(player, '__dict__')
+    # decoder and its buffers aren't kept alive by players
+    assert not {'msg', 'data'} & set(Player.__slots__)
+
+    pos = player.pos
+    player.pos[:] = (1, 2, 3)
+    player.rot[0] = 90
+    # updated in place, rows of shared arrays
+    assert player.pos is pos
+    assert np.array_equal(POSITIONS[7], [1, 2, 3])
+    assert ROTATIONS[7][0] == 90
+
+    me = Player.dummy(1, transport, me=True)
+    me.pos[:] = (1, 2, 13)
+    GLOBAL['me'] = me
+    dist, _, vdist = players_geometry()[7]
+    assert dist == 10
+    assert vdist == 0
+    clear_global()
+    assert not PLAYERS
+
+
+def test_02_details():
+    prof = {'Info': {'Nickname': 'test'}}
+    details = PlayerDetails(zlib.compress(json.dumps(prof).encode()))
+    assert details.prof == prof
+    assert PlayerDetails().prof == {}
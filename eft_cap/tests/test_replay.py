@@ -0,0 +1,49 @@
+import os
+
+from eft_cap.packet_log import PacketLogWriter
+from eft_cap.replay import Replay, index_path
+
+Z_INIT = b'\x00\x00\x01\x00\x00\x78\x81'
+
+
+def write_log(path, num, inits):
+    w = PacketLogWriter(path, compression='zlib', block_size=512)
+    for i in range(num):
+        data = Z_INIT if i in inits else b'\x00\x01\x00\x02\x78\x81' + bytes([i % 256]) * (i % 40)
+        w.write({'incoming': True, 'data': data, 'src_port': i, 'dst_port': 0}, ts=float(i))
+    w.close()
+
+
+def test_01_seek(tmp_path):
+    path = tmp_path / 'test.packets'
+    write_log(path, 500, inits=(10, 250))
+
+    replay = Replay(path)
+    assert len(replay) == 500
+    assert list(replay.index.sessions) == [10, 250]
+    assert replay.packet(321)['src_port'] == 321
+    assert [p['src_port'] for p in replay.iter_from(495)] == list(range(495, 500))
+    assert [p['src_port'] for p in replay.iter_from(100, stop=103)] == [100, 101, 102]
+    assert replay.session_start(5) == 0
+    assert replay.session_start(10) == 10
+    assert replay.session_start(300) == 250
+    replay.close()
+
+    assert index_path(path).exists()
+    replay = Replay(path)
+    assert list(replay.index.sessions) == [10, 250]
+    assert replay.packet(0)['src_port'] == 0
+    replay.close()
+
+
+def test_02_stale_index(tmp_path):
+    path = tmp_path / 'test.packets'
+    write_log(path, 50, inits=())
+    Replay(path).close()
+    write_log(path, 80, inits=(70,))
+    os.utime(path, ns=(1, 1))
+
+    replay = Replay(path)
+    assert len(replay) == 80
+    assert list(replay.index.sessions) == [70]
+    replay.close()
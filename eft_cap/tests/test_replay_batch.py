@@ -0,0 +1,67 @@
+import struct
+
+from eft_cap import replay_batch
+from eft_cap.msg_level import GLOBAL, PLAYERS, activate_world
+from eft_cap.network_base import ACKS_SIZE, PACKET_HEADER
+from eft_cap.packet_log import PacketLogWriter
+
+PORT = 17000
+SESSION = 1
+
+
+def z_init():
+    return {'incoming': True, 'src_port': PORT, 'data': b'\x00\x00\x01\x00\x00' + struct.pack('<H', SESSION)}
+
+
+def heartbeat():
+    return {'incoming': True, 'src_port': PORT, 'data': b'\x00\x00\x04' + bytes(22) + struct.pack('<H', SESSION)}
+
+
+def message(msg_id, op_type, content):
+    body = struct.pack('<HH', len(content), op_type) + content
+    msg = struct.pack('>BBHB', 5, len(body) + 3, msg_id, 0) + body
+    data = PACKET_HEADER.pack(1, msg_id, SESSION) + bytes(ACKS_SIZE) + msg
+    return {'incoming': True, 'src_port': PORT, 'data': data}
+
+
+def write_log(path, packets):
+    writer = PacketLogWriter(path, compression='none')
+    for p in packets:
+        writer.write(p)
+    writer.close()
+
+
+def test_01_replay_corpus(tmp_path):
+    corpus = tmp_path / 'corpus'
+    corpus.joinpath('raid').mkdir(parents=True)
+    write_log(corpus / 'clean.packets', [z_init(), heartbeat()])
+    # broken SERVER_INIT
+    write_log(corpus / 'raid' / 'broken.packets', [z_init(), heartbeat(), message(1, 147, b'\x01')])
+    (corpus / 'notes.txt').write_text('not a log')
+
+    files = replay_batch.collect([corpus])
+    assert [f.name for f in files] == ['clean.packets', 'broken.packets']
+    results = replay_batch.run_batch(files, workers=2)
+    clean, broken = results
+    assert clean['packets'] == 2
+    assert clean['errors'] == {}
+    assert broken['packets'] == 3
+    assert broken['errors'] == {147: 1}
+    assert not broken['failed']
+
+    total = replay_batch.summarize(results)
+    assert total['files'] == 2
+    assert total['packets'] == 5
+    assert total['errors'] == {147: 1}
+
+
+def test_02_state_is_reset(tmp_path):
+    default = GLOBAL['world']
+    players = dict(PLAYERS)
+    path = tmp_path / 'broken.packets'
+    write_log(path, [z_init(), heartbeat(), message(1, 147, b'\x01')])
+    # same process twice, counters don't leak between logs
+    assert replay_batch.replay_file(path)['errors'] == {147: 1}
+    assert replay_batch.replay_file(path)['errors'] == {147: 1}
+    activate_world(default)
+    assert PLAYERS == players
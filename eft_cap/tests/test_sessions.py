@@ -0,0 +1,109 @@
+import asyncio
+import struct
+
+from eft_cap.msg_level import GLOBAL, PLAYERS, World, activate_world
+from eft_cap.network_base import ACKS_SIZE, PACKET_HEADER, NetworkTransport
+
+
+class FakeArgs:
+    packets_file = True
+    skip = None
+
+
+def z_init(port, sess_id):
+    return {'incoming': True, 'src_port': port, 'data': b'\x00\x00\x01\x00\x00' + struct.pack('<H', sess_id)}
+
+
+def heartbeat(port, sess_id):
+    return {'incoming': True, 'src_port': port, 'data': b'\x00\x00\x04' + bytes(22) + struct.pack('<H', sess_id)}
+
+
+def message(port, sess_id, msg_id, body):
+    msg = struct.pack('>BBHB', 5, len(body) + 3, msg_id, 0) + body
+    data = PACKET_HEADER.pack(1, msg_id, sess_id) + bytes(ACKS_SIZE) + msg
+    return {'incoming': True, 'src_port': port, 'data': data}
+
+
+def test_01_activate_world():
+    default = GLOBAL['world']
+    players = dict(PLAYERS)
+    other = World()
+    activate_world(other)
+    assert GLOBAL['loot'] is other.loot
+    assert not PLAYERS
+    PLAYERS[2] = 'second'
+    activate_world(default)
+    assert PLAYERS == players
+    assert other.players == {2: 'second'}
+
+
+def test_02_demultiplex():
+    decoded = []
+
+    class Transport(NetworkTransport):
+        def decode_messages(self, buf, offset, end, ctx):
+            decoded.append((bytes(buf[offset:end]), GLOBAL['world']))
+
+    default = GLOBAL['world']
+    t = Transport(None, FakeArgs())
+    t.max_sessions = 2
+    t.packet_num = 0
+    for p in (z_init(17000, 1), heartbeat(17000, 1), z_init(17001, 1), heartbeat(17001, 1)):
+        t.process_packet(p)
+    first, second = t.sessions[(17000, 1)], t.sessions[(17001, 1)]
+    assert t.focus is second
+
+    # same session id and message ids on other servers don't clash
+    t.process_packet(message(17000, 1, 1, b'a'))
+    t.process_packet(message(17001, 1, 1, b'b'))
+    t.process_packet(message(17000, 1, 1, b'a'))
+    # unknown session
+    t.process_packet(message(17002, 1, 2, b'c'))
+    assert decoded == [(b'a', first.world), (b'b', second.world)]
+
+    # least recently used session is dropped
+    t.process_packet(z_init(17002, 3))
+    assert list(t.sessions) == [(17000, 1), (17002, 3)]
+    assert t.focus is t.sessions[(17002, 3)]
+    activate_world(default)
+
+
+def test_03_trusted_on_init():
+    decoded = []
+
+    class Transport(NetworkTransport):
+        def decode_messages(self, buf, offset, end, ctx):
+            decoded.append(bytes(buf[offset:end]))
+
+    default = GLOBAL['world']
+    t = Transport(None, FakeArgs())
+    t.packet_num = 0
+    # no heartbeat between session start and first message
+    t.process_packet(z_init(17000, 5))
+    t.process_packet(message(17000, 5, 1, b'init'))
+    assert decoded == [b'init']
+    activate_world(default)
+
+
+def test_04_focus_while_source_waits():
+    class Transport(NetworkTransport):
+        def decode_messages(self, buf, offset, end, ctx):
+            pass
+
+    async def source():
+        for p in (z_init(17000, 1), heartbeat(17000, 1), z_init(17001, 1), heartbeat(17001, 1)):
+            yield p
+        for msg_id in range(1, 5):
+            yield message(17000, 1, msg_id, b'a')
+            # source waits here, after packet of not focused session
+            seen.append(GLOBAL['world'] is t.focus.world)
+            yield message(17001, 1, msg_id, b'b')
+            seen.append(GLOBAL['world'] is t.focus.world)
+
+    default = GLOBAL['world']
+    seen = []
+    t = Transport(source(), FakeArgs())
+    asyncio.run(t.run())
+    assert t.focus.key == (17001, 1)
+    assert seen == [True] * 8
+    activate_world(default)
@@ -0,0 +1,63 @@
+import asyncio
+
+import pytest
+
+from eft_cap.shm_ring import PacketRing, RECORD
+
+
+@pytest.fixture
+def ring():
+    r = PacketRing.create(capacity=64)
+    yield r
+    r.close(unlink=True)
+
+
+def packet(data, incoming=True):
+    return {'incoming': incoming, 'data': data, 'src_port': 17000, 'dst_port': 56001}
+
+
+def test_01_roundtrip(ring):
+    assert ring.get() is None
+    assert ring.put_nowait(packet(b'abc'))
+    assert ring.put_nowait(packet(b'', incoming=False))
+    assert ring.qsize() == 2
+    assert ring.get() == packet(b'abc')
+    assert ring.get() == packet(b'', incoming=False)
+    assert ring.get() is None
+    assert ring.fill() == 0
+
+
+def test_02_wraparound_and_drop(ring):
+    payload = bytes(range(20))
+    for i in range(10):
+        assert ring.put_nowait(packet(payload))
+        assert ring.put_nowait(packet(payload[::-1]))
+        assert ring.get()['data'] == payload
+        assert ring.get()['data'] == payload[::-1]
+    assert ring.put_nowait(packet(bytes(64 - RECORD.size)))
+    assert not ring.put_nowait(packet(b'x'))
+    assert ring.dropped == 1
+
+
+def test_03_wakeup(ring):
+    async def _inner():
+        loop = asyncio.get_event_loop()
+        loop.call_later(0.01, ring.put_nowait, packet(b'wake'))
+        await ring.wait(timeout=5)
+        return ring.get()
+
+    assert asyncio.run(_inner()) == packet(b'wake')
+
+
+def test_04_written_before_sleep(ring):
+    async def _inner():
+        # consumer has seen empty ring, producer writes before consumer sleeps
+        assert ring.get() is None
+        ring.put_nowait(packet(b'late'))
+        assert not ring.reader.poll()
+        t = asyncio.get_event_loop().time()
+        await ring.wait(timeout=5)
+        return asyncio.get_event_loop().time() - t
+
+    assert asyncio.run(_inner()) < 1
+    assert ring.get() == packet(b'late')
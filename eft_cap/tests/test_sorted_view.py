@@ -0,0 +1,33 @@
+import random
+
+from eft_cap.sorted_view import SortedView
+
+
+def test_01_incremental():
+    view = SortedView(key=lambda x: x['dist'])
+    items = {f'id_{i}': {'dist': random.uniform(0, 100)} for i in range(200)}
+    for _id, item in items.items():
+        view.update(_id, item)
+
+    for _ in range(500):
+        _id = random.choice(list(items))
+        if random.random() < 0.3:
+            view.remove(_id)
+        else:
+            items[_id]['dist'] = random.uniform(0, 100)
+            view.update(_id, items[_id])
+
+    expected = sorted(view.items, key=lambda _id: (items[_id]['dist'], _id))
+    assert [id(item) for item in view] == [id(items[_id]) for _id in expected]
+
+
+def test_02_rebuild_and_refresh():
+    items = {'a': {'dist': 3}, 'b': {'dist': 1}, 'c': {'dist': 2}}
+    view = SortedView(key=lambda x: x['dist'])
+    view.rebuild(items)
+    assert [item['dist'] for item in view] == [1, 2, 3]
+
+    items['a']['dist'] = 0
+    view.refresh(['a', 'unknown'])
+    assert next(iter(view)) is items['a']
+    assert len(view) == 3 and 'b' in view
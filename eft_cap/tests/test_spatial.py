@@ -0,0 +1,21 @@
+import numpy as np
+
+from eft_cap.spatial import SpatialIndex
+
+
+def test_01_queries():
+    index = SpatialIndex()
+    assert index.nearest(np.zeros(3), 3) == []
+    assert index.within(np.zeros(3), 10) == []
+
+    for i in range(100):
+        index.add(f'item_{i}', np.array([i * 10.0, 0.0, 0.0]))
+    pos = np.array([201.0, 0.0, 0.0])
+    assert index.nearest(pos, 3) == ['item_20', 'item_21', 'item_19']
+    assert index.nearest(pos, 1) == ['item_20']
+    assert sorted(index.within(pos, 15)) == ['item_19', 'item_20', 'item_21']
+
+    index.remove('item_20')
+    assert 'item_20' not in index
+    assert index.nearest(pos, 1) == ['item_21']
+    assert len(index.nearest(pos, 1000)) == 99
@@ -0,0 +1,64 @@
+import struct
+
+from eft_cap.tzsp import IpReassembler, UdpProto, skip_tags
+
+
+def ip_frame(ip_payload, ident=1, flags_frag=0, proto=17):
+    ip = struct.pack('!BBHHHBBH4s4s', 0x45, 0, 20 + len(ip_payload), ident, flags_frag, 64, proto, 0,
+                     b'\x0a\x00\x00\x01', b'\xc0\xa8\x01\x02')
+    return b'\xff' * 12 + b'\x08\x00' + ip + ip_payload
+
+
+def tzsp(frame, tags=b'\x00\x0a\x01\x7f\x01'):
+    return struct.pack('!BBH', 1, 0, 1) + tags + frame
+
+
+def udp(payload, sport=17005, dport=56001):
+    return struct.pack('!HHHH', sport, dport, 8 + len(payload), 0) + payload
+
+
+def parse(data):
+    return UdpProto(lambda x: x).parse(data)
+
+
+def test_01_tags():
+    assert skip_tags(b'\x01', 0) == 1
+    assert skip_tags(b'\x00\x00\x0a\x02ab\x01rest', 0) == 7
+
+
+def test_02_plain():
+    assert parse(tzsp(ip_frame(udp(b'abc')))) == {
+        'incoming': True,
+        'data': b'abc',
+        'src_port': 17005,
+        'dst_port': 56001,
+    }
+    assert parse(tzsp(ip_frame(udp(b'abc', sport=53, dport=53)))) is None
+
+
+def test_03_reassembly():
+    whole = udp(bytes(range(200)) * 10)
+    proto = UdpProto(lambda x: x)
+    parts = [whole[0:800], whole[800:1600], whole[1600:]]
+    frames = [
+        ip_frame(parts[2], ident=7, flags_frag=1600 // 8),
+        ip_frame(b'junk1234', ident=8, flags_frag=0x2000),  # other datagram, never completed
+        ip_frame(parts[0], ident=7, flags_frag=0x2000),
+        ip_frame(parts[1], ident=7, flags_frag=0x2000 | 800 // 8),
+    ]
+    out = [proto.parse(tzsp(f)) for f in frames]
+    assert out[:3] == [None, None, None]
+    assert out[3]['data'] == bytes(range(200)) * 10
+    assert len(proto.reassembler.pending) == 1
+
+
+def test_04_eviction():
+    r = IpReassembler(timeout=1.0, max_datagrams=2)
+    for i in range(3):
+        ip = {'src': b'a', 'dst': b'b', 'id': i, 'frag_offset': 0, 'more_fragments': True}
+        r.add(ip, b'12345678', now=0)
+    assert len(r.pending) == 2 and r.dropped == 1
+    ip = {'src': b'a', 'dst': b'b', 'id': 9, 'frag_offset': 0, 'more_fragments': True}
+    r.add(ip, b'12345678', now=5)
+    assert list(r.pending) == [(b'a', b'b', 9)]
+    assert r.buffered == 8
@@ -0,0 +1,46 @@
+from eft_cap.ws_protocol import StateStream, empty_state
+
+
+def apply_diff(state, msg):
+    """same as frontend reducer"""
+    if 'me' in msg:
+        state['me'] = msg['me'] and {**(state['me'] or {}), **msg['me']}
+    for name in ('players', 'loot'):
+        if name in msg:
+            for _id in msg[name]['removed']:
+                state[name].pop(_id)
+            for _id, fields in msg[name]['changed'].items():
+                state[name][_id] = {**state[name].get(_id, {}), **fields}
+    if 'exits' in msg:
+        state['exits'] = msg['exits']
+
+
+def test_01_diffs():
+    stream = StateStream()
+    client = empty_state()
+
+    states = [
+        {'me': {'name': 'me', 'dist': 0}, 'players': {1: {'dist': 10, 'name': 'a'}}, 'loot': {}, 'exits': None},
+        {'me': {'name': 'me', 'dist': 0}, 'players': {1: {'dist': 11, 'name': 'a'}, 2: {'dist': 5, 'name': 'b'}},
+         'loot': {'x': {'dist': 1}}, 'exits': {'exit': 'open'}},
+        {'me': None, 'players': {2: {'dist': 5, 'name': 'b'}}, 'loot': {'x': {'dist': 1}}, 'exits': {'exit': 'open'}},
+    ]
+    msg = stream.update(states[0])
+    assert msg['seq'] == 1
+    apply_diff(client, msg)
+
+    msg = stream.update(states[1])
+    assert msg['seq'] == 2
+    assert msg['players']['changed'] == {1: {'dist': 11}, 2: {'dist': 5, 'name': 'b'}}
+    assert 'me' not in msg
+    apply_diff(client, msg)
+    assert client == states[1]
+
+    msg = stream.update(states[2])
+    assert msg['players']['removed'] == [1]
+    assert 'loot' not in msg and 'exits' not in msg
+    apply_diff(client, msg)
+    assert client == states[2]
+
+    assert stream.update(states[2]) is None
+    assert stream.snapshot() == {'type': 'STATE_SNAPSHOT', 'seq': 3, **states[2]}
@@ -3,14 +3,16 @@ import logging
 import tkinter as tk
 from pprint import pprint
 
-from eft_cap.msg_level import PLAYERS, Player, GLOBAL
+from eft_cap import changes
+from eft_cap.msg_level import PLAYERS, Player, GLOBAL, players_geometry
 
 
 class App(tk.Tk):
     log = logging.getLogger('TK.APP')
 
-    def __init__(self, loop):
+    def __init__(self, loop, rate=changes.DEFAULT_RATE):
         self.loop = loop
+        self.rate = rate
         self.__cells = []
         self.rows = []
         super().__init__()
@@ -68,14 +70,19 @@ class App(tk.Tk):
         return b
 
     async def update_loop(self):
+        sub = GLOBAL['changes'].subscribe(rate=self.rate)
         while True:
+            await sub.wait()
             players = []
             dead_players = []
 
+            geometry = players_geometry()
+
             player: Player
             for player in PLAYERS.values():
+                dist, angle, vdist = geometry.get(player.cid) or (player.dist(), player.angle(), player.vdist())
                 row = [
-                    player.dist(), f'{player.vdist()}', player.angle(), str(player),
+                    dist, f'{vdist}', angle, str(player),
                     str(player.rnd_pos), str(player.is_alive)
                 ]
                 if player.is_alive:
@@ -94,7 +101,6 @@ class App(tk.Tk):
                 [*players, *dead_players, *loot]
             )
             self.update()
-            await asyncio.sleep(1)
 
     def destroy(self):
         self.loop.stop()
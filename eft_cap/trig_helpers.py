@@ -40,6 +40,27 @@ def angle(pos1, pos2, rot):
     return -int(norm_angle(angl))
 
 
+def relative_geometry(positions, origin, yaw):
+    """
+    distance, bearing and vertical delta of (N, 3) `positions` as seen from `origin` looking at `yaw`,
+    same values as `dist`, `angle` and `pos[1] - origin[1]` but in one pass
+    """
+    positions = np.asarray(positions, np.float64).reshape(-1, 3)
+    delta = origin - positions
+    dists = np.sqrt(np.einsum('ij,ij->i', delta, delta))
+
+    # signed angle between delta and (0, 0, -1) in xz plane
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cosines = -delta[:, 2] / np.hypot(delta[:, 0], delta[:, 2])
+    angles = np.degrees(np.arccos(np.clip(cosines, -1.0, 1.0)))
+    angles = np.where(delta[:, 0] < 0, -angles, angles) + yaw
+    angles = np.where(angles > 180, angles - 360, angles)
+    angles = np.where(angles < -180, angles + 360, angles)
+    angles = np.where(np.isnan(angles), 0.0, -np.trunc(angles)).astype(np.int64)
+
+    return dists, angles, positions[:, 1] - origin[1]
+
+
 def fwd_vector(pitch, yaw, pos):
     elevation = math.radians(-pitch)
     heading = math.radians(yaw)
@@ -10,7 +10,10 @@ from starlette.routing import Route, Mount, WebSocketRoute
 from starlette.websockets import WebSocket
 from starlette.staticfiles import StaticFiles
 import uvicorn
-from eft_cap.msg_level import GLOBAL, PLAYERS, Player, Map
+from eft_cap import changes
+from eft_cap.msg_level import GLOBAL, OPS, PLAYERS, Player, Map, players_geometry
+from eft_cap.broadcast import BroadcastHub
+from eft_cap.ws_protocol import StateStream
 import logging
 from fan_tools.python import rel_path
 
@@ -18,7 +21,11 @@ from fan_tools.python import rel_path
 class App:
     log = logging.getLogger('webserver')
 
-    def __init__(self, loop: asyncio.BaseEventLoop):
+    # fields of other players shown in UI, their rotation is not
+    PLAYER_FIELDS = {'spawn', 'pos', 'is_alive', 'loot_price', 'updated_at'}
+
+    def __init__(self, loop: asyncio.BaseEventLoop, rate=changes.DEFAULT_RATE):
+        self.rate = rate
         self.static = pathlib.Path(rel_path('../frontend/build', check=False))
         self.loop = loop
         self.app = Starlette(routes=self.routes, on_shutdown=[self.exit])
@@ -26,31 +33,48 @@ class App:
         self.server = uvicorn.Server(config=self.config)
         self.serve_task = loop.create_task(self.server.serve())
         self.update_task = loop.create_task(self.update_loop())
-        self.ws_clients = []
+        self.hub = BroadcastHub()
+        self.stream = StateStream()
+        self.loot = None
 
     async def index(self, request):
         return FileResponse(self.static / 'index.html')
 
     async def status(self, request):
-        return JSONResponse({'status': 'ok'})
+        stats = GLOBAL.get('batch_stats')
+        fragments = GLOBAL.get('fragment_stats')
+        offload = GLOBAL['offload']
+        return JSONResponse(
+            {
+                'status': 'ok',
+                'batch': stats.as_dict() if stats else None,
+                'fragments': fragments.as_dict() if fragments else None,
+                'clients': self.hub.as_dict(),
+                'offload': offload.as_dict() if offload else None,
+                'ops': OPS.as_dict(),
+            }
+        )
 
     async def ws_endpoint(self, ws: WebSocket):
         await ws.accept()
         try:
-            self.ws_clients.append(ws)
+            self.hub.add(ws)
+            self.hub.send(ws, self.stream.snapshot())
             while True:
                 msg = await ws.receive_json()
                 try:
-                    await self.handle_msg(msg)
+                    await self.handle_msg(ws, msg)
                 except:
                     self.log.exception(f'During handle: {msg}')
         finally:
-            self.ws_clients.remove(ws)
+            self.hub.remove(ws)
 
-    async def handle_msg(self, msg):
+    async def handle_msg(self, ws, msg):
         if msg['type'] == 'LOOT_HIDE':
             payload = msg['payload']
             GLOBAL['loot'].hide(payload['id'])
+        elif msg['type'] == 'RESYNC':
+            self.hub.send(ws, self.stream.snapshot())
 
     @property
     def routes(self):
@@ -75,25 +99,14 @@ class App:
         self.loop.stop()
         exit(0)
 
-    async def draw_table(self, me, players, dead_players, loot):
-        for ws in self.ws_clients:
-            await ws.send_json(
-                {
-                    'type': 'DRAW_TABLE',
-                    'me': me,
-                    'players': players,
-                    'deadPlayers': dead_players,
-                    'loot': loot,
-                }
-            )
-
     async def update_loop(self):
+        sub = GLOBAL['changes'].subscribe(rate=self.rate)
         while True:
+            dirty = await sub.wait()
             try:
-                await self.send_update()
+                await self.send_update(dirty)
             except:
                 self.log.exception('While update')
-            await asyncio.sleep(1)
 
     def player_to_row(self, player, classes=[]):
         return {
@@ -108,15 +121,16 @@ class App:
             'className': ' '.join(classes),
         }
 
-    def player_to_json(self, player: Player):
+    def player_to_json(self, player: Player, geometry=None):
         if not player:
             return None
 
+        dist, angle, vdist = geometry or (player.dist(), player.angle(), player.vdist())
         return {
             'name': str(player),
-            'dist': player.dist(),
-            'angle': player.angle(),
-            'vdist': player.vdist(),
+            'dist': dist,
+            'angle': angle,
+            'vdist': vdist,
             'pos': player.rnd_pos,
             'group': player.group_id,
             'loot_price': player.loot_price,
@@ -127,34 +141,75 @@ class App:
             'wanted': getattr(player, 'wanted', False),
             'encrypted': player.encrypt,
             'updated_at': player.updated_at,
-            'sec_since_update': time.time() - player.updated_at,
+            # tens of seconds, so it doesn't change on every tick
+            'sec_since_update': round((time.time() - player.updated_at) / 10),
         }
 
-    async def send_update(self):
-        players = []
-        dead_players = []
-        player: Player
-        me = GLOBAL['me']
-        my_group = me.group_id if me else None
-        players = []
-
+    def collect_players(self, dirty):
+        """
+        rebuild players with changed fields, all of them when me has moved
+        or on idle push (empty `dirty`)
+        """
+        prev = self.stream.state['players']
+        rebuild_all = not dirty or changes.ME in dirty
+        if not rebuild_all and changes.PLAYERS not in dirty:
+            return prev
+
+        geometry = players_geometry()
+        players = {}
         player: Player
         for player in PLAYERS.values():
-
             if player.me:
                 continue
+            if rebuild_all or player.cid not in prev or player.dirty & self.PLAYER_FIELDS:
+                players[player.cid] = self.player_to_json(player, geometry.get(player.cid))
+            else:
+                players[player.cid] = prev[player.cid]
+            player.dirty.clear()
+        return players
+
+    def collect_loot(self, dirty):
+        """rebuild crates changed since previous push"""
+        loot = GLOBAL['loot']
+        if not dirty or changes.ME in dirty:
+            loot.update_location()
+        if loot is not self.loot:
+            # new session
+            self.loot = loot
+            loot.dirty.clear()
+            return {item['id']: loot.loot_to_json(item) for item in loot.by_id.values()}
+        prev = self.stream.state['loot']
+        if not loot.dirty:
+            return prev
+
+        out = dict(prev)
+        for _id in loot.dirty:
+            item = loot.by_id.get(_id)
+            if item is None:
+                out.pop(_id, None)
+            else:
+                out[_id] = loot.loot_to_json(item)
+        loot.dirty.clear()
+        return out
+
+    def collect_state(self, dirty):
+        me = GLOBAL['me']
+        if me and (not dirty or changes.ME in dirty):
+            me.dirty.clear()
+            me_json = self.player_to_json(me)
+        else:
+            me_json = self.stream.state['me'] if me else None
 
-            players.append(self.player_to_json(player))
-            continue
-
-        GLOBAL['loot'].update_location()
-        loot = GLOBAL['loot'].display_loot()
-        await self.draw_table(self.player_to_json(me), players, dead_players, loot)
-        await self.map_update()
-
-    async def map_update(self):
         map: Map = GLOBAL['map']
-        if not map:
-            return
-        for ws in self.ws_clients:
-            await ws.send_json({'type': 'DRAW_EXITS', 'exits': map.exits})
+        return {
+            'me': me_json,
+            'players': self.collect_players(dirty),
+            'loot': self.collect_loot(dirty),
+            # copy: exits are updated in place
+            'exits': dict(map.exits) if map else None,
+        }
+
+    async def send_update(self, dirty):
+        msg = self.stream.update(self.collect_state(dirty))
+        if msg:
+            self.hub.publish(msg, latest=self.stream.snapshot)
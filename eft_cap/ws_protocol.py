@@ -0,0 +1,74 @@
+"""
+Versioned state protocol of websocket clients.
+
+Client gets STATE_SNAPSHOT with full state on connect, then STATE_DIFF on every tick
+with added/changed entities (only changed fields) and removed ids.
+Messages carry `seq`, client which sees a gap sends RESYNC and gets new snapshot.
+
+State is {'me': entity or None, 'players': {id: entity}, 'loot': {id: entity}, 'exits': dict or None},
+entities are flat dicts with the same keys every tick, so client merges changed fields into them.
+"""
+COLLECTIONS = ('players', 'loot')
+
+_MISSING = object()
+
+
+def empty_state():
+    return {'me': None, 'players': {}, 'loot': {}, 'exits': None}
+
+
+def diff_entity(old, new):
+    """fields of `new` which differ from `old`"""
+    return {key: value for key, value in new.items() if old.get(key, _MISSING) != value}
+
+
+def diff_collection(old, new):
+    """returns (changed: {id: fields}, removed: [id])"""
+    changed = {}
+    for _id, entity in new.items():
+        prev = old.get(_id)
+        if prev is entity:
+            continue
+        if prev is None:
+            changed[_id] = entity
+        else:
+            fields = diff_entity(prev, entity)
+            if fields:
+                changed[_id] = fields
+    removed = [_id for _id in old if _id not in new]
+    return changed, removed
+
+
+class StateStream:
+    def __init__(self):
+        self.seq = 0
+        self.state = empty_state()
+
+    def snapshot(self):
+        return {'type': 'STATE_SNAPSHOT', 'seq': self.seq, **self.state}
+
+    def update(self, state):
+        """STATE_DIFF message from previous state to `state`, None when nothing has changed"""
+        diff = {}
+        old_me, me = self.state['me'], state['me']
+        if old_me is None or me is None:
+            if old_me is not me:
+                diff['me'] = me
+        else:
+            fields = diff_entity(old_me, me)
+            if fields:
+                diff['me'] = fields
+
+        for name in COLLECTIONS:
+            changed, removed = diff_collection(self.state[name], state[name])
+            if changed or removed:
+                diff[name] = {'changed': changed, 'removed': removed}
+
+        if state['exits'] != self.state['exits']:
+            diff['exits'] = state['exits']
+
+        self.state = state
+        if not diff:
+            return None
+        self.seq += 1
+        return {'type': 'STATE_DIFF', 'seq': self.seq, **diff}
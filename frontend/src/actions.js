@@ -3,5 +3,5 @@ import { createAction } from "redux-actions"
 export const wsConnected = createAction("WS_CONNECTED")
 export const wsDisconnected = createAction("WS_DISCONNECTED")
 export const wsMessage = createAction("WS_MESSAGE")
-export const drawTable = createAction("DRAW_TABLE")
-export const drawExits = createAction("DRAW_EXITS")
+export const stateSnapshot = createAction("STATE_SNAPSHOT")
+export const stateDiff = createAction("STATE_DIFF")
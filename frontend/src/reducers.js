@@ -17,123 +17,57 @@ const ws = handleActions(
   { connected: false }
 )
 
-function getPlayerClassName(me, player) {
-  if (!player) {
-    return ""
+function applyCollection(previous, diff) {
+  if (!diff) {
+    return previous
   }
-
-  const className = []
-  const { dist, is_npc, is_scav, is_alive, wanted, group } = player
-  if (is_npc) {
-    className.push("npc")
-  } else {
-    className.push("player")
-  }
-  if (is_scav) {
-    className.push("scav")
-  }
-  if (is_alive) {
-    className.push("alive")
-  } else {
-    className.push("dead")
-  }
-
-  if (player.me || (group && group === me.group)) {
-    className.push("my_group")
-  } else if (group) {
-    className.push("other_group")
-    className.push(group)
-  }
-
-  if (player.me || player.encrypted) {
-  } else if (dist < 50) {
-    className.push("brawl")
-  } else if (dist < 150) {
-    className.push("nearby")
-  }
-  if (is_scav && wanted) {
-    className.push("player_wanted")
-  }
-  return className.join(" ")
-}
-
-function getLootClassName(item) {
-  const className = ["loot"]
-  if (item.wanted) {
-    className.push("wanted")
-  }
-  if (item.dist < 50) {
-    className.push("nearby")
+  const next = { ...previous }
+  for (const id of diff.removed) {
+    delete next[id]
   }
-
-  return className.join(" ")
-}
-
-function showLoot(loot) {
-  let showLoot = loot.filter((x) => x.total_price > 18000)
-  showLoot.sort((a, b) => a.dist - b.dist)
-  const near = showLoot.slice(0, 3)
-  let far = showLoot.slice(3)
-  let expensive = far.filter((x) => x.total_price > 70000 || x.wanted)
-  let outLoot = [...near, ...expensive]
-  for (let item of outLoot) {
-    item.className = getLootClassName(item)
+  for (const [id, fields] of Object.entries(diff.changed)) {
+    next[id] = { ...next[id], ...fields }
   }
-  return outLoot
+  return next
 }
 
-const table = handleActions(
+// server state: full snapshot, then diffs which must come in `seq` order
+const entities = handleActions(
   {
-    [actions.drawTable]: (previous, action) => {
-      const { me = null, players = [], loot = [] } = action
-      me.sec_since_update = Math.round(me.sec_since_update / 10)
-      let alivePlayers = []
-      let deadPlayers = []
-      for (let player of players) {
-        player.sec_since_update = Math.round(player.sec_since_update / 10)
-        player.className = getPlayerClassName(me, player)
-        if (player.is_alive) {
-          alivePlayers.push(player)
-        } else if (player.loot_price > 30_000) {
-          deadPlayers.push(player)
-        }
+    [actions.stateSnapshot]: (previous, action) => {
+      const { seq, me, players, loot, exits } = action
+      return { seq, synced: true, me, players, loot, exits: exits || {} }
+    },
+    [actions.stateDiff]: (previous, action) => {
+      if (action.seq <= previous.seq) {
+        return previous
       }
-      let param = "dist"
-      if (me && me.encrypted) {
-        param = "sec_since_update"
+      if (!previous.synced || action.seq !== previous.seq + 1) {
+        // gap, wait for snapshot
+        return { ...previous, synced: false }
+      }
+      let me = previous.me
+      if ("me" in action) {
+        me = action.me && { ...previous.me, ...action.me }
       }
-      alivePlayers.sort((a, b) => a[param] - b[param])
-      deadPlayers.sort((a, b) => a[param] - b[param])
-
-      me.className = getPlayerClassName(me, me)
-
       return {
         ...previous,
+        seq: action.seq,
         me,
-        players: alivePlayers,
-        deadPlayers,
-        loot: showLoot(loot),
+        players: applyCollection(previous.players, action.players),
+        loot: applyCollection(previous.loot, action.loot),
+        exits: "exits" in action ? action.exits || {} : previous.exits,
       }
     },
   },
-  { me: null, players: [], deadPlayers: [], loot: [] }
-)
-
-const exits = handleActions(
-  {
-    [actions.drawExits]: (previous, action) => {
-      return action.exits
-    },
-  },
-  {}
+  { seq: 0, synced: false, me: null, players: {}, loot: {}, exits: {} }
 )
 
 const createRootReducer = (history) =>
   combineReducers({
     router: connectRouter(history),
     ws,
-    table,
-    exits,
+    entities,
   })
 
 export default createRootReducer
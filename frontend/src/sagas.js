@@ -100,13 +100,14 @@ async function reconnecting(emitter, state) {
       state.ws.onclose = () => {
         state.ws = null
         state.disconnected = true
+        state.resyncRequested = false
       }
     }
     await sleep(1000)
   }
 }
 
-const ws_state = { ws: null, disconnected: true, closing: false }
+const ws_state = { ws: null, disconnected: true, closing: false, resyncRequested: false }
 
 function createConnection(emitter) {
   const on_close = () => {
@@ -140,9 +141,27 @@ function* msgToServer(action) {
   }
 }
 
+// reducer drops diffs after a gap in `seq`, ask server for new snapshot once
+function* checkSync(action) {
+  const { synced } = yield select(selectors.entities)
+  if (!synced && ws_state.ws && !ws_state.resyncRequested) {
+    ws_state.resyncRequested = true
+    ws_state.ws.send(JSON.stringify({ type: "RESYNC" }))
+  }
+}
+
+function* snapshotReceived(action) {
+  ws_state.resyncRequested = false
+}
+
 function* root() {
   //  yield takeLatest(actions.loadStats, loadStats)
-  yield all([fork(websocketSagas), takeEvery("MSG_TO_SERVER", msgToServer)])
+  yield all([
+    fork(websocketSagas),
+    takeEvery("MSG_TO_SERVER", msgToServer),
+    takeEvery(actions.stateDiff, checkSync),
+    takeEvery(actions.stateSnapshot, snapshotReceived),
+  ])
 }
 
 export default root
@@ -1,5 +1,94 @@
 import { createSelector } from "reselect"
 
 export const ws = (state) => state.ws
-export const table = (state) => state.table
-export const exits = (state) => state.exits
+export const entities = (state) => state.entities
+export const exits = (state) => state.entities.exits
+
+function getPlayerClassName(me, player) {
+  if (!player) {
+    return ""
+  }
+
+  const className = []
+  const { dist, is_npc, is_scav, is_alive, wanted, group } = player
+  if (is_npc) {
+    className.push("npc")
+  } else {
+    className.push("player")
+  }
+  if (is_scav) {
+    className.push("scav")
+  }
+  if (is_alive) {
+    className.push("alive")
+  } else {
+    className.push("dead")
+  }
+
+  if (player.me || (group && group === me.group)) {
+    className.push("my_group")
+  } else if (group) {
+    className.push("other_group")
+    className.push(group)
+  }
+
+  if (player.me || player.encrypted) {
+  } else if (dist < 50) {
+    className.push("brawl")
+  } else if (dist < 150) {
+    className.push("nearby")
+  }
+  if (is_scav && wanted) {
+    className.push("player_wanted")
+  }
+  return className.join(" ")
+}
+
+function getLootClassName(item) {
+  const className = ["loot"]
+  if (item.wanted) {
+    className.push("wanted")
+  }
+  if (item.dist < 50) {
+    className.push("nearby")
+  }
+
+  return className.join(" ")
+}
+
+function showLoot(loot) {
+  let showLoot = loot.filter((x) => x.total_price > 18000)
+  showLoot.sort((a, b) => a.dist - b.dist)
+  const near = showLoot.slice(0, 3)
+  let far = showLoot.slice(3)
+  let expensive = far.filter((x) => x.total_price > 70000 || x.wanted)
+  let outLoot = [...near, ...expensive]
+  return outLoot.map((item) => ({ ...item, className: getLootClassName(item) }))
+}
+
+// entities are shared with store, rows are copies with className
+export const table = createSelector(entities, ({ me, players, loot }) => {
+  let alivePlayers = []
+  let deadPlayers = []
+  for (let player of Object.values(players)) {
+    player = { ...player, className: getPlayerClassName(me || {}, player) }
+    if (player.is_alive) {
+      alivePlayers.push(player)
+    } else if (player.loot_price > 30_000) {
+      deadPlayers.push(player)
+    }
+  }
+  let param = "dist"
+  if (me && me.encrypted) {
+    param = "sec_since_update"
+  }
+  alivePlayers.sort((a, b) => a[param] - b[param])
+  deadPlayers.sort((a, b) => a[param] - b[param])
+
+  return {
+    me: me && { ...me, className: getPlayerClassName(me, me) },
+    players: alivePlayers,
+    deadPlayers,
+    loot: showLoot(Object.values(loot)),
+  }
+})
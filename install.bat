@@ -7,3 +7,4 @@ npm run build
 
 cd ..
 git clone https://github.com/TrustedSourceLeaks/LeakedServer.git
+.\venv\Scripts\python.exe -m eft_cap.item_db
@@ -8,3 +8,4 @@ cd ..
 cd LeakedServer
 git pull -r
 cd ..
+.\venv\Scripts\python.exe -m eft_cap.item_db